@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 
-from store.models import Measurement
+from store.models import Measurement, AnalysisJob
 
 
 class AnalysisManager(ABC):
@@ -9,11 +9,18 @@ class AnalysisManager(ABC):
     to do cases like doing no analysis, or making up fake data."""
 
     @abstractmethod
-    def make_measurement(self) -> Measurement:
+    def make_measurement(self, job: AnalysisJob = None) -> Measurement:
         """Create and return a Measurement object in the database for the current state
-        of the target repo (or not, if we don't know how for the repo)"""
+        of the target repo (or not, if we don't know how for the repo).
+        Given a job, record the stages of the analysis against it."""
 
     @abstractmethod
-    def make_history(self) -> list:
+    def make_history(self, job: AnalysisJob = None) -> list:
         """Create and return a list of Measurement objects in the database for
-        recent history of the target repo (or not, if we don't know how for the repo)"""
\ No newline at end of file
+        recent history of the target repo (or not, if we don't know how for the repo).
+        Given a job, record progress against it so that it can be resumed."""
+
+    def make_backfill(self, job: AnalysisJob) -> list:
+        """Create and return Measurement objects in the database for the revisions the backfill
+        job picks, saving each as soon as it is ready. Only possible with version control."""
+        raise RuntimeError("Backfill needs a repository under version control")
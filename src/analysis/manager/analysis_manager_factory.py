@@ -9,15 +9,16 @@ from vcs.hg_helper import HgHelper
 from vcs.repo_type import RepoType
 
 
-def get_analysis_manager(repo: Repository) -> AnalysisManager:
-    """Return the appropriate type of analysis manager for the given repo"""
+def get_analysis_manager(repo: Repository, job_id=None) -> AnalysisManager:
+    """Return the appropriate type of analysis manager for the given repo.
+    job_id keys the scratch workspace; a fresh one is made up if not given."""
 
     if repo.type is RepoType.FILE:
-        return UndFileAnalysisManager(repo)
+        return UndFileAnalysisManager(repo, job_id)
     elif repo.type is RepoType.GIT:
-        return UndVcsAnalysisManager(repo, GitHelper())
+        return UndVcsAnalysisManager(repo, GitHelper(), job_id)
     elif repo.type is RepoType.HG:
-        return UndVcsAnalysisManager(repo, HgHelper())
+        return UndVcsAnalysisManager(repo, HgHelper(), job_id)
     elif repo.type is RepoType.BLANK:
         # Someone makes a repo, but doesnt give a repo address, do nothing.
         # For now we have this in mind with Jenkins.
@@ -6,8 +6,8 @@ class DoNothingAnalysisManager(AnalysisManager):
     """Silently does nothing when asked. Currently used for Repositories
     where no repo address has been given (expected via Jenkins) -djc 2018-10-18"""
 
-    def make_measurement(self) -> Measurement:
+    def make_measurement(self, job=None) -> Measurement:
         return None
 
-    def make_history(self) -> list:
+    def make_history(self, job=None) -> list:
         return []
@@ -17,10 +17,10 @@ class FakeAnalysisManager(AnalysisManager):
         self.repo = repo
         self.num_weeks = num_weeks
 
-    def make_measurement(self) -> Measurement:
+    def make_measurement(self, job=None) -> Measurement:
         return self._make_fake_measurement(get_current_time())
 
-    def make_history(self) -> list:
+    def make_history(self, job=None) -> list:
         """Make fake measurements for the number of weeks we've been told to make!"""
         history = []
         current_time = get_current_time()
@@ -11,8 +11,8 @@ class RaiseErrorAnalysisManager(AnalysisManager):
     def __init__(self, error_msg: str):
         self.error_msg = error_msg
 
-    def make_measurement(self) -> Measurement:
+    def make_measurement(self, job=None) -> Measurement:
         raise RuntimeError(self.error_msg)
 
-    def make_history(self) -> list:
+    def make_history(self, job=None) -> list:
         raise RuntimeError(self.error_msg)
@@ -2,47 +2,98 @@ import os
 import shutil
 from abc import abstractmethod
 
+from django.utils import timezone
+
 from analysis.manager.analysis_manager import AnalysisManager
-from analysis.understand_analysis import get_metrics_for_project_and_translate_fields, analyze_repo, REPO_CODE_BASE_DIR, \
-    REPO_REPORTS_BASE_DIR, REPO_UNDERSTAND_BASE_DIR, remove_directories_for_project, on_rm_error, \
-    get_directories_for_project
-from store.models import Repository, Measurement
-from cbri.reporting import logger
+from analysis.source_filter import SourceFilter, SourceScan
+from analysis.understand_analysis import get_metrics_for_project_and_translate_fields, run_understand, on_rm_error
+from analysis.workspace import Workspace
+from store.models import Repository, Measurement, AnalysisJob, JobStage
+from cbri.reporting import logger, log_to_repo
 from vcs.repo_type import get_auth_address
 
 
 class UndAnalysisManager(AnalysisManager):
     """Abstract class for doing analysis with Understand"""
 
-    def __init__(self, repo: Repository):
+    def __init__(self, repo: Repository, job_id=None):
         self.repo = repo
+        self.source_filter = SourceFilter.for_repository(repo)
+        self.workspace = Workspace(repo.id, job_id)
+        # The job being worked on, if any
+        self.job = None
 
-    def make_measurement(self) -> Measurement:
+    def make_measurement(self, job: AnalysisJob = None) -> Measurement:
+        self.job = job
         try:
             # Prep the repo, analyze it, gather metrics, and then delete the intermediate files
+            self.enter_stage(JobStage.STAGING)
             revision_id = self.prep_for_analysis()
-            code_dir, data_dir, und_dir = analyze_repo(self.repo,
-                                                       REPO_CODE_BASE_DIR,
-                                                       REPO_REPORTS_BASE_DIR,
-                                                       REPO_UNDERSTAND_BASE_DIR)
-            metrics = get_metrics_for_project_and_translate_fields(self.repo.name, data_dir, revision_id=revision_id)
+            source_hash = self.get_source_hash(revision_id)
+            metrics = self.find_reusable_metrics(source_hash, revision_id)
+            if not metrics:
+                self.enter_stage(JobStage.ANALYZING)
+                scan = run_understand(self.repo.name, self.repo.language, self.workspace.code_dir,
+                                      self.workspace.data_dir, self.workspace.und_dir, self.source_filter)
+                self.log_exclusions(scan)
+                self.enter_stage(JobStage.PARSING)
+                metrics = get_metrics_for_project_and_translate_fields(self.repo.name, self.workspace.data_dir,
+                                                                       revision_id=revision_id)
+                metrics['source_hash'] = source_hash
             # logger.info(str(metrics))
         finally:
-            remove_directories_for_project(self.repo.name, REPO_CODE_BASE_DIR, REPO_REPORTS_BASE_DIR,
-                                           REPO_UNDERSTAND_BASE_DIR)
+            self.workspace.remove()
 
+        self.enter_stage(JobStage.SCORING)
         return Measurement.create_from_dict(self.repo, metrics)
 
+    def enter_stage(self, stage: JobStage):
+        """Let anyone watching the job know what it's doing"""
+        if self.job:
+            self.job.enter_stage(stage)
+
     @abstractmethod
-    def make_history(self) -> list:
+    def make_history(self, job=None) -> list:
         """Still for subclassses to figure out"""
 
+    def log_exclusions(self, scan: SourceScan):
+        """Record in the repo log how much of the source was left out of analysis"""
+        if scan and scan.excluded_files:
+            log_to_repo(self.repo, "Left %d files (%d bytes) out of analysis that are not %s source "
+                                   "or are excluded by the repository's globs"
+                        % (scan.excluded_files, scan.excluded_bytes, self.repo.language), job=self.job)
+
+    def get_source_hash(self, rev: str) -> str:
+        """Return a hash of the analyzable source at the given rev of the staged code,
+        or an empty string if we can't tell (in which case nothing is reused)"""
+        return ""
+
+    def find_reusable_metrics(self, source_hash: str, revision_id: str, date=None) -> dict:
+        """If this repo already has a measurement of identical analyzable source, return
+        its metrics stamped with the given date and revision so Understand doesn't have to
+        run again. Otherwise return None."""
+        if not source_hash:
+            return None
+
+        existing = Measurement.objects.filter(repository=self.repo, source_hash=source_hash) \
+            .exclude(architecture_type='UNDEFINED').order_by('-date').first()
+        if not existing:
+            return None
+
+        logger.info("\tSource unchanged since revision " + str(existing.revision_id) + ", reusing its metrics")
+        metrics = existing.copy_metrics()
+        if not date:
+            date = timezone.now().replace(microsecond=0)
+        metrics['date'] = date
+        metrics['revision_id'] = revision_id
+        return metrics
+
     def prep_for_analysis(self) -> str:
         """Situate files for analysis! Return the revision_id if applicable"""
 
-        code_dir, data_dir, und_dir = get_directories_for_project(self.repo.name, REPO_CODE_BASE_DIR,
-                                                                  REPO_REPORTS_BASE_DIR,
-                                                                  REPO_UNDERSTAND_BASE_DIR)
+        self.workspace.create()
+        self.workspace.check_disk_quota()
+        code_dir = self.workspace.code_dir
 
         # Delete that directory if it exists
         if os.path.isdir(code_dir):
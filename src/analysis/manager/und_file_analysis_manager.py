@@ -1,24 +1,43 @@
-import shutil
+import os
 
 from analysis.manager.und_analysis_manager import UndAnalysisManager
+from analysis.staging import stage_matching_files
 from store.models import Repository
 from cbri.reporting import logger
+from cbri.settings import CBRI_FILE_STAGING
+
+# Ways to stage a file:// repository, see CBRI_FILE_STAGING
+IN_PLACE_STAGING = "in_place"
+LINK_STAGING = "link"
 
 
 class UndFileAnalysisManager(UndAnalysisManager):
     """Handler for  case to analyze  code that isn't in a vcs.
     I.e. no history info, just the source files."""
 
-    def __init__(self, repo: Repository):
-        super().__init__(repo)
+    def __init__(self, repo: Repository, job_id=None, staging: str = CBRI_FILE_STAGING):
+        super().__init__(repo, job_id)
+        self.staging = staging
 
     def stage_code(self, repo_address: str, code_dir: str, token: str) -> str:
         repo_address = repo_address.replace('file://', '')
-        logger.info("Copying from " + str(repo_address) + " to " + str (code_dir))
-        shutil.copytree(repo_address, code_dir)
+        if not os.path.isdir(repo_address):
+            raise RuntimeError("Could not access source directory: " + repo_address)
+
+        if self.staging == IN_PLACE_STAGING:
+            # No copy at all, Understand just reads the files where they are
+            logger.info("Analyzing " + str(repo_address) + " in place")
+            self.workspace.use_external_code_dir(repo_address)
+        elif self.staging == LINK_STAGING:
+            # Understand gets a private directory, but only of the files it will read,
+            # and sharing storage with the originals where the file system allows
+            logger.info("Linking from " + str(repo_address) + " to " + str(code_dir))
+            self.log_exclusions(stage_matching_files(repo_address, code_dir, self.source_filter))
+        else:
+            raise RuntimeError("Unknown staging mode for file repositories: " + str(self.staging))
         return "No VCS"
 
-    def make_history(self) -> list:
+    def make_history(self, job=None) -> list:
         """For a file repo, the history is just what we see right now.
         I.e. same as taking current measurement"""
-        return [self.make_measurement()]
+        return [self.make_measurement(job)]
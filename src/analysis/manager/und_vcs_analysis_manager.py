@@ -1,86 +1,378 @@
 import collections
 import datetime
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from django.utils import timezone
 
 from analysis.manager.und_analysis_manager import UndAnalysisManager
-from analysis.understand_analysis import get_metrics_for_project_and_translate_fields, REPO_CODE_BASE_DIR, \
-    REPO_REPORTS_BASE_DIR, REPO_UNDERSTAND_BASE_DIR, get_directories_for_project, run_understand, \
-    remove_directories_for_project
-from store.models import Repository, Measurement
+from analysis.understand_analysis import get_metrics_for_project_and_translate_fields, run_understand
+from analysis.workspace import get_mirror_dir
+from store.models import Repository, Measurement, AnalysisJob, JobRevision, JobStage, JobStatus, JobType, \
+    RevisionResult, SamplingPolicy
 from vcs.vcs_helper import VcsHelper
-from cbri.reporting import logger
+from cbri.reporting import logger, log_to_repo
+from cbri.settings import CBRI_HISTORY_MODE, CBRI_HISTORY_BISECT_BUDGET, CBRI_HISTORY_CHANGE_THRESHOLD, \
+    CBRI_BACKFILL_WORKERS
+
+# History modes: a fixed set of samples, or those refined by bisecting where the metrics changed
+FIXED_HISTORY = "fixed"
+BISECT_HISTORY = "bisect"
+
+# Metrics compared when looking for a change between two samples
+CHANGE_POINT_METRICS = ['useful_lines_of_code', 'propagation_cost', 'core_size', 'percent_files_overly_complex',
+                        'useful_comment_density', 'percent_duplicate_uloc']
+
+# One analyzed revision in a history
+HistorySample = collections.namedtuple('HistorySample', ['rev', 'date', 'metrics'])
+
+
+def metrics_differ(old: dict, new: dict, threshold_percent: float) -> bool:
+    """Did any of the change point metrics move by more than threshold_percent (relative)?"""
+    for key in CHANGE_POINT_METRICS:
+        try:
+            old_value = float(old[key])
+            new_value = float(new[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+        scale = max(abs(old_value), abs(new_value))
+        if scale and abs(new_value - old_value) * 100 / scale > threshold_percent:
+            return True
+    return False
 
 
 class UndVcsAnalysisManager(UndAnalysisManager):
     """Handles Understand analysis using a VCS helper."""
 
-    def __init__(self, repo: Repository, vcs: VcsHelper):
-        super().__init__(repo)
+    def __init__(self, repo: Repository, vcs: VcsHelper, job_id=None, history_mode=CBRI_HISTORY_MODE):
+        super().__init__(repo, job_id)
         self.vcs = vcs
+        self.history_mode = history_mode
 
     def stage_code(self, repo_address: str, code_dir: str, token: str):
+        sub_paths = self.source_filter.sub_paths
+        if sub_paths:
+            # Kept and keyed by the address without the token, which may change
+            return self.vcs.clone_sparse(self.repo.address, code_dir, token, sub_paths, get_mirror_dir(self.repo.address))
         return self.vcs.clone(repo_address, code_dir, token)
 
-    def make_history(self) -> list:
-        history = []
+    def get_source_hash(self, rev: str) -> str:
+        return self.vcs.get_source_hash(self.workspace.code_dir, rev, self.source_filter)
+
+    def make_history(self, job: AnalysisJob = None) -> list:
+        if not job:
+            job = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY, status=JobStatus.RUNNING)
+        self.job = job
 
-        # try to clone - if clone fails, we don't really care about directory cleanup
+        # try to clone - if clone fails, only the workspace needs cleaning up
         try:
+            self.enter_stage(JobStage.STAGING)
             self.prep_for_analysis()
         except Exception as e:
             logger.error("Failed to prep for history.")
             logger.exception(e)
+            self.workspace.remove()
             raise
 
         try:
-            metrics_list = self.get_historical_metrics(self.repo.name, self.repo.language,
-                                                       REPO_CODE_BASE_DIR,
-                                                       REPO_REPORTS_BASE_DIR,
-                                                       REPO_UNDERSTAND_BASE_DIR)
-
-            # XXX: Watch for case that one fails and cancel all or something?
-            # -djc 2018-11-06
-            for metrics in metrics_list:
-                measurement = Measurement.create_from_dict(self.repo, metrics)
-                history.append(measurement)
+            self.plan_history(job)
+            history = self.run_history(job, self.repo.name, self.repo.language)
+            # Stopped early because another runner has the job now, not because it was paused
+            job.check_lease()
+            return history
         finally:
-            remove_directories_for_project(self.repo.name, REPO_CODE_BASE_DIR, REPO_REPORTS_BASE_DIR,
-                                           REPO_UNDERSTAND_BASE_DIR)
+            self.workspace.remove()
+
+    def plan_history(self, job: AnalysisJob):
+        """ Record the revisions the history samples, unless an earlier run of the job did """
+        if job.revisions.exists():
+            return
+
+        # Get an in-order list of commits with their corresponding dates
+        commit_to_date = self.get_rev_to_date(self.workspace.code_dir)
+        JobRevision.objects.bulk_create(JobRevision(job=job, revision_id=rev, date=date)
+                                        for rev, date in commit_to_date.items())
+        job.add_revisions(len(commit_to_date))
+
+    def run_history(self, job: AnalysisJob, project_name, lang) -> list:
+        """ Generate a history for the project from samples eight weeks apart, refined by
+        bisection where the metrics changed if that mode is on. Each revision's measurement
+        is saved as soon as it is ready, and doubles as the job's checkpoint: a revision that
+        fails is marked and skipped, and running the job again only analyzes the revisions
+        without a measurement. Returns the new measurements, oldest first. """
+
+        # Source hash to metrics for revisions already analyzed in this run
+        analyzed = {}
+        samples = []
+        history = []
+        for job_rev in job.revisions.order_by('date'):
+            if job_rev.result is RevisionResult.DONE:
+                if job_rev.measurement:
+                    samples.append(HistorySample(job_rev.revision_id, job_rev.date, job_rev.measurement.copy_metrics()))
+                continue
+            if job.should_stop():
+                return history
+
+            logger.info("Analyzing " + job_rev.date.strftime("%Y-%m-%d"))
+            measurement = self.analyze_job_revision(job, job_rev, project_name, lang, analyzed)
+            if measurement:
+                samples.append(HistorySample(job_rev.revision_id, job_rev.date, measurement.copy_metrics()))
+                history.append(measurement)
+
+        if self.history_mode == BISECT_HISTORY:
+            history += self.bisect_history(project_name, lang, samples, analyzed, job)
+            history.sort(key=lambda measurement: measurement.date)
+        elif self.history_mode != FIXED_HISTORY:
+            raise RuntimeError("Unknown history mode: " + str(self.history_mode))
 
         return history
 
-    def get_historical_metrics(self, project_name, lang, code_base_dir, data_base_dir, und_base_dir):
-        """ Generate a biweekly history for the project for the past ten weeks.
-         Returns a list of dictionaries of the metrics from oldest to newest."""
+    def analyze_job_revision(self, job: AnalysisJob, job_rev: JobRevision, project_name, lang,
+                             analyzed: dict) -> Measurement:
+        """ Measure one revision of a history and checkpoint the outcome.
+        Returns the measurement, or None if the revision failed. """
+        try:
+            metrics = self.get_metrics_for_commit(project_name, lang, job_rev.revision_id, job_rev.date, analyzed)
+        except Exception as e:
+            # Leave a gap rather than lose the whole history
+            self.record_failure(job, job_rev, e)
+            return None
 
-        code_dir, data_dir, und_dir = get_directories_for_project(project_name, code_base_dir, data_base_dir, und_base_dir)
+        # The oldest revision that could be measured is the baseline, even when it's measured
+        # after newer ones, e.g. on a retry after it failed
+        measured = job.revisions.filter(result=RevisionResult.DONE, measurement__isnull=False).exclude(id=job_rev.id)
+        if measured.filter(date__lte=job_rev.date).exists():
+            return self.record_revision(job, job_rev, metrics)
 
-        # Get an in-order list of commits with their corresponding dates
-        commit_to_date = self.get_rev_to_date(code_dir)
-
-        # Compile a list of metrics. The first one is the baseline
-        is_first = True
-        metric_list = []
-        for commit, date in commit_to_date.items():
-            logger.info("Analyzing " + date.strftime("%Y-%m-%d"))
-            metrics = self.get_metrics_for_rev(project_name, lang, commit, date, code_dir, data_dir, und_dir)
-            if metrics:
-                if is_first:
-                    is_first = False
-                    metrics['is_baseline'] = True
-                metric_list.append(metrics)
-
-
-        return metric_list
-
-    def get_metrics_for_rev(self, project_name, lang, rev, rev_date, code_dir, data_dir, und_dir) -> dict:
-        """ Check out to the given rev, perform the analysis, and return results """
-        self.vcs.set_code_to_rev(code_dir, rev)
-
-        logger.info("Get metrics for revision: " + rev)
-        run_understand(project_name, lang, code_dir, data_dir, und_dir)
-        return get_metrics_for_project_and_translate_fields(project_name, data_dir, date=rev_date, revision_id=rev)
+        metrics['is_baseline'] = True
+        measurement = self.record_revision(job, job_rev, metrics)
+        Measurement.objects.filter(id__in=measured.values('measurement'), is_baseline=True).update(is_baseline=False)
+        Repository.bump_version(Repository.objects.filter(id=self.repo.id))
+        return measurement
+
+    def get_metrics_for_commit(self, project_name, lang, commit, date, analyzed: dict) -> dict:
+        """ Metrics for one commit, reused from a revision with the same analyzable source
+        (from this run, via analyzed, or already stored) when there is one """
+        source_hash = self.vcs.get_source_hash(self.workspace.code_dir, commit, self.source_filter)
+        if source_hash in analyzed:
+            logger.info("\tSource unchanged at revision " + commit + ", reusing metrics")
+            metrics = dict(analyzed[source_hash], date=date, revision_id=commit)
+            metrics.pop('is_baseline', None)
+            metrics['Components'] = [dict(c) for c in metrics.get('Components', [])]
+            return metrics
+
+        metrics = self.find_reusable_metrics(source_hash, commit, date)
+        if not metrics:
+            metrics = self.get_metrics_for_rev(project_name, lang, commit, date)
+            metrics['source_hash'] = source_hash
+        analyzed[source_hash] = metrics
+        return metrics
+
+    def bisect_history(self, project_name, lang, samples: list, analyzed: dict, job: AnalysisJob) -> list:
+        """ Between adjacent samples whose metrics differ by more than the change threshold,
+        analyze the commit halfway between them, and keep going on the halves until the
+        change is pinned to a single commit or the budget is spent. Coarse intervals
+        are split before fine ones, so a small budget still covers the whole history.
+        The revisions analyzed are added to the job, and what's spent of the budget is kept
+        with it, so running the job again picks up with what's left. Returns their measurements. """
+        code_dir = self.workspace.code_dir
+        budget = CBRI_HISTORY_BISECT_BUDGET - job.bisected_revisions
+        samples = list(samples)
+        measurements = []
+        intervals = collections.deque(zip(samples, samples[1:]))
+        while intervals and budget > 0 and not job.should_stop():
+            older, newer = intervals.popleft()
+            if not metrics_differ(older.metrics, newer.metrics, CBRI_HISTORY_CHANGE_THRESHOLD):
+                continue
+
+            revs = self.vcs.get_revs_between(code_dir, older.rev, newer.rev)
+            if not revs:
+                logger.info("\tMetrics changed at revision " + newer.rev)
+                continue
+
+            rev = revs[len(revs) // 2]
+            # Keep the dates in order even if commit dates aren't, e.g. after a rebase
+            date = min(max(self.vcs.get_rev_date(code_dir, rev), older.date), newer.date)
+            logger.info("Bisecting: analyzing " + rev + " from " + date.strftime("%Y-%m-%d"))
+            budget -= 1
+            job.add_bisected_revision()
+
+            # Retry a revision an earlier run of the job couldn't analyze
+            job_rev = job.revisions.filter(revision_id=rev).first()
+            if not job_rev:
+                job_rev = JobRevision.objects.create(job=job, revision_id=rev, date=date)
+                job.add_revisions(1)
+
+            measurement = self.analyze_job_revision(job, job_rev, project_name, lang, analyzed)
+            if not measurement:
+                continue
+
+            measurements.append(measurement)
+            middle = HistorySample(rev, date, measurement.copy_metrics())
+            samples.insert(samples.index(older) + 1, middle)
+            intervals.append((older, middle))
+            intervals.append((middle, newer))
+
+        return measurements
+
+    def get_metrics_for_rev(self, project_name, lang, rev, rev_date) -> dict:
+        """ Export the given rev to its own directory, perform the analysis, and return results """
+        metrics, scan = self.analyze_rev(project_name, lang, rev, rev_date, on_stage=self.enter_stage)
+        self.log_exclusions(scan)
+        return metrics
+
+    def analyze_rev(self, project_name, lang, rev, rev_date, on_stage=None):
+        """ Export the given rev to its own directory and analyze it there. Returns the metrics,
+        and the scan of what the export left out. Doesn't touch the database (unless on_stage,
+        called with each stage the analysis enters, does), so several revs can be analyzed at
+        once from different threads. """
+        rev_code_dir, rev_data_dir = self.workspace.make_rev_dirs(rev)
+        try:
+            # The export already leaves out everything the filter would
+            scan = self.vcs.export_rev(self.workspace.code_dir, rev, rev_code_dir, self.source_filter)
+
+            logger.info("Get metrics for revision: " + rev)
+            if on_stage:
+                on_stage(JobStage.ANALYZING)
+            run_understand(project_name, lang, rev_code_dir, rev_data_dir, rev_code_dir)
+            if on_stage:
+                on_stage(JobStage.PARSING)
+            metrics = get_metrics_for_project_and_translate_fields(project_name, rev_data_dir, date=rev_date,
+                                                                   revision_id=rev)
+            return metrics, scan
+        finally:
+            self.workspace.remove_rev_dirs(rev)
+
+    def make_backfill(self, job: AnalysisJob) -> list:
+        self.job = job
+        try:
+            self.enter_stage(JobStage.STAGING)
+            self.prep_for_analysis()
+        except Exception as e:
+            logger.error("Failed to prep for backfill.")
+            logger.exception(e)
+            self.workspace.remove()
+            raise
+
+        try:
+            self.plan_backfill(job)
+            measurements = self.run_backfill(job, self.repo.name, self.repo.language)
+            job.check_lease()
+            return measurements
+        finally:
+            self.workspace.remove()
+
+    def plan_backfill(self, job: AnalysisJob):
+        """ Record the revisions the job has to analyze, unless that was done by an earlier
+        run of the job that was paused """
+        if job.revisions.exists():
+            return
+
+        already_measured = set(Measurement.objects.filter(repository=self.repo).values_list('revision_id', flat=True))
+        revisions = []
+        for rev, date in self.get_backfill_revs(job):
+            result = RevisionResult.SKIPPED if rev in already_measured else RevisionResult.PENDING
+            revisions.append(JobRevision(job=job, revision_id=rev, date=date, result=result))
+        JobRevision.objects.bulk_create(revisions)
+
+        job.add_revisions(len(revisions), finished=len([r for r in revisions if r.result is RevisionResult.SKIPPED]))
+        log_to_repo(self.repo, "Backfill will analyze %d revisions" % len(revisions), job=job)
+
+    def get_backfill_revs(self, job: AnalysisJob) -> list:
+        """ (rev, date) for each revision the job's sampling policy picks, oldest first """
+        code_dir = self.workspace.code_dir
+        if job.sampling is SamplingPolicy.TAGS:
+            picked = collections.OrderedDict()
+            for tag, rev, date in sorted(self.vcs.get_tags(code_dir), key=lambda t: t[2]):
+                in_range = (not job.start_date or date >= job.start_date) and (not job.end_date or date <= job.end_date)
+                if in_range and (not job.tag_pattern or fnmatch.fnmatchcase(tag, job.tag_pattern)):
+                    picked[rev] = date
+            return list(picked.items())
+
+        revs = self.vcs.get_revs_in_range(code_dir, job.start_date, job.end_date)
+        if job.sampling is SamplingPolicy.EVERY_NTH:
+            # Counting back from the newest, so the current state is always included
+            return revs[::-1][::max(job.every_nth, 1)][::-1]
+        elif job.sampling is SamplingPolicy.INTERVAL:
+            if not revs:
+                return []
+            # The latest revision in each interval
+            start = job.start_date or revs[0][1]
+            interval = datetime.timedelta(days=max(job.interval_days, 1))
+            latest_in_interval = collections.OrderedDict()
+            for rev, date in revs:
+                latest_in_interval[(date - start) // interval] = (rev, date)
+            return list(latest_in_interval.values())
+        else:
+            raise RuntimeError("Unknown sampling policy: " + str(job.sampling))
+
+    def run_backfill(self, job: AnalysisJob, project_name, lang) -> list:
+        """ Analyze the job's pending revisions, CBRI_BACKFILL_WORKERS at a time, saving each
+        measurement as soon as it is ready. Stops starting new revisions once the job is
+        paused. Only this thread touches the database. Returns the new measurements. """
+        code_dir = self.workspace.code_dir
+        # Including any that failed in an earlier run
+        pending = collections.deque(job.revisions.filter(result__in=[RevisionResult.PENDING, RevisionResult.FAILED])
+                                    .order_by('date'))
+        measurements = []
+        # Source hash being analyzed to the revisions waiting on its result
+        waiting = {}
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=CBRI_BACKFILL_WORKERS) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < CBRI_BACKFILL_WORKERS and not job.should_stop():
+                    job_rev = pending.popleft()
+                    source_hash = self.vcs.get_source_hash(code_dir, job_rev.revision_id, self.source_filter)
+                    if source_hash in waiting:
+                        waiting[source_hash].append(job_rev)
+                        continue
+                    metrics = self.find_reusable_metrics(source_hash, job_rev.revision_id, job_rev.date)
+                    if metrics:
+                        measurements.append(self.record_revision(job, job_rev, metrics))
+                        continue
+                    waiting[source_hash] = []
+                    # The threads leave the database alone, so this is as detailed as it gets
+                    job.enter_stage(JobStage.ANALYZING)
+                    future = executor.submit(self.analyze_rev, project_name, lang, job_rev.revision_id, job_rev.date)
+                    in_flight[future] = (job_rev, source_hash)
+
+                if not in_flight:
+                    break  # Paused, or everything left was reused
+
+                done, not_done = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_rev, source_hash = in_flight.pop(future)
+                    try:
+                        metrics, scan = future.result()
+                    except Exception as e:
+                        # One bad revision shouldn't sink the rest of the backfill
+                        for failed_rev in [job_rev] + waiting.pop(source_hash):
+                            self.record_failure(job, failed_rev, e)
+                        continue
+
+                    self.log_exclusions(scan)
+                    metrics['source_hash'] = source_hash
+                    measurement = self.record_revision(job, job_rev, metrics)
+                    measurements.append(measurement)
+                    for same_rev in waiting.pop(source_hash):
+                        reused = dict(measurement.copy_metrics(), date=same_rev.date, revision_id=same_rev.revision_id)
+                        measurements.append(self.record_revision(job, same_rev, reused))
+
+        return measurements
+
+    def record_revision(self, job: AnalysisJob, job_rev: JobRevision, metrics: dict) -> Measurement:
+        # Saved and scored right away, so the history fills in while the rest is analyzed
+        job.check_lease()
+        job.enter_stage(JobStage.SCORING)
+        measurement = Measurement.create_from_dict(self.repo, metrics)
+        job.finish_revision(job_rev, RevisionResult.DONE, measurement)
+        return measurement
+
+    def record_failure(self, job: AnalysisJob, job_rev: JobRevision, error: Exception):
+        job.check_lease()
+        log_to_repo(self.repo, "Could not analyze revision " + job_rev.revision_id + ": " + str(error), job=job)
+        job.finish_revision(job_rev, RevisionResult.FAILED, error=str(error))
 
     def get_rev_to_date(self, code_dir) -> collections.OrderedDict:
         """ Get an ordered dict from commit rev number to date, every two weeks for the past ten weeks, oldest first """
@@ -0,0 +1,123 @@
+import os
+import re
+from collections import namedtuple
+
+"""
+Knows which files in a source tree Understand will actually read for a given
+language, so that work on everything else (hashing, staging, analysis) can be
+skipped.
+"""
+
+# File extensions Understand parses for each of the languages in
+# understand_analysis.SUPPORTED_LANGUAGES. Lower case, with the leading dot.
+LANGUAGE_FILE_EXTENSIONS = {
+    "Ada": [".ada", ".adb", ".ads", ".a"],
+    "Assembly": [".asm", ".s", ".inc"],
+    "C": [".c", ".h"],
+    "C#": [".cs"],
+    "C++": [".c", ".cc", ".cpp", ".cxx", ".c++", ".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".tcc"],
+    "Cobol": [".cbl", ".cob", ".cpy"],
+    "FORTRAN": [".f", ".for", ".ftn", ".f77", ".f90", ".f95", ".f03", ".f08", ".inc"],
+    "Java": [".java"],
+    "JOVIAL": [".jov", ".j73", ".cpl"],
+    "Delphi": [".pas", ".dpr", ".dpk", ".pp", ".inc"],
+    "Pascal": [".pas", ".pp", ".inc"],
+    "Python": [".py", ".pyw"],
+    "VHDL": [".vhd", ".vhdl"],
+    "Visual": [".bas", ".cls", ".frm", ".vb", ".ctl"],
+    "Web": [".htm", ".html", ".js", ".jsp", ".asp", ".php", ".css", ".xml"],
+}
+
+# Result of scanning a directory: relative paths of the matching files, and how
+# many files (and bytes) were left out
+SourceScan = namedtuple('SourceScan', ['files', 'excluded_files', 'excluded_bytes'])
+
+
+def glob_to_regex(pattern: str):
+    """Compile a glob where * and ? stay within a directory and ** spans directories.
+    A pattern without a slash matches a name at any depth, like .gitignore."""
+    pattern = pattern.strip().replace('\\', '/').strip('/')
+    if '/' not in pattern:
+        pattern = '**/' + pattern
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + '$')
+
+
+def matches_any(path: str, regexes: list) -> bool:
+    """Does the path, or any directory it is in, match one of the compiled globs?"""
+    parts = path.split('/')
+    for depth in range(1, len(parts) + 1):
+        prefix = '/'.join(parts[:depth])
+        if any(regex.match(prefix) for regex in regexes):
+            return True
+    return False
+
+
+class SourceFilter:
+    """Decides whether a file in a source tree is analyzable source for a language,
+    optionally narrowed to some sub-paths of the tree and by include and exclude globs
+    (exclude wins). Paths are relative to the root of the tree and may use either slash."""
+
+    def __init__(self, language: str, include_globs: list = None, exclude_globs: list = None,
+                 sub_paths: list = None):
+        self.language = language
+        self.sub_paths = [p.strip().replace('\\', '/').strip('/') for p in sub_paths or [] if p.strip()]
+        # If we don't know the language, don't filter anything out
+        self.extensions = tuple(LANGUAGE_FILE_EXTENSIONS.get(language, []))
+        self.include_globs = [g for g in include_globs or [] if g.strip()]
+        self.exclude_globs = [g for g in exclude_globs or [] if g.strip()]
+        self.include_regexes = [glob_to_regex(g) for g in self.include_globs]
+        self.exclude_regexes = [glob_to_regex(g) for g in self.exclude_globs]
+
+    @classmethod
+    def for_repository(cls, repo):
+        return cls(repo.language, repo.get_include_globs(), repo.get_exclude_globs(), repo.get_sub_paths())
+
+    def matches(self, path: str) -> bool:
+        path = path.replace('\\', '/')
+        if self.extensions and not path.lower().endswith(self.extensions):
+            return False
+        if self.sub_paths and not any(path.startswith(p + '/') for p in self.sub_paths):
+            return False
+        if self.include_regexes and not matches_any(path, self.include_regexes):
+            return False
+        return not matches_any(path, self.exclude_regexes)
+
+    def scan(self, root_dir: str) -> SourceScan:
+        """Find the matching files under root_dir, with paths relative to it using forward slashes"""
+        files = []
+        excluded_files = 0
+        excluded_bytes = 0
+        for dir_path, dir_names, file_names in os.walk(root_dir):
+            # Never descend into VCS metadata
+            dir_names[:] = [d for d in dir_names if d not in ('.git', '.hg', '.svn')]
+            rel_dir = os.path.relpath(dir_path, root_dir).replace('\\', '/')
+            for file_name in file_names:
+                rel_path = file_name if rel_dir == '.' else rel_dir + '/' + file_name
+                if self.matches(rel_path):
+                    files.append(rel_path)
+                else:
+                    excluded_files += 1
+                    try:
+                        excluded_bytes += os.lstat(os.path.join(dir_path, file_name)).st_size
+                    except OSError:
+                        pass
+        return SourceScan(files, excluded_files, excluded_bytes)
@@ -0,0 +1,71 @@
+import errno
+import os
+import shutil
+
+from analysis.source_filter import SourceFilter, SourceScan
+from cbri.reporting import logger
+
+"""
+Getting source files into a private directory for analysis as cheaply as the
+file system allows.
+"""
+
+# ioctl request to clone a file's extents (Linux btrfs/xfs), i.e. a reflink
+FICLONE = 0x40049409
+
+# Errors meaning "this file system can't do that here", as opposed to real failures
+UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP,
+                      errno.EINVAL, errno.ENOTTY, errno.EBADF)
+
+
+def reflink(source: str, target: str):
+    """Make target a copy-on-write clone of source, or raise OSError if unsupported"""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(errno.ENOTSUP, "Reflinks are not supported on this platform")
+
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            target_file.close()
+            os.remove(target)
+            raise
+
+
+def link_or_copy(source: str, target: str) -> str:
+    """Put source at target using a hardlink, then a reflink, and only then a real copy.
+    Analysis never writes to the files, so sharing them with the source is safe.
+    Returns how it was done."""
+    try:
+        os.link(source, target)
+        return "link"
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+
+    try:
+        reflink(source, target)
+        return "reflink"
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+
+    shutil.copy2(source, target)
+    return "copy"
+
+
+def stage_matching_files(source_dir: str, target_dir: str, source_filter: SourceFilter) -> SourceScan:
+    """Populate target_dir with the files under source_dir that pass source_filter,
+    keeping relative paths. Returns the scan of what was staged and left out."""
+    scan = source_filter.scan(source_dir)
+    counts = {"link": 0, "reflink": 0, "copy": 0}
+    for rel_path in scan.files:
+        target = os.path.join(target_dir, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        counts[link_or_copy(os.path.join(source_dir, rel_path), target)] += 1
+
+    logger.info("\tStaged %d hardlinked, %d reflinked and %d copied files into %s"
+                % (counts["link"], counts["reflink"], counts["copy"], target_dir))
+    return scan
@@ -11,16 +11,13 @@ import subprocess
 import django.utils.timezone as timezone
 from lxml import html
 
+from analysis.source_filter import SourceFilter, SourceScan
 from cbri.reporting import logger
 
 DEBUG_UNDERSTAND = False
 
 CBRI_PLUGIN_DIR = "./src/analysis/"
 
-REPO_CODE_BASE_DIR = "./temp/code/"
-REPO_REPORTS_BASE_DIR = "./temp/data/"
-REPO_UNDERSTAND_BASE_DIR = "./temp/code/"
-
 # Locations of executables for und and uperl
 UND_ENV_VAR = "CBRI_UND"
 UPERL_ENV_VAR = "CBRI_UPERL"
@@ -35,6 +32,9 @@ UNDERSTAND_LICENSE_PROBLEMS = ["This license has expired.", "The provided instal
 
 UNDERSTAND_ULOC_FIELD = 'Useful Lines of Code (ULOC)'
 
+# List of files for Understand to analyze, written to the data directory
+UNDERSTAND_FILE_LIST = "understand_files.txt"
+
 # I'm not sure what the purpose of this list is since it isn't used.
 # But it seems useful to keep around, these are the field names in
 # Understand output. -djc 2018-11-05
@@ -188,37 +188,10 @@ def add_tree_map_data(project: str, output: dict, data_dir: str):
     output["Components"] = nodes
 
 
-def analyze_repo(repo, code_base_dir, data_base_dir, und_base_dir):
-    """ Analyze the repo in the code_dir, store the understand file in the und_dir,
-    and output the results to the data_dir """
-    code_dir, data_dir, und_dir = get_directories_for_project(repo.name, code_base_dir, data_base_dir, und_base_dir)
-    run_understand(repo.name, repo.language, code_dir, data_dir, und_dir)
-    # return directories so the caller can delete
-    return code_dir, data_dir, und_dir
-
-
-def get_directories_for_project(project_name, code_base_dir, data_base_dir, und_base_dir):
-    # INTENTIONALLY NOT USING OS.PATH STUFF, THIS WORKS FOR WINDOWS.
-    # DO NOT CHANGE TO OS.PATH STUFF. UNDERSTAND WANTS FORWARD SLASHES
-    # EVEN IN WINDOWS. -DJC 2018-06-08
-    clean_project_name = get_clean_project_name(project_name);
-
-    code_dir = code_base_dir + clean_project_name
-    data_dir = data_base_dir + clean_project_name
-    und_dir = und_base_dir + clean_project_name
-
-    # Ensure the directories exist; create if needed.
-    # Don't make the code directory, it will be made on cloning
-    if not os.path.isdir(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-    # Understand db now lives in the code directory, so do not create it.
-    # if not os.path.isdir(und_dir):
-    #     os.makedirs(und_dir, exist_ok=True)
-
-    return code_dir, data_dir, und_dir
-
-
-def run_understand(project_name, lang, code_dir, data_dir, und_dir):
+def run_understand(project_name, lang, code_dir, data_dir, und_dir, source_filter: SourceFilter = None) -> SourceScan:
+    """ Analyze the code in code_dir. With a source_filter, Understand is given the list
+    of matching files rather than the whole directory; the scan of what was left out
+    is returned. """
     # Check for the environment variables
     und = os.getenv(UND_ENV_VAR)
     uperl = os.getenv(UPERL_ENV_VAR)
@@ -238,12 +211,24 @@ def run_understand(project_name, lang, code_dir, data_dir, und_dir):
     if os.access(und_db, os.F_OK):
         os.remove(und_db)
 
+    # Pick the files to analyze
+    scan = None
+    und_add = code_dir
+    if source_filter:
+        scan = source_filter.scan(code_dir)
+        file_list = data_dir + "/" + UNDERSTAND_FILE_LIST
+        with open(file_list, 'w') as list_file:
+            for rel_path in scan.files:
+                list_file.write(code_dir + "/" + rel_path + "\n")
+        und_add = "@" + file_list
+        logger.info("\tAnalyzing %d files, leaving out %d" % (len(scan.files), scan.excluded_files))
+
     # Call Understand
     logger.info("\tSource analysis: " + str(code_dir))
     logger.info("\tUnderstand DB: "+ str(und_db))
     und_command = und \
                   + " -quiet create -languages " + lang \
-                  + " add " + code_dir \
+                  + " add " + und_add \
                   + " analyze " + und_db
     und_command_split = shlex.split(und_command)
     logger.info("Und command is:" + str(und_command))
@@ -268,6 +253,8 @@ def run_understand(project_name, lang, code_dir, data_dir, und_dir):
 
     run_checking_stdout_for_license(uperl_command_split, "Understand error creating metrics: ")
 
+    return scan
+
 
 def run_checking_stdout_for_license(split_command, error_message_prefix):
     """
@@ -299,22 +286,6 @@ def run_checking_stdout_for_license(split_command, error_message_prefix):
         raise RuntimeError(error_message_prefix + exc.output)
 
 
-def remove_directories_for_project(project_name, code_base_dir, data_base_dir, und_base_dir):
-    """ Remove all of the directories that would be created for a project """
-    if project_name:
-        code_dir, data_dir, und_dir = get_directories_for_project(project_name, code_base_dir, data_base_dir, und_base_dir)
-
-        if DEBUG_UNDERSTAND:
-            logger.warn("DEBUG enabled - not deleting source directories")
-        else:
-            logger.info("\tDeleting the following 2 directories:\n\t%s\n\t%s"
-                        % (code_dir, data_dir))
-            if os.path.isdir(code_dir):
-                shutil.rmtree(code_dir, onerror=on_rm_error)
-            if os.path.isdir(data_dir):
-                shutil.rmtree(data_dir, onerror=on_rm_error)
-
-
 def on_rm_error(func, path, exc_info):
     # path contains the path of the file that couldn't be removed
     # let's just assume that it's read-only and remove it.
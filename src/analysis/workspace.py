@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import shutil
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+from analysis.understand_analysis import DEBUG_UNDERSTAND, on_rm_error
+from cbri.reporting import logger
+from cbri.settings import CBRI_SCRATCH_ROOT, CBRI_SCRATCH_QUOTA_MB, CBRI_SCRATCH_MIN_FREE_MB, MAX_RUN_TIME
+
+"""
+Scratch directories for analysis jobs.
+"""
+
+# INTENTIONALLY USING FORWARD SLASHES, THIS WORKS FOR WINDOWS.
+# UNDERSTAND WANTS FORWARD SLASHES EVEN IN WINDOWS.
+WORKSPACES_DIR = "workspaces"
+
+# Shared VCS mirrors, one per repository address, live next to the workspaces
+MIRRORS_DIR = "mirrors"
+
+# Written into each workspace so a sweep can tell who it belongs to
+OWNER_FILE = "owner.json"
+
+# A workspace without an owner file younger than this is probably still being created
+OWNERLESS_GRACE_SECONDS = 60
+
+MB = 1024 * 1024
+
+
+def get_workspaces_root(scratch_root: str = None) -> str:
+    return (scratch_root or CBRI_SCRATCH_ROOT).rstrip("/") + "/" + WORKSPACES_DIR
+
+
+def get_mirror_dir(address: str, scratch_root: str = None) -> str:
+    """Where the shared mirror for the given address (without any token) lives"""
+    key = hashlib.sha1(address.encode('utf-8')).hexdigest()
+    return (scratch_root or CBRI_SCRATCH_ROOT).rstrip("/") + "/" + MIRRORS_DIR + "/" + key
+
+
+@contextmanager
+def locked(path: str):
+    """Hold an exclusive lock on path + '.lock' for the duration, waiting for other
+    processes that hold it, so e.g. only one job at a time updates a shared mirror"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", 'a+') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class Workspace:
+    """Private directories for one analysis job on one repository, laid out as
+    <scratch root>/workspaces/<repo id>/<job id>/code and .../data
+    Keyed by id rather than repo name, so differently named repos can't collide
+    and several jobs for the same repo can run at once."""
+
+    def __init__(self, repo_id, job_id=None, scratch_root: str = None):
+        self.scratch_root = get_workspaces_root(scratch_root)
+        self.job_id = str(job_id) if job_id else uuid.uuid4().hex
+        self.root = self.scratch_root + "/" + str(repo_id) + "/" + self.job_id
+        self.code_dir = self.root + "/code"
+        self.data_dir = self.root + "/data"
+        # Understand db lives in the code directory
+        self.und_dir = self.code_dir
+
+    def create(self):
+        """Make the directories (except code_dir, made when code is staged) and record
+        which process owns them"""
+        os.makedirs(self.data_dir, exist_ok=True)
+        owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'created': time.time()}
+        with open(self.root + "/" + OWNER_FILE, 'w') as owner_file:
+            json.dump(owner, owner_file)
+
+    def use_external_code_dir(self, code_dir: str):
+        """Analyze code that lives outside the workspace, e.g. a local source tree, and must be
+        treated as read only. The Understand db moves into the workspace so nothing gets written
+        next to the code, and remove() never touches it."""
+        self.code_dir = code_dir
+        self.und_dir = self.root + "/und"
+        os.makedirs(self.und_dir, exist_ok=True)
+
+    def make_rev_dirs(self, rev: str):
+        """Make a private data directory for analyzing one revision on its own, and
+        return it with the code directory to export the revision into"""
+        rev_root = self.root + "/revs/" + rev
+        os.makedirs(rev_root + "/data", exist_ok=True)
+        return rev_root + "/code", rev_root + "/data"
+
+    def remove_rev_dirs(self, rev: str):
+        rev_root = self.root + "/revs/" + rev
+        if os.path.isdir(rev_root) and not DEBUG_UNDERSTAND:
+            shutil.rmtree(rev_root, onerror=on_rm_error)
+
+    def check_disk_quota(self):
+        """Raise an error rather than start staging code that could fill up the scratch disk"""
+        free_mb = shutil.disk_usage(self.scratch_root).free // MB
+        if free_mb < CBRI_SCRATCH_MIN_FREE_MB:
+            raise RuntimeError("Not enough disk space to stage code: %d MB free in %s, need %d MB"
+                               % (free_mb, self.scratch_root, CBRI_SCRATCH_MIN_FREE_MB))
+
+        if CBRI_SCRATCH_QUOTA_MB:
+            used_mb = get_directory_size(self.scratch_root) // MB
+            if used_mb >= CBRI_SCRATCH_QUOTA_MB:
+                raise RuntimeError("Analysis workspaces are over quota: %d MB used of %d MB"
+                                   % (used_mb, CBRI_SCRATCH_QUOTA_MB))
+
+    def remove(self):
+        if DEBUG_UNDERSTAND:
+            logger.warning("DEBUG enabled - not deleting workspace " + self.root)
+            return
+
+        logger.info("\tDeleting workspace " + self.root)
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root, onerror=on_rm_error)
+        remove_if_empty(os.path.dirname(self.root))
+
+
+def get_directory_size(path: str) -> int:
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except OSError:
+                pass  # Deleted out from under us
+    return total
+
+
+def remove_if_empty(path: str):
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass  # Not empty, or already gone
+
+
+def is_process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but belongs to someone else
+    return True
+
+
+def is_abandoned(workspace_dir: str) -> bool:
+    """Did the worker that made this workspace die without cleaning up?"""
+    try:
+        with open(workspace_dir + "/" + OWNER_FILE) as owner_file:
+            owner = json.load(owner_file)
+    except (IOError, ValueError):
+        return time.time() - os.path.getmtime(workspace_dir) > OWNERLESS_GRACE_SECONDS
+
+    # Only POSIX lets us ask about a pid safely (os.kill(pid, 0) terminates on Windows)
+    if os.name == 'posix' and owner.get('host') == socket.gethostname():
+        return not is_process_running(owner.get('pid'))
+
+    # Can't see the owner, so give up on it once it has outlived any job
+    return time.time() - owner.get('created', 0) > MAX_RUN_TIME
+
+
+def sweep_stale_workspaces(scratch_root: str = None):
+    """Delete workspaces left behind by crashed workers. Meant to be called at startup."""
+    root = get_workspaces_root(scratch_root)
+    if not os.path.isdir(root):
+        return
+
+    for repo_id in os.listdir(root):
+        repo_dir = root + "/" + repo_id
+        if not os.path.isdir(repo_dir):
+            continue
+        for job_id in os.listdir(repo_dir):
+            workspace_dir = repo_dir + "/" + job_id
+            if os.path.isdir(workspace_dir) and is_abandoned(workspace_dir):
+                logger.warning("Removing stale analysis workspace: " + workspace_dir)
+                shutil.rmtree(workspace_dir, onerror=on_rm_error)
+        remove_if_empty(repo_dir)
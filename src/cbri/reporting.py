@@ -2,8 +2,6 @@ import smtplib
 import logging
 from email.mime.text import MIMEText
 
-from django.utils import timezone
-
 from cbri.version import get_version
 from cbri.settings import CBRI_EMAIL, CBRI_PASSWORD, CBRI_SMTP, CBRI_FRONT_END, config_file_dir
 
@@ -17,18 +15,21 @@ logger.info(get_version())
 logger.info("Using config file: " + config_file_dir)
 
 
-def log_to_repo(repo, log_msg : str, exception=False):
-    """Log repo-specific information to the repo itself for console-style reporting"""
+def log_to_repo(repo, log_msg : str, exception=False, job=None):
+    """Log repo-specific information to the repo itself for console-style reporting
+    (as part of the job, if given). The repo's log is part of its event stream."""
     if exception:
         logger.exception(log_msg)
     else:
         logger.info(log_msg)
 
-    d = timezone.localtime((timezone.now()).replace(microsecond=0))
-    date_str = d.strftime("%Y-%m-%d %H:%M")
+    # A repo that has been deleted has nowhere to keep its log
+    if repo.pk is None:
+        return
 
-    repo.log = repo.log + '\n' + date_str + " " + log_msg
-    repo.save()
+    # Imported here because the models log through this module
+    from store.models import EventKind
+    repo.add_event(EventKind.LOG, log_msg, job)
 
 
 class UserNotification:
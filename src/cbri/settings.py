@@ -72,7 +72,6 @@ INSTALLED_APPS = [
     'store.apps.StoreConfig',
     'corsheaders',
     'multi_email_field',
-    'background_task',
 ]
 
 MIDDLEWARE = [
@@ -123,6 +122,18 @@ if 'DatabaseDefaults' in config:
     default_db_settings = dict(config['DatabaseDefaults'])
     DATABASES['default'] = default_db_settings
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Memory of each server process by default. A file or memcached backend shares the
+# cached responses (see store.cache) between processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': config.get('Cache', 'BACKEND', fallback='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config.get('Cache', 'LOCATION', fallback='cbri'),
+    }
+}
+
 # SECURITY WARNING: Django Auth is disabled for testing.
 ENABLE_AUTH = True
 
@@ -194,6 +205,60 @@ CBRI_FRONT_END = config.get('Reporting', 'URL_BASE', fallback="http://localhost:
 
 SUPPORTED_LANGUAGES = ["Java", "C", "C#", "C++"]
 
+# Analysis workspaces. The scratch root can be a tmpfs mount or a fast local disk.
+# Staging is refused when the disk has less than the minimum free space, or when
+# the workspaces already use the quota (0 means no quota).
+CBRI_SCRATCH_ROOT = config.get('Analysis', 'SCRATCH_ROOT', fallback="./temp/")
+CBRI_SCRATCH_QUOTA_MB = config.getint('Analysis', 'SCRATCH_QUOTA_MB', fallback=0)
+CBRI_SCRATCH_MIN_FREE_MB = config.getint('Analysis', 'SCRATCH_MIN_FREE_MB', fallback=500)
+
+# How file:// repositories are staged: "in_place" analyzes the source directory where it
+# is (read only), "link" hardlinks or reflinks the source files into the workspace and
+# copies only when neither works.
+CBRI_FILE_STAGING = config.get('Analysis', 'FILE_STAGING', fallback="in_place")
+
+# How history is sampled: "fixed" analyzes six revisions eight weeks apart, "bisect" also
+# bisects between samples whose metrics differ by more than the change threshold (a
+# percentage), analyzing at most the budgeted number of extra revisions.
+CBRI_HISTORY_MODE = config.get('Analysis', 'HISTORY_MODE', fallback="fixed")
+CBRI_HISTORY_BISECT_BUDGET = config.getint('Analysis', 'HISTORY_BISECT_BUDGET', fallback=10)
+CBRI_HISTORY_CHANGE_THRESHOLD = config.getfloat('Analysis', 'HISTORY_CHANGE_THRESHOLD', fallback=5.0)
+
+# How many revisions a backfill analyzes at once
+CBRI_BACKFILL_WORKERS = config.getint('Analysis', 'BACKFILL_WORKERS', fallback=2)
+
+# Job runners (manage.py run_analysis_jobs). Each runs as many jobs at once as it has
+# slots, and renews the lease on a job while working on it; a job whose lease runs out
+# is taken up by another runner, at most the given number of times.
+CBRI_RUNNER_SLOTS = config.getint('Analysis', 'RUNNER_SLOTS', fallback=2)
+CBRI_JOB_LEASE_SECONDS = config.getint('Analysis', 'JOB_LEASE_SECONDS', fallback=300)
+CBRI_RUNNER_POLL_SECONDS = config.getint('Analysis', 'RUNNER_POLL_SECONDS', fallback=5)
+CBRI_JOB_MAX_ATTEMPTS = config.getint('Analysis', 'JOB_MAX_ATTEMPTS', fallback=3)
+
+# Queued jobs run interactive updates first, then updates from CI, then histories, then
+# backfills. A job moves up a class for each of these periods it waits (0 turns that off).
+CBRI_JOB_AGING_MINUTES = config.getint('Analysis', 'JOB_AGING_MINUTES', fallback=60)
+
+# Log lines of a job are saved this many at a time (1 saves each right away)
+CBRI_LOG_BATCH_SIZE = config.getint('Analysis', 'LOG_BATCH_SIZE', fallback=20)
+
+# Event streams check for new events this often, and close after the given time so that
+# clients reconnect (resuming where they were) instead of holding a server thread for long
+CBRI_EVENT_POLL_SECONDS = config.getint('Analysis', 'EVENT_POLL_SECONDS', fallback=1)
+CBRI_EVENT_STREAM_SECONDS = config.getint('Analysis', 'EVENT_STREAM_SECONDS', fallback=30)
+
+# Measurements, components and scores are listed a page at a time. Clients can ask for
+# pages of up to the max size with the limit parameter.
+CBRI_PAGE_SIZE = config.getint('API', 'PAGE_SIZE', fallback=100)
+CBRI_MAX_PAGE_SIZE = config.getint('API', 'MAX_PAGE_SIZE', fallback=1000)
+
+# Time series for charts are thinned out to at most this many points
+CBRI_SERIES_MAX_POINTS = config.getint('API', 'SERIES_MAX_POINTS', fallback=500)
+
+# Responses to reads of repositories, benchmarks and series are cached this long (0 turns
+# that off). A change to the repository's data makes way for fresh ones right away.
+CBRI_RESPONSE_CACHE_SECONDS = config.getint('Cache', 'RESPONSE_SECONDS', fallback=600)
+
 # Logging
 LOGGING_CONFIG = None
 LOGGING = {
@@ -240,6 +305,5 @@ LOGGING = {
 import logging.config
 logging.config.dictConfig(LOGGING)
 
-#BACKGROUND_TASK
-MAX_ATTEMPTS=1
+# Workspaces older than this (in seconds) were abandoned by their analysis
 MAX_RUN_TIME=3600
\ No newline at end of file
@@ -31,11 +31,15 @@ router.register(r'repositories/(?P<repo>[^/.]+)/measurements/(?P<measurement>[^/
 router.register(r'repositories/(?P<repo>[^/.]+)/measurements/(?P<measurement>[^/.]+)/scores', MeasurementScoreViewSet, 'score')
 router.register(r'repositories/(?P<repo>[^/.]+)/benchmarks', BenchmarkViewSet, 'benchmark')
 router.register(r'repositories/(?P<repo>[^/.]+)/benchmark_descriptions', BenchmarkDescriptionViewSet, 'benchmark_description')
+router.register(r'repositories/(?P<repo>[^/.]+)/jobs', AnalysisJobViewSet, 'job')
+router.register(r'repositories/(?P<repo>[^/.]+)/log', LogEntryViewSet, 'log_entry')
 
 urlpatterns = [
     path('api/', include(router.urls)),
     url('api/cbri-settings', SettingsAPIView.as_view()),
     url('api/supported-languages', SupportedLanguagesAPIView.as_view()),
+    url('api/job-queue', JobQueueAPIView.as_view()),
+    url('api/response-cache', ResponseCacheAPIView.as_view()),
     url('api/login', obtain_jwt_token),
     url('api/current-user', CurrentUserView.as_view()),
     # Special path to create users without authentication -djc 2018-04-25
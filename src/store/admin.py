@@ -6,8 +6,36 @@ from .models import *
 class MeasurementAdmin(admin.ModelAdmin):
     list_display = ('date', 'repository')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Repository.bump_version(Repository.objects.filter(id=obj.repository_id))
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Repository.bump_version(Repository.objects.filter(id=obj.repository_id))
+
+    def delete_queryset(self, request, queryset):
+        repos = Repository.objects.filter(id__in=set(queryset.values_list('repository_id', flat=True)))
+        super().delete_queryset(request, queryset)
+        Repository.bump_version(repos)
+
+
+class AllowedEmailInline(admin.TabularInline):
+    model = AllowedEmail
+    extra = 1
+
+
+class RepositoryAdmin(admin.ModelAdmin):
+    inlines = (AllowedEmailInline,)
+    readonly_fields = ('open_to_all', 'data_version', 'data_modified')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Open to all just when no emails are left
+        form.instance.set_allowed_emails(form.instance.allowed_emails)
+
 
 admin.site.register(Organization)
 admin.site.register(InsightUser)
-admin.site.register(Repository)
+admin.site.register(Repository, RepositoryAdmin)
 admin.site.register(Measurement, MeasurementAdmin)
@@ -2,14 +2,14 @@ import os
 
 from django.apps import AppConfig
 
-from analysis.understand_analysis import REPO_CODE_BASE_DIR, REPO_UNDERSTAND_BASE_DIR, REPO_REPORTS_BASE_DIR
+from analysis.workspace import get_workspaces_root, sweep_stale_workspaces
 
 
 class StoreConfig(AppConfig):
     name = 'store'
 
     def ready(self):
-        # Make sure we have the folders we'll count on for Understand stuff
-        os.makedirs(REPO_CODE_BASE_DIR, exist_ok=True)
-        os.makedirs(REPO_UNDERSTAND_BASE_DIR, exist_ok=True)
-        os.makedirs(REPO_REPORTS_BASE_DIR, exist_ok=True)
+        # Make sure we have the folder we'll count on for Understand stuff,
+        # minus anything a crashed worker left behind
+        os.makedirs(get_workspaces_root(), exist_ok=True)
+        sweep_stale_workspaces()
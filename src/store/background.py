@@ -1,80 +1,188 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
-from uuid import UUID
 
 from analysis.manager.analysis_manager_factory import get_analysis_manager
+from analysis.manager.fake_analysis_manager import FakeAnalysisManager
 from cbri.reporting import UserNotification, log_to_repo
-from .models import Repository, Measurement
-
-from background_task import background
+from cbri.settings import CBRI_LOG_BATCH_SIZE
+from .models import Repository, Measurement, AnalysisJob, JobStatus, JobType, JobPriority, RevisionResult, \
+    buffered_events
 
 """
-These tasks are expected to take a long time.
+These tasks are expected to take a long time. Queueing one just records an
+AnalysisJob; a job runner (see store.runner) picks it up and calls run_job.
 """
 
-@background(schedule=10)
-def update_repo(repo_id: str, temp_measurement_id: str, current_user_email: str):
 
-    # Make sure the repo hasn't been deleted in the meantime
-    repo = Repository.objects.get(pk=UUID(repo_id))
-    if not repo:
-        return;
+def find_active_job(repo: Repository, job_type: JobType, **match):
+    """The job of the given type already queued or running on the repository, if any.
+    Requests for the same work join it rather than queuing more."""
+    return repo.jobs.filter(job_type=job_type, status__in=(JobStatus.PENDING, JobStatus.RUNNING), **match) \
+        .order_by('created').first()
+
+
+def lock_repo(repo: Repository):
+    """Within a transaction, keep other requests from queuing jobs on the repository
+    until it's done (where the database supports row locks)"""
+    Repository.objects.select_for_update().filter(id=repo.id).first()
+
+
+def queue_update(repo: Repository, current_user_email: str,
+                 priority: JobPriority = JobPriority.INTERACTIVE) -> AnalysisJob:
+    """Queue an update, or join the one already queued or running. Either way the job's
+    placeholder, an empty measurement, stands in for the result until it is done."""
+    with transaction.atomic():
+        lock_repo(repo)
+        job = find_active_job(repo, JobType.UPDATE)
+        if not job:
+            return AnalysisJob.objects.create(repository=repo, job_type=JobType.UPDATE, priority=priority,
+                                              placeholder=FakeAnalysisManager(repo, 1).make_zero_measurement(),
+                                              user_email=current_user_email or "")
+
+        # Someone is waiting on it now
+        fields = []
+        if priority.value > job.priority.value:
+            # It ages in its new class from now on, rather than skip ahead for the wait in the old one
+            job.priority = priority
+            job.enqueued = timezone.now()
+            fields += ['priority', 'enqueued']
+        if not job.placeholder:
+            job.placeholder = FakeAnalysisManager(repo, 1).make_zero_measurement()
+            fields.append('placeholder')
+        job.save(update_fields=fields)
+
+    log_to_repo(repo, "Update already queued: " + str(job.id), job=job)
+    return job
+
+
+def queue_history(repo: Repository, current_user_email: str) -> AnalysisJob:
+    with transaction.atomic():
+        lock_repo(repo)
+        job = find_active_job(repo, JobType.HISTORY)
+        if not job:
+            job = AnalysisJob.objects.create(repository=repo, job_type=JobType.HISTORY, priority=JobPriority.HISTORY,
+                                             user_email=current_user_email or "")
+    return job
+
+
+def run_job(job: AnalysisJob):
+    """Do the work of a job that has been claimed"""
+    with buffered_events(CBRI_LOG_BATCH_SIZE):
+        if job.job_type is JobType.UPDATE:
+            update_repo(job)
+        elif job.job_type is JobType.HISTORY:
+            create_history(job)
+        elif job.job_type is JobType.BACKFILL:
+            run_backfill(job)
+        else:
+            raise RuntimeError("Don't know how to run jobs of type " + job.job_type.name)
 
-    # Delete the temp measurement if it exists
-    temp_measurement = Measurement.objects.get(pk=UUID(temp_measurement_id))
-    if temp_measurement:
-        temp_measurement.delete()
 
-    log_to_repo(repo, "Started update analysis for: " + repo.name)
+def update_repo(job: AnalysisJob):
+    repo = job.repository
+    log_to_repo(repo, "Started update analysis for: " + repo.name, job=job)
 
     un = UserNotification()
     measurement_error = None
 
     try:
-        measurement = get_analysis_manager(repo).make_measurement()
+        measurement = get_analysis_manager(repo, job.id).make_measurement(job)
+        job.set_status(JobStatus.DONE)
     except Exception as e:
-        log_to_repo(repo, str(e), exception=True)
+        log_to_repo(repo, str(e), exception=True, job=job)
         measurement_error = ValidationError("ANALYSIS ERROR: " + str(e))
+        job.set_status(JobStatus.FAILED, str(e))
+
+    # The temp measurement stood in for this one while the job was queued and running. Reload
+    # the job first, in case someone joined it and it has a placeholder only now.
+    job.refresh_from_db(fields=['placeholder'])
+    if job.placeholder:
+        job.placeholder.delete()
+        Repository.bump_version(Repository.objects.filter(id=repo.id))
 
     # Notify user of success or failure.
     try:
         if not measurement_error:
-            un.send_repo_update_email(current_user_email, repo.name, str(repo.id))
+            un.send_repo_update_email(job.user_email, repo.name, str(repo.id))
         else:
-            un.send_repo_update_failed_email(current_user_email, repo.name, str(measurement_error))
+            un.send_repo_update_failed_email(job.user_email, repo.name, str(measurement_error))
     except Exception as e:
-        log_to_repo(repo, str(e), exception=True)
+        log_to_repo(repo, str(e), exception=True, job=job)
 
-    log_to_repo(repo, "Completed update analysis for: " + repo.name)
+    log_to_repo(repo, "Completed update analysis for: " + repo.name, job=job)
 
 
-@background(schedule=10)
-def create_history(repo_id: str, current_user_email: str):
-    # Then make a history of measurement objects to kick start things
-    repo = Repository.objects.get(pk=UUID(repo_id))
-    if not repo:
-        return;
-
-    log_to_repo(repo, "Started history analysis for: " + repo.name)
+def create_history(job: AnalysisJob):
+    # Make a history of measurement objects to kick start things. If the job was
+    # run before, this picks up where it left off.
+    repo = job.repository
+    log_to_repo(repo, "Started history analysis for: " + repo.name, job=job)
 
     un = UserNotification()
     measurement_error = None
     try:
-        get_analysis_manager(repo).make_history()
+        get_analysis_manager(repo, job.id).make_history(job)
     except Exception as e:
-        # If something went wrong with the history, don't make the
-        # project because it's confusing to see it there Awaiting measurements
-        # -djc 2018-07-20
-        log_to_repo(repo, str(e), exception=True)
+        log_to_repo(repo, str(e), exception=True, job=job)
         measurement_error = ValidationError("ANALYSIS ERROR: " + str(e))
-        repo.delete()
+        job.set_status(JobStatus.FAILED, str(e))
+
+    done = job.revisions.filter(result=RevisionResult.DONE).count()
+    failed = job.revisions.filter(result=RevisionResult.FAILED)
+    if job.revisions.filter(result=RevisionResult.PENDING).exists() and not measurement_error:
+        log_to_repo(repo, "Paused history analysis for: " + repo.name, job=job)
+        return
+
+    if not done:
+        if not measurement_error:
+            first_failure = failed.first()
+            measurement_error = ValidationError("ANALYSIS ERROR: " + (first_failure.error if first_failure else
+                                                                      "No revisions to analyze"))
+            job.set_status(JobStatus.FAILED, str(measurement_error))
+    elif failed.exists():
+        # Keep what was measured; resuming the job retries the failed revisions
+        job.set_status(JobStatus.FAILED, "%d of %d revisions could not be analyzed" % (failed.count(), done + failed.count()))
+    elif not measurement_error:
+        job.set_status(JobStatus.DONE)
 
     # Notify user of success or failure.
     try:
-        if not measurement_error:
-            un.send_repo_create_email(current_user_email, repo.name, str(repo.id))
+        if done:
+            un.send_repo_create_email(job.user_email, repo.name, str(repo.id))
         else:
-            un.send_repo_create_failed_email(current_user_email, repo.name, str(measurement_error))
+            un.send_repo_create_failed_email(job.user_email, repo.name, str(measurement_error))
     except Exception as e:
-        log_to_repo(repo, str(e), exception=True)
+        log_to_repo(repo, str(e), exception=True, job=job)
+
+    log_to_repo(repo, "Completed history analysis for: " + repo.name, job=job)
+
+    if not done:
+        # If nothing could be measured, don't make the project because
+        # it's confusing to see it there Awaiting measurements
+        # -djc 2018-07-20
+        repo.delete()
 
-    log_to_repo(repo, "Completed history analysis for: " + repo.name)
\ No newline at end of file
+
+def run_backfill(job: AnalysisJob):
+    repo = job.repository
+    log_to_repo(repo, "Started backfill analysis for: " + repo.name, job=job)
+
+    try:
+        measurements = get_analysis_manager(repo, job.id).make_backfill(job)
+    except Exception as e:
+        log_to_repo(repo, str(e), exception=True, job=job)
+        job.set_status(JobStatus.FAILED, str(e))
+        return
+
+    # Revisions are left over if the job was paused
+    failed = job.revisions.filter(result=RevisionResult.FAILED).count()
+    if job.revisions.filter(result=RevisionResult.PENDING).exists():
+        log_to_repo(repo, "Paused backfill analysis for: %s after %d new measurements" % (repo.name, len(measurements)), job=job)
+    elif failed:
+        # Resuming the job retries the failed revisions
+        job.set_status(JobStatus.FAILED, "%d of %d revisions could not be analyzed" % (failed, job.total_revisions))
+        log_to_repo(repo, "Completed backfill analysis for: %s with %d new measurements" % (repo.name, len(measurements)), job=job)
+    else:
+        job.set_status(JobStatus.DONE)
+        log_to_repo(repo, "Completed backfill analysis for: %s with %d new measurements" % (repo.name, len(measurements)), job=job)
@@ -0,0 +1,57 @@
+import hashlib
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from cbri.settings import CBRI_RESPONSE_CACHE_SECONDS
+
+"""
+Responses to reads of a repository's data, kept in Django's cache. Their keys have the
+repository's data version in them, so a write (which bumps it, see Repository.bump_version) makes
+the old entries miss from then on, and they are left to expire.
+
+Hits and misses are counted in memory by each server process, so counting costs no more
+trips to the cache. They are that process's counts since it started.
+"""
+
+KEY_PREFIX = 'cbri:response:'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def response_key(*parts) -> str:
+    return KEY_PREFIX + hashlib.md5(" ".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def count(stat: str):
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+def cached_response(key: str, respond) -> Response:
+    """The response kept under the key, or respond() kept there if it's a success"""
+    if CBRI_RESPONSE_CACHE_SECONDS <= 0:
+        return respond()
+
+    data = cache.get(key)
+    if data is not None:
+        count('hits')
+        return Response(data)
+
+    count('misses')
+    response = respond()
+    if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+        cache.set(key, response.data, CBRI_RESPONSE_CACHE_SECONDS)
+    return response
+
+
+def cache_stats() -> dict:
+    """Hits and misses in this process. None are counted while caching is off."""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return {'hits': hits, 'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None}
@@ -0,0 +1,67 @@
+import json
+import time
+
+from rest_framework.renderers import BaseRenderer
+
+from cbri.settings import CBRI_EVENT_POLL_SECONDS, CBRI_EVENT_STREAM_SECONDS
+
+"""
+Server-sent event streams of RepositoryEvents. A stream polls the event table for
+events after the last one sent, so a client that reconnects with Last-Event-ID
+only gets what it missed. Streams end after a while, or once there is no job left
+to report on; EventSource clients reconnect by themselves.
+"""
+
+# Events read from the database at once
+EVENT_BATCH = 100
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for text/event-stream. The stream itself is written by event_stream."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data)
+
+
+def get_last_event_id(request) -> int:
+    """The id of the last event the client has, from the Last-Event-ID header an
+    EventSource sends when it reconnects, or the last_event_id query parameter"""
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('last_event_id')
+    try:
+        return int(last_event_id)
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_event(event) -> str:
+    data = {'text': event.text, 'job': str(event.job_id) if event.job_id else None,
+            'created': event.created.isoformat()}
+    return "id: %d\nevent: %s\ndata: %s\n\n" % (event.id, event.kind.name.lower(), json.dumps(data))
+
+
+def event_stream(events, last_event_id: int, finished=None):
+    """Yield the given events after last_event_id as server-sent events, as they are added.
+    Stops when finished() says no more are coming, or the stream has been open too long."""
+    deadline = time.monotonic() + CBRI_EVENT_STREAM_SECONDS
+    yield "retry: %d\n\n" % (CBRI_EVENT_POLL_SECONDS * 1000)
+    while True:
+        # Checked before reading, so the last events are sent before stopping
+        done = finished is not None and finished()
+        batch = list(events.filter(id__gt=last_event_id).order_by('id')[:EVENT_BATCH])
+        for event in batch:
+            last_event_id = event.id
+            yield format_event(event)
+        if len(batch) == EVENT_BATCH:
+            continue
+        if done:
+            # Nothing more is coming soon, so don't have the client reconnect right away
+            yield "retry: %d\n\n" % (CBRI_EVENT_STREAM_SECONDS * 1000)
+            return
+        if time.monotonic() > deadline:
+            return
+        # Keeps proxies from closing a quiet connection
+        yield ": waiting\n\n"
+        time.sleep(CBRI_EVENT_POLL_SECONDS)
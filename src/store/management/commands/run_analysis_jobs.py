@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from cbri.settings import CBRI_RUNNER_SLOTS
+from store.runner import JobRunner
+
+
+class Command(BaseCommand):
+    help = "Runs queued analysis jobs. Start as many runners, on as many hosts, as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=CBRI_RUNNER_SLOTS,
+                            help="How many jobs to run at once")
+        parser.add_argument('--once', action='store_true',
+                            help="Stop once the queue is empty instead of waiting for more jobs")
+
+    def handle(self, *args, **options):
+        JobRunner(slots=options['slots']).run(once=options['once'])
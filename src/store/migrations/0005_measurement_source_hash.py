@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_auto_20190827_1928'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measurement',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
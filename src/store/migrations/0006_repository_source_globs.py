@@ -0,0 +1,24 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:38
+
+from django.db import migrations
+import django_bleach.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_measurement_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='exclude_globs',
+            field=django_bleach.models.BleachField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='repository',
+            name='include_globs',
+            field=django_bleach.models.BleachField(blank=True, default=''),
+        ),
+    ]
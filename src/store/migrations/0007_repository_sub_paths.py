@@ -0,0 +1,19 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:41
+
+from django.db import migrations
+import django_bleach.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_repository_source_globs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='sub_paths',
+            field=django_bleach.models.BleachField(blank=True, default=''),
+        ),
+    ]
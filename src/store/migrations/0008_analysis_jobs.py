@@ -0,0 +1,50 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_bleach.models
+import enumfields.fields
+import store.models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_repository_sub_paths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('job_type', enumfields.fields.EnumField(enum=store.models.JobType, max_length=10)),
+                ('status', enumfields.fields.EnumField(default=0, enum=store.models.JobStatus, max_length=10)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('start_date', models.DateTimeField(blank=True, null=True)),
+                ('end_date', models.DateTimeField(blank=True, null=True)),
+                ('sampling', enumfields.fields.EnumField(default=0, enum=store.models.SamplingPolicy, max_length=10)),
+                ('interval_days', models.IntegerField(default=7)),
+                ('every_nth', models.IntegerField(default=1)),
+                ('tag_pattern', django_bleach.models.BleachField(blank=True, default='')),
+                ('total_revisions', models.IntegerField(default=0)),
+                ('completed_revisions', models.IntegerField(default=0)),
+                ('error', django_bleach.models.BleachField(blank=True, default='')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='store.Repository')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobRevision',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('revision_id', django_bleach.models.BleachField(max_length=200)),
+                ('date', models.DateTimeField()),
+                ('result', enumfields.fields.EnumField(default=0, enum=store.models.RevisionResult, max_length=10)),
+                ('error', django_bleach.models.BleachField(blank=True, default='')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='store.AnalysisJob')),
+                ('measurement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='store.Measurement')),
+            ],
+        ),
+    ]
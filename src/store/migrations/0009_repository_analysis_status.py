@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_analysis_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='analysis_status',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+    ]
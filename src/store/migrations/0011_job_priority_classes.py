@@ -0,0 +1,36 @@
+# Generated by Django 2.2.6 on 2026-10-19 16:57
+
+from django.db import migrations, models
+import enumfields.fields
+import store.models
+
+
+def set_priority_classes(apps, schema_editor):
+    # Priorities were plain numbers: 0 for updates and histories, -10 for backfills
+    AnalysisJob = apps.get_model('store', 'AnalysisJob')
+    AnalysisJob.objects.filter(priority__lt=0).update(priority=store.models.JobPriority.BACKFILL.value)
+    AnalysisJob.objects.filter(priority=0, job_type=store.models.JobType.UPDATE).update(
+        priority=store.models.JobPriority.INTERACTIVE.value)
+    AnalysisJob.objects.filter(priority=0, job_type=store.models.JobType.HISTORY).update(
+        priority=store.models.JobPriority.HISTORY.value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_analysis_job_runner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_priority_classes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='analysisjob',
+            name='priority',
+            field=enumfields.fields.EnumField(default=1, enum=store.models.JobPriority, max_length=10),
+        ),
+    ]
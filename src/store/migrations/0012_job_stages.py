@@ -0,0 +1,52 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:01
+
+from django.db import migrations, models
+import enumfields.fields
+import store.models
+
+
+def set_finished_stages(apps, schema_editor):
+    AnalysisJob = apps.get_model('store', 'AnalysisJob')
+    AnalysisJob.objects.filter(status=store.models.JobStatus.DONE).update(stage=store.models.JobStage.DONE)
+    AnalysisJob.objects.filter(status=store.models.JobStatus.FAILED).update(stage=store.models.JobStage.FAILED)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_job_priority_classes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='analyzing_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='finished',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='parsing_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='scoring_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='stage',
+            field=enumfields.fields.EnumField(default=0, enum=store.models.JobStage, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='staging_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_finished_stages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import enumfields.fields
+import store.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_job_stages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepositoryEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', enumfields.fields.EnumField(enum=store.models.EventKind, max_length=10)),
+                ('text', models.TextField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='store.AnalysisJob')),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='store.Repository')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='repositoryevent',
+            index=models.Index(fields=['repository', 'id'], name='store_repos_reposit_0af2e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='repositoryevent',
+            index=models.Index(fields=['job', 'id'], name='store_repos_job_id_e0a526_idx'),
+        ),
+    ]
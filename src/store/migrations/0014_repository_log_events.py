@@ -0,0 +1,69 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:05
+
+import datetime
+import re
+
+from django.db import migrations
+from django.utils import timezone
+
+import store.models
+
+# Each entry of the old log started on a new line with the minute it was logged
+ENTRY_START = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}) (.*)$', re.DOTALL)
+
+
+def parse_log(log: str, default_date) -> list:
+    """(date, text) for each entry in the old log text, oldest first"""
+    entries = []
+    for line in log.split('\n'):
+        match = ENTRY_START.match(line)
+        if match:
+            date = timezone.make_aware(datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M"),
+                                       timezone.get_default_timezone())
+            entries.append([date, match.group(2)])
+        elif entries:
+            # The rest of a message that spans lines
+            entries[-1][1] += '\n' + line
+        elif line.strip():
+            entries.append([default_date, line])
+    return entries
+
+
+def move_log_to_events(apps, schema_editor):
+    Repository = apps.get_model('store', 'Repository')
+    RepositoryEvent = apps.get_model('store', 'RepositoryEvent')
+    LOG = store.models.EventKind.LOG
+
+    for repo in Repository.objects.exclude(log="").iterator():
+        events = list(RepositoryEvent.objects.filter(repository=repo).order_by('id'))
+        entries = parse_log(repo.log, events[0].created if events else timezone.now())
+        # The lines logged since there were events are in both, drop them from the text
+        logged = len([event for event in events if event.kind is LOG])
+        entries = entries[:max(len(entries) - logged, 0)]
+
+        # Rewritten in order, with the log lines as just the message
+        moved = [RepositoryEvent(repository=repo, kind=LOG, text=text, created=date) for date, text in entries]
+        for event in events:
+            text = event.text
+            match = ENTRY_START.match(text)
+            if event.kind is LOG and match:
+                text = match.group(2)
+            moved.append(RepositoryEvent(repository=repo, job_id=event.job_id, kind=event.kind, text=text,
+                                         created=event.created))
+        RepositoryEvent.objects.filter(repository=repo).delete()
+        RepositoryEvent.objects.bulk_create(moved)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_repository_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_log_to_events, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='repository',
+            name='log',
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_allowed_emails(apps, schema_editor):
+    Repository = apps.get_model('store', 'Repository')
+    AllowedEmail = apps.get_model('store', 'AllowedEmail')
+    for repo in Repository.objects.iterator():
+        emails = set(repo.allowed_emails or [])
+        if emails:
+            AllowedEmail.objects.bulk_create(AllowedEmail(repository=repo, email=email) for email in emails)
+            Repository.objects.filter(id=repo.id).update(open_to_all=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_repository_log_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='open_to_all',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='AllowedEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('repository', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allowed', to='store.Repository')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='allowedemail',
+            index=models.Index(fields=['email', 'repository'], name='store_allow_email_8c7273_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='allowedemail',
+            unique_together={('repository', 'email')},
+        ),
+        migrations.RunPython(copy_allowed_emails, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='repository',
+            name='allowed_emails',
+        ),
+    ]
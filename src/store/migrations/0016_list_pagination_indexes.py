@@ -0,0 +1,25 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_allowed_email_table'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='componentmeasurement',
+            index=models.Index(fields=['measurement', 'full_name', 'id'], name='store_compo_measure_69d3a2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['repository', 'date', 'id'], name='store_measu_reposit_53d688_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurementscore',
+            index=models.Index(fields=['measurement', 'name', 'id'], name='store_measu_measure_4169c9_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:17
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='repository',
+            name='data_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='repository',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
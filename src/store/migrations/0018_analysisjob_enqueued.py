@@ -0,0 +1,25 @@
+# Generated by Django 2.2.6 on 2026-10-19 17:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_enqueued(apps, schema_editor):
+    AnalysisJob = apps.get_model('store', 'AnalysisJob')
+    AnalysisJob.objects.update(enqueued=models.F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_repository_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='enqueued',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(set_enqueued, migrations.RunPython.noop),
+    ]
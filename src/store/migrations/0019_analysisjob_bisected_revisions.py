@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-19 18:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_analysisjob_enqueued'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='bisected_revisions',
+            field=models.IntegerField(default=0),
+        ),
+    ]
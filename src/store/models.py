@@ -1,4 +1,9 @@
+import datetime
+import threading
 import uuid
+from collections import Counter
+from contextlib import contextmanager
+from enum import Enum
 from io import StringIO
 
 import pandas as pd
@@ -8,16 +13,19 @@ from django.db import models
 from django_bleach.models import BleachField
 from django.utils import timezone
 from enumfields import EnumField
-from multi_email_field.fields import MultiEmailField
 
 from analysis.tree_helper import make_tree_map, empty_tree
 import scoring.benchmarks as benchmarks
 from scoring.scores import ScoreGenerator
 from vcs.repo_type import RepoType
 from cbri.reporting import logger
+from cbri.settings import CBRI_JOB_AGING_MINUTES
 
 DEFAULT_CHAR_LENGTH = 200
 
+# Kept up by Repository.bump_version alone
+VERSION_FIELDS = ('data_version', 'data_modified')
+
 # TODO: DB Indexing? -djc 2018-02-26
 
 
@@ -47,16 +55,27 @@ class Repository(models.Model):
     type = EnumField(RepoType)
     description = BleachField()
     token = BleachField(blank=True, max_length=DEFAULT_CHAR_LENGTH)
-    # Console-like logging
-    log = BleachField(default="")
     # Space separated list of topics as seen on github
     topics = BleachField(blank=True)
     # TODO: Use choices rather than free text? -djc 2018-02-26
     language = BleachField(max_length=DEFAULT_CHAR_LENGTH)
     address = BleachField(blank=True, max_length=DEFAULT_CHAR_LENGTH)
-    # Users with these email addresses can access the repo, or any user
-    # if empty
-    allowed_emails = MultiEmailField()
+    # Any user can access the repo, unless it has a list of allowed emails (see AllowedEmail)
+    open_to_all = models.BooleanField(default=True)
+    # Globs, one per line, narrowing which source files are analyzed. If there are
+    # include globs a file must match one; files matching an exclude glob never are.
+    include_globs = BleachField(blank=True, default="")
+    exclude_globs = BleachField(blank=True, default="")
+    # Directories, one per line, to analyze instead of the whole repo (e.g. one product
+    # of a monorepo). Only these are fetched and checked out where the VCS allows.
+    sub_paths = BleachField(blank=True, default="")
+    # Progress of the latest analysis job, written by the job. Blank when there is none running.
+    analysis_status = models.CharField(max_length=DEFAULT_CHAR_LENGTH, blank=True, default="")
+    # Go up whenever the repository or its measurements, scores or benchmarks change, so
+    # clients can tell whether what they have is still current. Each way of writing those
+    # bumps the version once, see bump_version.
+    data_version = models.PositiveIntegerField(default=0)
+    data_modified = models.DateTimeField(default=timezone.now)
 
     class Meta:
         verbose_name_plural = 'Repositories'
@@ -64,17 +83,79 @@ class Repository(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # The version only moves forward: an update adds one to what the database has, rather
+        # than write back the version this copy was loaded with
+        update_fields = kwargs.get('update_fields')
+        if self._state.adding or kwargs.get('force_insert'):
+            return super().save(*args, **kwargs)
+        if update_fields is not None:
+            kwargs['update_fields'] = [name for name in update_fields if name not in VERSION_FIELDS] + \
+                                      list(VERSION_FIELDS)
+        elif not Repository.objects.filter(id=self.id).exists():
+            # Deleted since it was loaded, so this puts it back
+            return super().save(*args, **kwargs)
+        self.data_version = models.F('data_version') + 1
+        self.data_modified = timezone.now()
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['data_version'])
+
+    @staticmethod
+    def bump_version(repos, **fields):
+        """Update the given repositories (a queryset) with the fields, marking their data as changed"""
+        repos.update(data_version=models.F('data_version') + 1, data_modified=timezone.now(), **fields)
+
     def allow_access(self, email):
         """Should we allow access to a user with the given email?"""
-        ret = False
-
-        if self.allowed_emails:
-            if email:
-                ret = email in self.allowed_emails
-        else:  # if no list of emails, allow
-            ret = True
-
-        return ret
+        if self.open_to_all:
+            return True
+        return bool(email) and self.allowed.filter(email=email).exists()
+
+    @staticmethod
+    def visible_to(email):
+        """The repositories a user with the given email can access, as one query"""
+        allowed = models.Q(open_to_all=True)
+        if email:
+            allowed |= models.Q(id__in=AllowedEmail.objects.filter(email=email).values('repository_id'))
+        return Repository.objects.filter(allowed)
+
+    @property
+    def allowed_emails(self) -> list:
+        """Emails of the users allowed to access the repo, empty if it is open to all.
+        Prefetch 'allowed' to get these for many repos at once."""
+        return sorted(allowed.email for allowed in self.allowed.all())
+
+    def set_allowed_emails(self, emails: list):
+        """Allow just the given emails, or everyone if there are none"""
+        emails = set(emails)
+        self.allowed.exclude(email__in=emails).delete()
+        existing = set(self.allowed.values_list('email', flat=True))
+        AllowedEmail.objects.bulk_create(AllowedEmail(repository=self, email=email) for email in emails - existing)
+        self.open_to_all = not emails
+        Repository.bump_version(Repository.objects.filter(id=self.id), open_to_all=self.open_to_all)
+
+    def add_event(self, kind, text: str, job=None):
+        """Append to the repository's event stream, which includes its log"""
+        event = RepositoryEvent(repository=self, job=job, kind=kind, text=text)
+        buffer = getattr(_event_buffer, 'events', None)
+        if buffer is None:
+            event.save()
+            return
+
+        buffer.append(event)
+        # Save log lines in batches, but let everyone know right away when a job moves on.
+        # Things like running Understand come after a new stage, so log lines don't wait on them.
+        if kind is not EventKind.LOG or len(buffer) >= _event_buffer.size:
+            flush_events()
+
+    def get_include_globs(self) -> list:
+        return [line.strip() for line in self.include_globs.splitlines() if line.strip()]
+
+    def get_exclude_globs(self) -> list:
+        return [line.strip() for line in self.exclude_globs.splitlines() if line.strip()]
+
+    def get_sub_paths(self) -> list:
+        return [line.strip() for line in self.sub_paths.splitlines() if line.strip()]
 
     def get_benchmarks(self, uloc: int, core: bool) -> list:
         """ Return a list of benchmarks for this repo, based on predicted or actual lines of code """
@@ -101,10 +182,25 @@ class Repository(models.Model):
             benchmark_dict['repository'] = self
             bm = Benchmark.objects.create(**benchmark_dict)
             new_benchmarks.append(bm)
+        Repository.bump_version(Repository.objects.filter(id=self.id))
 
         return new_benchmarks, grade_percentiles, description
 
 
+class AllowedEmail(models.Model):
+    """A user that can access a repository that isn't open to all"""
+    repository = models.ForeignKey(Repository, related_name='allowed', on_delete=models.CASCADE)
+    email = models.EmailField()
+
+    class Meta:
+        unique_together = ('repository', 'email')
+        # For finding all of a user's repositories
+        indexes = [models.Index(fields=['email', 'repository'])]
+
+    def __str__(self):
+        return self.email
+
+
 class Measurement(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     repository = models.ForeignKey(Repository, related_name='measurements', on_delete=models.CASCADE)
@@ -128,10 +224,26 @@ class Measurement(models.Model):
     # Convenience for scoring logic, write only for the API
     is_core = models.BooleanField()
     components_str = models.TextField(default="", blank=True)
+    # Hash of the analyzable source this was measured from. Not exposed to the API.
+    source_hash = models.CharField(max_length=64, default="", blank=True, db_index=True)
+
+    class Meta:
+        # For paging through a repository's measurements (see MeasurementPagination)
+        indexes = [models.Index(fields=['repository', 'date', 'id'])]
 
     def __str__(self):
         return self.date.strftime("%B %d, %Y")
 
+    def copy_metrics(self) -> dict:
+        """Return the fields and component measurements of this measurement in the
+        form create_from_dict expects, so a revision with identical source can be
+        recorded without analyzing it again. The caller should set date and revision_id."""
+        metrics = {field.name: getattr(self, field.name) for field in self._meta.concrete_fields
+                   if field.name not in ('id', 'date', 'revision_id', 'is_baseline')}
+        metrics['Components'] = list(self.component_measurements.values(
+            'node', 'parent', 'useful_lines', 'threshold_violations', 'full_name'))
+        return metrics
+
     def create_component_measurements(self, component_dicts: list):
         """Turn a list of component measurements represented as dicts into ComponentMeasurement
         objects attached to this measurement.
@@ -172,12 +284,16 @@ class Measurement(models.Model):
         measurement = None
 
         if 'num_files' in metrics:
-            # Jenkins plugin provides a dict with all of the correct fields, but no component measures
+            # Jenkins plugin provides a dict with all of the correct fields, but no component measures.
+            # Copies of earlier measurements (see copy_metrics) bring their components along.
+            components = metrics.pop('Components', None)
             model_fields = metrics
             measurement = Measurement.objects.create(**model_fields)
             treemapdata = metrics.get('components_str')
             # Create the treemap, making an empty one if data not passed in by Jenkins
-            if treemapdata:
+            if components:
+                metrics['Components'] = components
+            elif treemapdata:
                 metrics['Components'] = make_tree_map(treemapdata)
             else:
                 metrics['Components'] = make_tree_map(empty_tree)
@@ -213,6 +329,7 @@ class Measurement(models.Model):
             model_fields['duplicate_uloc'] = metrics.get("duplicate_uloc")
             model_fields['percent_duplicate_uloc'] = metrics.get("percent_duplicate_uloc")
             model_fields['revision_id'] = metrics.get("revision_id")
+            model_fields['source_hash'] = metrics.get("source_hash", "")
             if metrics.get("is_baseline"):
                 model_fields['is_baseline'] = metrics.get("is_baseline")
 
@@ -224,6 +341,7 @@ class Measurement(models.Model):
         # XXX: This makes new benchmarks for each measurement. We want to be smarter
         # and use the one right set of benchmarks against all measurements? -djc 2018-06-11
         measurement.create_scores()
+        Repository.bump_version(Repository.objects.filter(id=repo.id))
 
         return measurement
 
@@ -237,6 +355,10 @@ class ComponentMeasurement(models.Model):
     threshold_violations = models.IntegerField()
     full_name = BleachField(max_length=DEFAULT_CHAR_LENGTH)
 
+    class Meta:
+        # For paging through a measurement's components (see ComponentPagination)
+        indexes = [models.Index(fields=['measurement', 'full_name', 'id'])]
+
     def __str__(self):
         return "ComponentMeasurement[%s]" % self.node
 
@@ -248,6 +370,9 @@ class MeasurementScore(models.Model):
     grade = BleachField(max_length=DEFAULT_CHAR_LENGTH)
     grade_value = models.FloatField()
 
+    class Meta:
+        indexes = [models.Index(fields=['measurement', 'name', 'id'])]
+
     def __str__(self):
         return "Score[%s = %s (%.1f)]" % self.name, self.grade, self.grade_value
 
@@ -285,3 +410,364 @@ class BenchmarkDescription(models.Model):
             return df[column_name].tolist()
         else:
             return None
+
+
+class JobType(Enum):
+    """Kinds of analysis job. Append only, the values are stored."""
+    UPDATE = 0
+    HISTORY = 1
+    BACKFILL = 2
+
+
+class JobStatus(Enum):
+    PENDING = 0
+    RUNNING = 1
+    PAUSED = 2
+    DONE = 3
+    FAILED = 4
+
+
+class JobStage(Enum):
+    """What a job is doing. A job over several revisions goes through analyzing to
+    scoring once for each."""
+    QUEUED = 0
+    STAGING = 1  # Getting the code into the workspace
+    ANALYZING = 2  # Understand is running
+    PARSING = 3  # Reading Understand's results
+    SCORING = 4  # Saving and scoring the measurement
+    DONE = 5
+    FAILED = 6
+
+
+class JobPriority(Enum):
+    """Scheduling classes. Higher goes first."""
+    BACKFILL = 0
+    HISTORY = 1
+    INGESTION = 2  # Updates asked for by CI, e.g. the Jenkins plugin
+    INTERACTIVE = 3  # Updates a user is waiting on
+
+
+class SamplingPolicy(Enum):
+    """How a backfill picks revisions in its date range"""
+    INTERVAL = 0  # The latest revision at each step of interval_days
+    TAGS = 1  # Every tagged revision, optionally only tags matching tag_pattern
+    EVERY_NTH = 2  # Every nth revision along the mainline
+
+
+class RevisionResult(Enum):
+    PENDING = 0
+    DONE = 1
+    FAILED = 2
+    SKIPPED = 3  # Already measured
+
+
+class AnalysisJob(models.Model):
+    """A unit of analysis work on a repository, e.g. a backfill of its history.
+    Pending jobs are the queue that job runners (see store.runner) claim work from."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    repository = models.ForeignKey(Repository, related_name='jobs', on_delete=models.CASCADE)
+    job_type = EnumField(JobType)
+    status = EnumField(JobStatus, default=JobStatus.PENDING)
+    stage = EnumField(JobStage, default=JobStage.QUEUED)
+    created = models.DateTimeField(default=timezone.now)
+    # When the job last joined the queue, which is what it ages from (see effective_priority)
+    enqueued = models.DateTimeField(default=timezone.now)
+    # When the job first reached each stage (since it was last queued)
+    staging_started = models.DateTimeField(null=True, blank=True)
+    analyzing_started = models.DateTimeField(null=True, blank=True)
+    parsing_started = models.DateTimeField(null=True, blank=True)
+    scoring_started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    priority = EnumField(JobPriority, default=JobPriority.HISTORY)
+    # Who to notify when the job is done
+    user_email = models.EmailField(blank=True, default="")
+    # For updates: the zero measurement standing in until the real one is made
+    placeholder = models.ForeignKey(Measurement, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    # The runner working on the job, which must renew its lease until done. A running job
+    # whose lease ran out was abandoned (its worker crashed) and can be claimed again.
+    claimed_by = models.CharField(max_length=DEFAULT_CHAR_LENGTH, blank=True, default="")
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    # When a runner last claimed the job
+    started = models.DateTimeField(null=True, blank=True)
+    # For backfills: which revisions to analyze. Open ended if a date isn't given.
+    start_date = models.DateTimeField(null=True, blank=True)
+    end_date = models.DateTimeField(null=True, blank=True)
+    sampling = EnumField(SamplingPolicy, default=SamplingPolicy.INTERVAL)
+    interval_days = models.IntegerField(default=7)
+    every_nth = models.IntegerField(default=1)
+    tag_pattern = BleachField(blank=True, default="")
+    # Progress
+    total_revisions = models.IntegerField(default=0)
+    completed_revisions = models.IntegerField(default=0)
+    # For bisecting histories: how much of the bisection budget has been spent, over all runs
+    bisected_revisions = models.IntegerField(default=0)
+    error = BleachField(blank=True, default="")
+
+    # The runner working on this copy of the job, see hold_lease
+    worker = None
+    lease_lost = None
+
+    def __str__(self):
+        return "AnalysisJob[%s %s]" % (self.job_type.name, self.status.name)
+
+    def set_status(self, status: JobStatus, error: str = None):
+        """Save just the status (and error), so progress saved elsewhere isn't overwritten"""
+        self.check_lease()
+        self.status = status
+        fields = ['status']
+        if error is not None:
+            self.error = error
+            fields.append('error')
+        if status in (JobStatus.DONE, JobStatus.FAILED):
+            self.stage = JobStage.DONE if status is JobStatus.DONE else JobStage.FAILED
+            self.finished = timezone.now()
+            fields += ['stage', 'finished']
+        self.save(update_fields=fields)
+        self.publish_progress()
+        if 'stage' in fields:
+            self.repository.add_event(EventKind.STAGE, self.stage.name.lower(), self)
+
+    def enter_stage(self, stage: JobStage):
+        """Record that the job has moved on to the given stage"""
+        if stage is self.stage:
+            return
+        self.stage = stage
+        fields = ['stage']
+        timestamp = STAGE_TIMESTAMPS.get(stage)
+        if timestamp and not getattr(self, timestamp):
+            setattr(self, timestamp, timezone.now())
+            fields.append(timestamp)
+        self.save(update_fields=fields)
+        self.repository.add_event(EventKind.STAGE, stage.name.lower(), self)
+
+    def add_revisions(self, count: int, finished: int = 0):
+        """Count revisions added to the job, some of which may need no work"""
+        self.total_revisions += count
+        self.completed_revisions += finished
+        self.save(update_fields=['total_revisions', 'completed_revisions'])
+        self.publish_progress()
+
+    def add_bisected_revision(self):
+        """Count a revision analyzed to bisect the history against the job's budget"""
+        self.bisected_revisions += 1
+        self.save(update_fields=['bisected_revisions'])
+
+    def finish_revision(self, job_rev, result, measurement=None, error: str = ""):
+        """Record the outcome of one of the job's revisions. A failed revision counts
+        as finished, and doesn't count again if a retry measures it."""
+        newly_finished = job_rev.result is RevisionResult.PENDING
+        job_rev.result = result
+        job_rev.measurement = measurement
+        job_rev.error = error
+        job_rev.save()
+        if newly_finished:
+            self.completed_revisions += 1
+            self.save(update_fields=['completed_revisions'])
+        self.publish_progress()
+
+    def publish_progress(self):
+        """Show how far along the job is on its repository, e.g. "history running: 3/6 revisions
+        done", or nothing once it is done"""
+        status = ""
+        if self.status is not JobStatus.DONE:
+            status = "%s %s: %d/%d revisions done" % (self.job_type.name.lower(), self.status.name.lower(),
+                                                       self.completed_revisions, self.total_revisions)
+        # Just the one field, so nothing else is written back from a copy of the repository loaded earlier
+        Repository.bump_version(Repository.objects.filter(id=self.repository_id), analysis_status=status)
+
+    def requeue(self):
+        """Put the job back in the queue, e.g. to resume it"""
+        self.status = JobStatus.PENDING
+        self.stage = JobStage.QUEUED
+        self.attempts = 0
+        self.enqueued = timezone.now()
+        for timestamp in STAGE_TIMESTAMPS.values():
+            setattr(self, timestamp, None)
+        self.save(update_fields=['status', 'stage', 'attempts', 'enqueued'] + list(set(STAGE_TIMESTAMPS.values())))
+        self.publish_progress()
+
+    @staticmethod
+    def claimable() -> models.Q:
+        """Jobs waiting to run, or that were running but whose runner stopped renewing the lease.
+        A pending job still leased is a paused one whose runner hasn't finished up yet."""
+        now = timezone.now()
+        unleased = models.Q(lease_expires__isnull=True) | models.Q(lease_expires__lt=now)
+        return (models.Q(status=JobStatus.PENDING) & unleased) | \
+               models.Q(status=JobStatus.RUNNING, lease_expires__lt=now)
+
+    @staticmethod
+    def effective_priority(priority: JobPriority, enqueued, now) -> int:
+        """A job moves up a class for each aging period it has waited since it was queued at
+        that priority, so low priority work still gets done when the queue never empties"""
+        if CBRI_JOB_AGING_MINUTES <= 0:
+            return priority.value
+        waited = (now - enqueued) // datetime.timedelta(minutes=CBRI_JOB_AGING_MINUTES)
+        return min(priority.value + waited, JobPriority.INTERACTIVE.value)
+
+    @classmethod
+    def queue_order(cls) -> list:
+        """Ids of the claimable jobs in the order they should run: by (aged) priority class,
+        then within a class the organizations with the fewest jobs running go first, so one
+        organization queueing a lot of work doesn't hold everyone else up. Longest waiting first after that."""
+        now = timezone.now()
+        running = Counter(cls.objects.filter(status=JobStatus.RUNNING, lease_expires__gte=now)
+                          .values_list('repository__organization_id', flat=True))
+        candidates = cls.objects.filter(cls.claimable()).values_list(
+            'id', 'priority', 'enqueued', 'repository__organization_id')
+
+        def rank(candidate):
+            job_id, priority, enqueued, organization = candidate
+            return -cls.effective_priority(priority, enqueued, now), running[organization], enqueued
+
+        return [candidate[0] for candidate in sorted(candidates, key=rank)]
+
+    @classmethod
+    def claim_next(cls, worker: str, lease_seconds: int):
+        """Atomically take the next job off the queue for the given worker and return it,
+        or None if there is nothing to do. Each claim is a conditional update, so any number
+        of workers on any number of hosts can share the queue."""
+        for job_id in cls.queue_order()[:10]:
+            now = timezone.now()
+            claimed = cls.objects.filter(cls.claimable(), id=job_id).update(
+                status=JobStatus.RUNNING, claimed_by=worker, attempts=models.F('attempts') + 1,
+                started=now, lease_expires=now + datetime.timedelta(seconds=lease_seconds))
+            if claimed:
+                return cls.objects.get(id=job_id)
+            # Someone else got it first
+        return None
+
+    @classmethod
+    def queue_stats(cls) -> list:
+        """For each priority class: how many jobs are queued and running, how long the oldest
+        queued job has waited, and how long jobs started in the last day waited on average"""
+        now = timezone.now()
+        stats = []
+        for priority in sorted(JobPriority, key=lambda p: p.value, reverse=True):
+            jobs = cls.objects.filter(priority=priority)
+            oldest = jobs.filter(status=JobStatus.PENDING).aggregate(oldest=models.Min('enqueued'))['oldest']
+            waits = [started - enqueued for enqueued, started in
+                     jobs.filter(started__gte=now - datetime.timedelta(days=1)).values_list('enqueued', 'started')]
+            stats.append({'priority': priority.name,
+                          'queued': jobs.filter(status=JobStatus.PENDING).count(),
+                          'running': jobs.filter(status=JobStatus.RUNNING).count(),
+                          'oldest_wait_seconds': (now - oldest).total_seconds() if oldest else 0,
+                          'mean_wait_seconds': (sum(waits, datetime.timedelta()) / len(waits)).total_seconds()
+                          if waits else 0})
+        return stats
+
+    def renew_lease(self, worker: str, lease_seconds: int) -> bool:
+        """Returns False if the job has been claimed by someone else in the meantime"""
+        return bool(AnalysisJob.objects.filter(id=self.id, claimed_by=worker).update(
+            lease_expires=timezone.now() + datetime.timedelta(seconds=lease_seconds)))
+
+    def release(self, worker: str):
+        AnalysisJob.objects.filter(id=self.id, claimed_by=worker).update(claimed_by="", lease_expires=None)
+
+    def is_paused(self) -> bool:
+        """Has someone paused this job since it was loaded?"""
+        self.refresh_from_db(fields=['status'])
+        return self.status is JobStatus.PAUSED
+
+    def hold_lease(self, worker: str):
+        """Run this copy of the job for the worker, which must hold the lease on it to record anything"""
+        self.worker = worker
+        self.lease_lost = threading.Event()
+
+    def has_lease(self) -> bool:
+        """Does the worker running this copy of the job still hold the lease? Always true
+        for a job run outside of a runner."""
+        if self.worker is None:
+            return True
+        if not self.lease_lost.is_set() and \
+                not AnalysisJob.objects.filter(id=self.id, claimed_by=self.worker).exists():
+            self.lease_lost.set()
+        return not self.lease_lost.is_set()
+
+    def check_lease(self):
+        """Checked before recording results, so a runner that lost the job to another doesn't
+        go on writing alongside it"""
+        if not self.has_lease():
+            raise RuntimeError("Lost the lease on job %s to another runner" % self.id)
+
+    def should_stop(self) -> bool:
+        """Has the job been paused, or its lease lost, since it was loaded?"""
+        return self.is_paused() or not self.has_lease()
+
+
+# The AnalysisJob field recording when the job reached each stage
+STAGE_TIMESTAMPS = {JobStage.STAGING: 'staging_started',
+                    JobStage.ANALYZING: 'analyzing_started',
+                    JobStage.PARSING: 'parsing_started',
+                    JobStage.SCORING: 'scoring_started',
+                    JobStage.DONE: 'finished',
+                    JobStage.FAILED: 'finished'}
+
+
+class JobRevision(models.Model):
+    """One revision a job has to analyze, and how that went"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job = models.ForeignKey(AnalysisJob, related_name='revisions', on_delete=models.CASCADE)
+    revision_id = BleachField(max_length=DEFAULT_CHAR_LENGTH)
+    date = models.DateTimeField()
+    result = EnumField(RevisionResult, default=RevisionResult.PENDING)
+    measurement = models.ForeignKey(Measurement, null=True, blank=True, on_delete=models.SET_NULL)
+    error = BleachField(blank=True, default="")
+
+    def __str__(self):
+        return "JobRevision[%s %s]" % (self.revision_id, self.result.name)
+
+
+# Events saved in batches, per thread, see buffered_events
+_event_buffer = threading.local()
+
+
+@contextmanager
+def buffered_events(size: int):
+    """Within this, events are saved a batch of the given size at a time rather than one by one.
+    What's left is saved at the end."""
+    if size <= 1 or getattr(_event_buffer, 'events', None) is not None:
+        yield
+        return
+
+    _event_buffer.events = []
+    _event_buffer.size = size
+    try:
+        yield
+    finally:
+        try:
+            flush_events()
+        finally:
+            _event_buffer.events = None
+
+
+def flush_events():
+    events = _event_buffer.events
+    if not events:
+        return
+    _event_buffer.events = []
+    # Skip those of repositories deleted in the meantime
+    existing = set(Repository.objects.filter(id__in={e.repository_id for e in events}).values_list('id', flat=True))
+    RepositoryEvent.objects.bulk_create([e for e in events if e.repository_id in existing])
+
+
+class EventKind(Enum):
+    LOG = 0  # A line of the repository log
+    STAGE = 1  # A job moved on to another stage
+
+
+class RepositoryEvent(models.Model):
+    """Something that happened to a repository, in order. Only ever appended to, so
+    a client that has seen up to some event only needs the ones after it."""
+    id = models.BigAutoField(primary_key=True)
+    repository = models.ForeignKey(Repository, related_name='events', on_delete=models.CASCADE)
+    job = models.ForeignKey(AnalysisJob, null=True, blank=True, related_name='events', on_delete=models.SET_NULL)
+    kind = EnumField(EventKind)
+    text = models.TextField()
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['repository', 'id']), models.Index(fields=['job', 'id'])]
+
+    def __str__(self):
+        return "RepositoryEvent[%s %s]" % (self.kind.name, self.text)
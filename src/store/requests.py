@@ -1,17 +1,29 @@
 from store.models import InsightUser
 
+# Where the InsightUser is kept on the request once it has been looked up, along with
+# the id of the user it was looked up for
+INSIGHT_USER_ATTR = '_cbri_insight_user'
+
 
 def get_insight_user(request):
-    """Return InsightUser for the given request or None if it doesn't have one"""
+    """Return InsightUser for the given request or None if it doesn't have one.
+    Looked up once per request; permissions, views and serializers all ask for it."""
     ret = None
     if request and hasattr(request, "user"):
         user = request.user
         # Watch out for anonymous user in case we're debugging during development
         if user.id:
-            user_list = InsightUser.objects.filter(user=user)
+            # Kept on the underlying HttpRequest, so it's shared by every DRF Request wrapping it
+            http_request = getattr(request, '_request', request)
+            cached = getattr(http_request, INSIGHT_USER_ATTR, None)
+            if cached and cached[0] == user.id:
+                return cached[1]
+
+            user_list = list(InsightUser.objects.filter(user=user).select_related('user')[:2])
             # If exactly one user, return.
             if len(user_list) == 1:
                 ret = user_list[0]
+            setattr(http_request, INSIGHT_USER_ATTR, (user.id, ret))
 
     return ret
 
@@ -0,0 +1,133 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import django
+from django.db import connections, close_old_connections
+
+from cbri.reporting import log_to_repo
+from cbri.settings import CBRI_RUNNER_SLOTS, CBRI_JOB_LEASE_SECONDS, CBRI_RUNNER_POLL_SECONDS, \
+    CBRI_JOB_MAX_ATTEMPTS
+from .background import run_job
+from .models import AnalysisJob, JobStatus
+
+"""
+Runs queued analysis jobs. Each runner claims jobs off the AnalysisJob table and runs
+up to a number of them at once in a pool of processes. There's no broker, the claims
+are conditional updates in the database, so runners on several hosts can share the
+queue. A runner renews the lease on each of its jobs while it works on it; if the
+runner dies, the lease runs out and another runner picks the job up again. A runner
+that finds it has lost the lease (it stalled for too long) stops the job rather than
+race the runner that has it now.
+"""
+
+logger = logging.getLogger('cbri')
+
+
+def get_worker_name() -> str:
+    return "%s:%d" % (socket.gethostname(), os.getpid())
+
+
+def keep_lease(job: AnalysisJob, worker: str, stop: threading.Event, lease_seconds: int):
+    """Renew the lease on the job until told to stop"""
+    try:
+        while not stop.wait(lease_seconds / 3):
+            if not job.renew_lease(worker, lease_seconds):
+                logger.warning("Lost the lease on %s to another runner" % job.id)
+                # The job stops at its next revision, and records nothing more
+                job.lease_lost.set()
+                return
+    finally:
+        connections.close_all()
+
+
+def execute_job(job_id, worker: str, lease_seconds: int = CBRI_JOB_LEASE_SECONDS):
+    """Run a job claimed by the worker. This runs in a pool process."""
+    job = AnalysisJob.objects.select_related('repository').get(id=job_id)
+    job.hold_lease(worker)
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=keep_lease, args=(job, worker, stop, lease_seconds), daemon=True)
+    heartbeat.start()
+    try:
+        run_job(job)
+    except Exception as e:
+        if job.has_lease():
+            log_to_repo(job.repository, str(e), exception=True, job=job)
+            job.set_status(JobStatus.FAILED, str(e))
+        else:
+            # It's up to the runner that has it now
+            logger.warning("Stopped %s after losing the lease on it" % job.id)
+    finally:
+        stop.set()
+        heartbeat.join()
+        job.release(worker)
+        connections.close_all()
+
+
+class JobRunner:
+    """Keeps a number of slots busy with jobs from the queue"""
+
+    def __init__(self, slots: int = CBRI_RUNNER_SLOTS, worker: str = None,
+                 lease_seconds: int = CBRI_JOB_LEASE_SECONDS, max_attempts: int = CBRI_JOB_MAX_ATTEMPTS):
+        if slots < 1:
+            raise RuntimeError("A job runner needs at least one slot")
+        self.slots = slots
+        self.worker = worker or get_worker_name()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def claim(self):
+        """The next job to run, or None if the queue is empty. Jobs that keep taking
+        their runner down with them are given up on."""
+        while True:
+            job = AnalysisJob.claim_next(self.worker, self.lease_seconds)
+            if not job or job.attempts <= self.max_attempts:
+                return job
+            job.set_status(JobStatus.FAILED, "Gave up after %d attempts" % (job.attempts - 1))
+            job.release(self.worker)
+            log_to_repo(job.repository, "Gave up on job %s after %d attempts" % (job.id, job.attempts - 1), job=job)
+
+    def run(self, once: bool = False):
+        """Run jobs until interrupted. With once, stop when the queue is empty and the
+        jobs already started are done."""
+        logger.info("Job runner %s started with %d slots" % (self.worker, self.slots))
+        # Spawned, not forked, so the pool processes don't share the database connection
+        context = multiprocessing.get_context('spawn')
+        while True:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.slots, mp_context=context,
+                                                        initializer=django.setup) as pool:
+                if self.run_pool(pool, once):
+                    return
+            # A pool process died and took the pool with it. Its job is reclaimed once the lease runs out.
+            logger.warning("Job runner %s restarting its process pool" % self.worker)
+
+    def run_pool(self, pool, once: bool) -> bool:
+        """Returns False if the pool broke"""
+        running = set()
+        while True:
+            close_old_connections()
+            while len(running) < self.slots:
+                job = self.claim()
+                if not job:
+                    break
+                logger.info("Job runner %s starting %s %s" % (self.worker, job, job.id))
+                running.add(pool.submit(execute_job, job.id, self.worker, self.lease_seconds))
+
+            if not running:
+                if once:
+                    return True
+                time.sleep(CBRI_RUNNER_POLL_SECONDS)
+                continue
+
+            done, running = concurrent.futures.wait(running, timeout=CBRI_RUNNER_POLL_SECONDS,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+                    return False
+                if error:
+                    logger.error("Job runner %s: %s" % (self.worker, error))
@@ -1,7 +1,13 @@
+from collections import OrderedDict
+
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import HyperlinkedRelatedField, HyperlinkedIdentityField
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueValidator
+# Aliased, the models bring in the model field of the same name
+from enumfields.drf import EnumField as EnumChoiceField
 from rest_framework_nested.relations import NestedHyperlinkedIdentityField, NestedHyperlinkedRelatedField
 
 from analysis import understand_analysis
@@ -10,9 +16,9 @@ from analysis.manager.fake_analysis_manager import FakeAnalysisManager
 from analysis.tree_helper import make_tree_map, empty_tree
 from cbri.reporting import UserNotification, logger, log_to_repo
 from store.requests import get_user_email
-from vcs.repo_type import get_repo_type
+from vcs.repo_type import get_repo_type, RepoType
 from .models import *
-from .background import create_history, update_repo
+from .background import queue_history, queue_update, find_active_job
 
 # Commonly used
 URL = 'url'
@@ -78,8 +84,45 @@ class InsightUserSerializer(serializers.HyperlinkedModelSerializer):
         return instance
 
 
+class LineListField(serializers.ListField):
+    """A list of strings stored in the model as one string per line"""
+
+    def to_representation(self, data):
+        return [line for line in data.splitlines() if line.strip()]
+
+    def to_internal_value(self, data):
+        return "\n".join(line.strip() for line in super().to_internal_value(data) if line.strip())
+
+
+def requested_fields(request):
+    """The fields asked for with the fields parameter of a read, or None for all of them"""
+    if not request or request.method != 'GET' or not request.query_params.get('fields'):
+        return None
+    return [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+
+
+def check_fields(requested: list, available) -> list:
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise ValidationError("Unknown fields: %s. Choose from %s." % (", ".join(unknown), ", ".join(available)))
+    return requested
+
+
+class SparseFieldsMixin:
+    """Serializes only the fields a read asks for with fields=name,name,... Links and
+    nested lists left out aren't worked out at all."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = requested_fields(self.context.get('request'))
+        if requested is None:
+            return fields
+        check_fields(requested, fields)
+        return OrderedDict((name, field) for name, field in fields.items() if name in requested)
+
+
 # Nest location
-class RepositorySerializer(serializers.HyperlinkedModelSerializer):
+class RepositorySerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     measurements = HyperlinkedIdentityField(
         view_name='measurement-list',
         lookup_url_kwarg='repo'
@@ -95,12 +138,24 @@ class RepositorySerializer(serializers.HyperlinkedModelSerializer):
         lookup_url_kwarg='repo'
     )
 
+    # The log can get long, so it's fetched separately, a page at a time
+    log_entries = HyperlinkedIdentityField(
+        view_name='log_entry-list',
+        lookup_url_kwarg='repo'
+    )
+
     allowed_emails = serializers.ListField(child=serializers.CharField(), required=False, default=[])
 
+    include_globs = LineListField(child=serializers.CharField(), required=False)
+    exclude_globs = LineListField(child=serializers.CharField(), required=False)
+    sub_paths = LineListField(child=serializers.CharField(), required=False)
+
     class Meta:
         model = Repository
         fields = (URL, 'id', 'name', 'organization', 'description', 'topics', 'language', 'address',
-                  'allowed_emails', 'measurements', 'benchmarks', 'benchmarkdescription', 'token', 'log')
+                  'allowed_emails', 'include_globs', 'exclude_globs', 'sub_paths',
+                  'measurements', 'benchmarks', 'benchmarkdescription', 'token', 'log_entries', 'analysis_status')
+        read_only_fields = ('analysis_status',)
         extra_kwargs = {
             'token': {'write_only': True}
         }
@@ -118,6 +173,13 @@ class RepositorySerializer(serializers.HyperlinkedModelSerializer):
         """ Return the email listed for the current user """
         return get_user_email(self.context.get("request"))
 
+    def update(self, instance, validated_data):
+        allowed_emails = validated_data.pop("allowed_emails", None)
+        instance = super().update(instance, validated_data)
+        if allowed_emails is not None:
+            instance.set_allowed_emails(allowed_emails)
+        return instance
+
     def create(self, validated_data):
 
         # Remove token from print version
@@ -143,16 +205,16 @@ class RepositorySerializer(serializers.HyperlinkedModelSerializer):
 
         # Add the current user as the only person that can access
         # the new repo til they add more people
+        allowed_emails = validated_data.pop("allowed_emails", [])
         current_user_email = self.get_current_user_email()
         if current_user_email:
-            validated_data["allowed_emails"] = [current_user_email,]
-
-        # Add in the log string
-        validated_data['log'] = log_msg
+            allowed_emails = [current_user_email,]
 
         # Make the repo per usual
         repo = Repository.objects.create(**validated_data)
-        create_history(str(repo.id), current_user_email)
+        repo.set_allowed_emails(allowed_emails)
+        repo.add_event(EventKind.LOG, log_msg)
+        queue_history(repo, current_user_email)
         return repo
 
 
@@ -165,7 +227,7 @@ MEASUREMENT_FIELDS = ('date', 'revision_id', 'architecture_type', 'propagation_c
                       'duplicate_uloc', 'percent_duplicate_uloc', 'is_core', 'components_str')
 
 
-class MeasurementSerializer(serializers.HyperlinkedModelSerializer):
+class MeasurementSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = NestedHyperlinkedIdentityField(view_name='measurement-detail',
                                          parent_lookup_kwargs={'repo': 'repository__id'})
 
@@ -186,14 +248,20 @@ class MeasurementSerializer(serializers.HyperlinkedModelSerializer):
 
     is_core = serializers.BooleanField(write_only=True, allow_null=True)
 
+    # Only for a queued update: the job that fills in the measurement
+    job = serializers.SerializerMethodField()
+
     class Meta:
         model = Measurement
-        fields = (URL, 'repository') + MEASUREMENT_FIELDS + ('component_measurements', 'scores', 'revision_id', 'is_baseline')
+        fields = (URL, 'repository') + MEASUREMENT_FIELDS + ('component_measurements', 'scores', 'revision_id',
+                                                             'is_baseline', 'job')
         extra_kwargs = {
             'components_str': {'write_only': True}
         }
 
     fake_weeks = None
+    # Set by CI (e.g. the Jenkins plugin) asking for an update no user is waiting on
+    ingestion = False
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -208,6 +276,8 @@ class MeasurementSerializer(serializers.HyperlinkedModelSerializer):
                 if fake_param:
                     self.fake_weeks = int(fake_param)
 
+                self.ingestion = str(request.data.get('ingestion', '')).lower() in ('1', 'true')
+
     # Turn off required for everything - we expect an empty post
     def get_fields(self):
         fields = super().get_fields()
@@ -222,6 +292,12 @@ class MeasurementSerializer(serializers.HyperlinkedModelSerializer):
         """ Return the email listed for the current user """
         return get_user_email(self.context.get("request"))
 
+    def get_job(self, measurement):
+        job = getattr(measurement, 'queued_job', None)
+        if not job:
+            return None
+        return reverse('job-detail', kwargs={'repo': job.repository_id, 'pk': job.id},
+                       request=self.context.get("request"))
 
     def create(self, validated_data):
         # The view figures out the right repo for us and adds it to validated_data
@@ -248,15 +324,17 @@ class MeasurementSerializer(serializers.HyperlinkedModelSerializer):
                     # Return the most recent fake measurement
                     measurement = history[-1]
             else:
-                # Create an empty measurement with a task to fill it in later
-                faker = FakeAnalysisManager(repo, 1)
-                measurement = faker.make_zero_measurement()
-                update_repo(str(repo.id), str(measurement.id), self.get_current_user_email())
+                # An empty measurement stands in until the update job fills it in. If an update
+                # is already on the way, this joins it instead of queuing another.
+                priority = JobPriority.INGESTION if self.ingestion else JobPriority.INTERACTIVE
+                job = queue_update(repo, self.get_current_user_email(), priority)
+                measurement = job.placeholder
+                measurement.queued_job = job
 
         return measurement
 
 
-class MeasurementScoreSerializer(serializers.HyperlinkedModelSerializer):
+class MeasurementScoreSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = NestedHyperlinkedIdentityField(view_name='score-detail',
                                          parent_lookup_kwargs={'measurement': 'measurement__id',
                                                                'repo': 'measurement__repository__id'})
@@ -269,7 +347,7 @@ class MeasurementScoreSerializer(serializers.HyperlinkedModelSerializer):
         fields = (URL, 'measurement', 'name', 'grade', 'grade_value')
 
 
-class ComponentMeasurementSerializer(serializers.HyperlinkedModelSerializer):
+class ComponentMeasurementSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = NestedHyperlinkedIdentityField(view_name='component-detail',
                                          parent_lookup_kwargs={'measurement': 'measurement__id',
                                                                'repo': 'measurement__repository__id'})
@@ -282,7 +360,7 @@ class ComponentMeasurementSerializer(serializers.HyperlinkedModelSerializer):
         fields = (URL, 'measurement', 'node', 'parent', 'useful_lines', 'threshold_violations', 'full_name')
 
 
-class BenchmarkSerializer(serializers.HyperlinkedModelSerializer):
+class BenchmarkSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = NestedHyperlinkedIdentityField(view_name='benchmark-detail',
                                          parent_lookup_kwargs={'repo': 'repository__id'})
     repository = HyperlinkedRelatedField(read_only=True, view_name='repository-detail')
@@ -293,7 +371,7 @@ class BenchmarkSerializer(serializers.HyperlinkedModelSerializer):
                   'upper_threshold', 'num_cases')
 
 
-class BenchmarkDescriptionSerializer(serializers.HyperlinkedModelSerializer):
+class BenchmarkDescriptionSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     url = NestedHyperlinkedIdentityField(view_name='benchmark_description-detail',
                                          parent_lookup_kwargs={'repo': 'repository__id'})
 
@@ -301,4 +379,140 @@ class BenchmarkDescriptionSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = BenchmarkDescription
-        fields = (URL, 'repository', 'num_projects', 'selection_type', 'date', 'project_data')
\ No newline at end of file
+        fields = (URL, 'repository', 'num_projects', 'selection_type', 'date', 'project_data')
+
+
+# What a repository's page shows, all in one response without links to follow. The
+# measurements and benchmarks are the same as in their own lists, less the links.
+class DashboardScoreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MeasurementScore
+        fields = ('name', 'grade', 'grade_value')
+
+
+class DashboardMeasurementSerializer(serializers.ModelSerializer):
+    scores = DashboardScoreSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Measurement
+        fields = ('id',) + tuple(field for field in MEASUREMENT_FIELDS if field not in ('is_core', 'components_str')) + \
+                 ('is_baseline', 'scores')
+        read_only_fields = fields
+
+
+class DashboardBenchmarkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Benchmark
+        fields = ('measurement_name', 'percentile_25', 'percentile_50', 'upper_threshold', 'num_cases')
+
+
+class DashboardBenchmarkDescriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BenchmarkDescription
+        fields = ('num_projects', 'selection_type', 'date', 'project_data')
+
+
+class RepositoryDashboardSerializer(serializers.ModelSerializer):
+    """A repository with its latest measurements (as many as the measurement_count in
+    the context), their scores, and its benchmarks, in a fixed number of queries"""
+    url = HyperlinkedIdentityField(view_name='repository-detail')
+    allowed_emails = serializers.ListField(child=serializers.CharField(), read_only=True)
+    latest_measurements = serializers.SerializerMethodField()
+    benchmarks = serializers.SerializerMethodField()
+    benchmark_description = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Repository
+        fields = (URL, 'id', 'name', 'description', 'topics', 'language', 'address', 'allowed_emails',
+                  'analysis_status', 'latest_measurements', 'benchmarks', 'benchmark_description')
+
+    def get_latest_measurements(self, repo):
+        scores = Prefetch('scores', queryset=MeasurementScore.objects.order_by('name'))
+        measurements = list(repo.measurements.exclude(architecture_type='UNDEFINED').order_by('-date', '-id')
+                            .prefetch_related(scores)[:self.context.get('measurement_count', 10)])
+        # Oldest first, like the measurement list
+        measurements.reverse()
+        return DashboardMeasurementSerializer(measurements, many=True).data
+
+    def get_benchmarks(self, repo):
+        return DashboardBenchmarkSerializer(repo.benchmarks.order_by('measurement_name'), many=True).data
+
+    def get_benchmark_description(self, repo):
+        description = repo.benchmark_descriptions.order_by('-date').first()
+        return DashboardBenchmarkDescriptionSerializer(description).data if description else None
+
+
+class LogEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RepositoryEvent
+        fields = ('id', 'created', 'text', 'job')
+
+
+# When a job reached each stage
+STAGE_FIELDS = ('staging_started', 'analyzing_started', 'parsing_started', 'scoring_started', 'finished')
+
+
+class AnalysisJobStatusSerializer(serializers.ModelSerializer):
+    """Just enough to follow a job's progress, without links or the job's settings"""
+    status = EnumChoiceField(JobStatus, ints_as_names=True, read_only=True)
+    stage = EnumChoiceField(JobStage, ints_as_names=True, read_only=True)
+
+    class Meta:
+        model = AnalysisJob
+        fields = ('id', 'status', 'stage', 'created') + STAGE_FIELDS + \
+                 ('total_revisions', 'completed_revisions', 'error')
+        read_only_fields = fields
+
+
+# What makes two backfills of a repository the same
+BACKFILL_PARAMETERS = ('start_date', 'end_date', 'sampling', 'interval_days', 'every_nth', 'tag_pattern')
+
+
+class AnalysisJobSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    url = NestedHyperlinkedIdentityField(view_name='job-detail',
+                                         parent_lookup_kwargs={'repo': 'repository__id'})
+
+    repository = HyperlinkedRelatedField(read_only=True, view_name='repository-detail')
+
+    job_type = EnumChoiceField(JobType, ints_as_names=True, read_only=True)
+    status = EnumChoiceField(JobStatus, ints_as_names=True, read_only=True)
+    stage = EnumChoiceField(JobStage, ints_as_names=True, read_only=True)
+    priority = EnumChoiceField(JobPriority, ints_as_names=True, read_only=True)
+    sampling = EnumChoiceField(SamplingPolicy, ints_as_names=True, lenient=True, required=False)
+
+    class Meta:
+        model = AnalysisJob
+        fields = (URL, 'id', 'repository', 'job_type', 'status', 'stage', 'priority', 'created', 'enqueued') + \
+                 STAGE_FIELDS + \
+                 ('start_date', 'end_date', 'sampling', 'interval_days', 'every_nth', 'tag_pattern',
+                  'total_revisions', 'completed_revisions', 'error')
+        read_only_fields = ('created', 'enqueued', 'total_revisions', 'completed_revisions', 'error') + STAGE_FIELDS
+
+    def validate(self, data):
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError("The start date must come before the end date.")
+        if data.get('interval_days', 1) < 1 or data.get('every_nth', 1) < 1:
+            raise ValidationError("interval_days and every_nth must be at least 1.")
+        return data
+
+    def create(self, validated_data):
+        # The view figures out the right repo for us and adds it to validated_data
+        repo = validated_data['repository']
+        if repo.type not in (RepoType.GIT, RepoType.HG):
+            raise ValidationError("Backfill needs a Git or Mercurial repository.")
+
+        # The same backfill asked for again joins the one on the way
+        parameters = {field: validated_data.get(field, AnalysisJob._meta.get_field(field).get_default())
+                      for field in BACKFILL_PARAMETERS}
+        job = find_active_job(repo, JobType.BACKFILL, **parameters)
+        if job:
+            log_to_repo(repo, "Backfill already queued: " + str(job.id), job=job)
+            return job
+
+        job = AnalysisJob.objects.create(job_type=JobType.BACKFILL, priority=JobPriority.BACKFILL,
+                                         user_email=get_user_email(self.context.get("request")) or "",
+                                         **validated_data)
+        log_to_repo(repo, "Queued backfill analysis: " + str(job.id), job=job)
+        return job
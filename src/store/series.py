@@ -0,0 +1,85 @@
+import datetime
+
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from cbri.settings import CBRI_SERIES_MAX_POINTS
+from .models import Repository
+
+"""
+A repository's measurements as a time series for charts: the dates, and the values
+of each metric and score at those dates as parallel lists.
+"""
+
+# Measurement fields that can be charted
+SERIES_METRICS = ('propagation_cost', 'useful_lines_of_code', 'num_classes', 'num_files', 'core_size',
+                  'num_files_in_core', 'num_files_overly_complex', 'percent_files_overly_complex',
+                  'useful_lines_of_comments', 'useful_comment_density', 'duplicate_uloc', 'percent_duplicate_uloc')
+
+# The scores every measurement gets (see ScoreGenerator.get_scores)
+SERIES_SCORES = ('architecture', 'complexity', 'clarity', 'overall')
+
+
+def parse_names(value: str, allowed: tuple, what: str) -> tuple:
+    """The comma separated names, all of them if none are given"""
+    if not value:
+        return allowed
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError("Unknown %s: %s. Choose from %s." % (what, ", ".join(unknown), ", ".join(allowed)))
+    return names
+
+
+def parse_time(value: str, end: bool = False):
+    """A date or date and time from the query. A date alone covers the whole day."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if not parsed:
+            day = parse_date(value)
+            if day:
+                parsed = datetime.datetime.combine(day, datetime.time.max if end else datetime.time.min)
+    except ValueError:
+        parsed = None
+    if not parsed:
+        raise ValidationError("Not a date: " + value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_default_timezone())
+    return parsed
+
+
+def downsample(count: int, max_points: int) -> list:
+    """Indexes of at most max_points of count points, evenly spread and keeping the
+    first and last. These are real measurements, not averages, so steps stay steps."""
+    if count <= max_points:
+        return list(range(count))
+    if max_points == 1:
+        return [count - 1]
+    return sorted({round(i * (count - 1) / (max_points - 1)) for i in range(max_points)})
+
+
+def measurement_series(repo: Repository, metrics: tuple = SERIES_METRICS, scores: tuple = SERIES_SCORES,
+                       start=None, end=None, max_points: int = CBRI_SERIES_MAX_POINTS) -> dict:
+    """The repository's measurements between start and end, oldest first, with the scores
+    joined in so it all comes from one query"""
+    measurements = repo.measurements.exclude(architecture_type='UNDEFINED')
+    if start:
+        measurements = measurements.filter(date__gte=start)
+    if end:
+        measurements = measurements.filter(date__lte=end)
+
+    score_columns = {'score_' + name: Max('scores__grade_value', filter=Q(scores__name=name)) for name in scores}
+    rows = list(measurements.annotate(**score_columns).order_by('date', 'id')
+                .values_list('date', *metrics, *score_columns))
+    total = len(rows)
+    rows = [rows[i] for i in downsample(total, max_points)]
+
+    columns = list(zip(*rows)) or [()] * (1 + len(metrics) + len(scores))
+    return {'dates': list(columns[0]),
+            'metrics': {name: list(column) for name, column in zip(metrics, columns[1:])},
+            'scores': {name: list(column) for name, column in zip(scores, columns[1 + len(metrics):])},
+            'total': total}
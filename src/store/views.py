@@ -1,16 +1,262 @@
+import functools
+import hashlib
+import json
+
 from django.conf import settings
-from rest_framework import viewsets
-from rest_framework.generics import CreateAPIView
+from django.core.exceptions import FieldDoesNotExist
+from django.http import StreamingHttpResponse
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_etags
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.generics import CreateAPIView, get_object_or_404
+from rest_framework.pagination import Cursor, CursorPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.permissions import BasePermission
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 import cbri.settings as settings
+from cbri.settings import CBRI_PAGE_SIZE, CBRI_MAX_PAGE_SIZE, CBRI_SERIES_MAX_POINTS
 from cbri.context_processors import selected_settings
+from store.requests import get_insight_user, get_user_email
+from .cache import cache_stats, cached_response, response_key
+from .events import EventStreamRenderer, event_stream, get_last_event_id
+from .series import SERIES_METRICS, SERIES_SCORES, measurement_series, parse_names, parse_time
 from .serializers import *
 
 
+def event_stream_response(events, request, finished=None) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(event_stream(events, get_last_event_id(request), finished),
+                                     content_type=EventStreamRenderer.media_type)
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx hold the events back
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class ConditionalGetMixin:
+    """Lists and details answer with 304 Not Modified, without running the queries or
+    serializing, when the ETag the client has is still current. It comes from the data
+    version of the repository in the URL. There's no Last-Modified: whole seconds are too
+    coarse to tell apart writes made in the same second as a read. Views that set cache_responses
+    also keep their responses in the cache, until the data version changes. Writes through
+    the view bump the data version."""
+
+    cache_responses = False
+
+    def get_data_version(self):
+        """(version, modified) of the data behind the response, or None if there's none"""
+        return Repository.objects.filter(id=self.kwargs['repo']).values_list('data_version', 'data_modified').first()
+
+    def conditional_response(self, request, data_version, respond):
+        if not data_version:
+            return respond()
+        version, modified = data_version
+        # The same data looks different to different users and at different URLs
+        etag = '"%s"' % hashlib.md5(("%s %s %s %s" % (version, modified.isoformat(), request.user.id,
+                                                      request.get_full_path())).encode()).hexdigest()
+        response = get_conditional_response(request, etag=etag)
+        if response is None and self.cache_responses:
+            # Access is decided by email, so those with the same one see the same thing
+            key = response_key(version, modified.isoformat(), get_user_email(request), request.build_absolute_uri())
+            response = cached_response(key, respond)
+        elif response is None:
+            response = respond()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        return response
+
+    def data_changed(self):
+        """Called after a write through the view, to mark the data behind its responses as changed"""
+        Repository.bump_version(Repository.objects.filter(id=self.kwargs['repo']))
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        self.data_changed()
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        self.data_changed()
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        response = super().destroy(request, *args, **kwargs)
+        self.data_changed()
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_data_version(),
+                                         functools.partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, self.get_data_version(),
+                                         functools.partial(super().retrieve, request, *args, **kwargs))
+
+
+class CompactListMixin:
+    """With compact=1, lists are read straight out of the database as plain values,
+    with related objects as their ids and no links, instead of through the serializer."""
+
+    def get_compact_fields(self) -> list:
+        """The serializer's fields that are columns of the model, along with the id"""
+        serializer = self.get_serializer()
+        model = serializer.Meta.model
+        names = ['id']
+        for name, field in serializer.fields.items():
+            if field.write_only or field.source != name or name in names:
+                continue
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and (not model_field.is_relation or model_field.many_to_one):
+                names.append(name)
+        return names
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('compact', '').lower() not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+
+        names = self.get_compact_fields()
+        requested = requested_fields(request)
+        if requested is not None:
+            names = check_fields(requested, names)
+        # The paginator picks up after the last row by its ordering fields, asked for or not
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        ordering = (ordering,) if isinstance(ordering, str) else ordering
+        extra = [field.lstrip('-') for field in ordering if field.lstrip('-') not in names]
+        rows = self.filter_queryset(self.get_queryset()).values(*names, *extra)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            rows = page
+        # Just what was asked for. The paginator keeps the whole rows to make its links from.
+        rows = [{name: row[name] for name in names} for row in rows] if extra else list(rows)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+
+class LogPagination(CursorPagination):
+    """Newest first, follow the next link for older entries"""
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+
+def reverse_ordering(ordering: tuple) -> tuple:
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+
+
+class ListPagination(CursorPagination):
+    """Pages through a list in a fixed order, picking up after the last row of the
+    page before. all=true gets the whole list at once instead, as it used to be.
+
+    The ordering ends in a unique field, and the cursor keeps the value of every field
+    in it, so a page starts right after the last row of the one before by comparing them
+    all, e.g. (date, id) > (last date, last id). That runs off the (..., date, id) index,
+    however many rows share a date and however far into the list it is. DRF's own cursor
+    only compares the first field, and counts past rows that share its value."""
+    page_size = CBRI_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = CBRI_MAX_PAGE_SIZE
+    unpaginated_query_param = 'all'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.unpaginated_query_param, '').lower() in ('1', 'true'):
+            return None
+
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        position = self.cursor.position if self.cursor else None
+
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, self.decode_position(position)))
+
+        # One more than a page, to tell if there's another page
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def after(self, ordering: tuple, values: list) -> Q:
+        """Rows that come after the given values of the ordering fields, e.g. for
+        ('date', 'id'): date > d, or date = d and id > i"""
+        after = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            same = {other.lstrip('-'): value for other, value in zip(ordering[:i], values[:i])}
+            after |= Q(**same, **{name + ('__lt' if field.startswith('-') else '__gt'): values[i]})
+        return after
+
+    def decode_position(self, position: str) -> list:
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        """The values of all the ordering fields. Instances are rows when listing compact values."""
+        values = [instance[field.lstrip('-')] if isinstance(instance, dict) else getattr(instance, field.lstrip('-'))
+                  for field in ordering]
+        return json.dumps([str(value) for value in values])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering) if self.page \
+            else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering) if self.page \
+            else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+
+class MeasurementPagination(ListPagination):
+    ordering = ('date', 'id')
+
+
+class ComponentPagination(ListPagination):
+    ordering = ('full_name', 'id')
+
+
+class ScorePagination(ListPagination):
+    ordering = ('name', 'id')
+
+
+class RepositoryPagination(ListPagination):
+    """Repositories are listed whole, as they always have been, unless a limit or cursor is given"""
+    ordering = ('name', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not {self.page_size_query_param, self.cursor_query_param} & set(request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
 class SettingsAPIView(APIView):
 
     permission_classes = (AllowAny,)
@@ -25,6 +271,20 @@ class SupportedLanguagesAPIView(APIView):
         return Response(getattr(settings, 'SUPPORTED_LANGUAGES', []))
 
 
+class JobQueueAPIView(APIView):
+    """How many analysis jobs are waiting in each priority class, and for how long"""
+
+    def get(self, request, format=None):
+        return Response(AnalysisJob.queue_stats())
+
+
+class ResponseCacheAPIView(APIView):
+    """How often cached responses were used, by the process answering"""
+
+    def get(self, request, format=None):
+        return Response(cache_stats())
+
+
 class OrganizationViewSet(viewsets.ModelViewSet):
     queryset = Organization.objects.all().order_by('name')
     serializer_class = OrganizationSerializer
@@ -58,7 +318,7 @@ class CurrentUserView(APIView):
         if request_user.is_anonymous:
             return Response()
         else:
-            user = InsightUser.objects.filter(user=request_user).first()
+            user = get_insight_user(request)
             serialized_user = InsightUserSerializer(user, context={'request': request})
             return Response(serialized_user.data)
 
@@ -71,9 +331,11 @@ class AllowedByEmail(BasePermission):
         return obj.allow_access(get_user_email(request))
 
 
-class RepositoryViewSet(viewsets.ModelViewSet):
-    queryset = Repository.objects.all().order_by('name')
+class RepositoryViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ModelViewSet):
+    queryset = Repository.objects.all().order_by('name', 'id')
     serializer_class = RepositorySerializer
+    pagination_class = RepositoryPagination
+    cache_responses = True
 
     def get_permissions(self):
         # We want to append one more to the defaults, in the case
@@ -87,21 +349,94 @@ class RepositoryViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         if settings.ENABLE_AUTH:
-            # Have to get weird here, query sets want to do things in terms of DB
-            # queries, so figure out what we want via objects and translate
-            # back to DB world with query set stuff
-            email = get_user_email(self.request)
-
-            allowed_repos = (repo for repo in Repository.objects.all() if repo.allow_access(email))
-            ids = list(map(lambda repo: repo.id, allowed_repos))
-
-            return Repository.objects.filter(id__in=ids).order_by('name')
+            repos = Repository.visible_to(get_user_email(self.request))
         else:
-            return Repository.objects.all().order_by('name')
+            repos = Repository.objects.all()
+        return repos.prefetch_related('allowed').order_by('name', 'id')
+
+    def get_data_version(self):
+        # All the repositories the user can see. Adding or removing one changes the count or
+        # the latest change, any other change the latest change and the sum.
+        versions = self.get_queryset().order_by().aggregate(count=Count('id'), sum=Sum('data_version'),
+                                                             modified=Max('data_modified'))
+        if not versions['count']:
+            return None
+        return "%d.%d" % (versions['count'], versions['sum']), versions['modified']
+
+    def data_changed(self):
+        # Saving a repository bumps its version, and adding or removing one changes the count
+        pass
+
+    def retrieve(self, request, *args, **kwargs):
+        repo = self.get_object()
+        return self.conditional_response(request, (repo.data_version, repo.data_modified),
+                                         lambda: Response(self.get_serializer(repo).data))
+
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, *args, **kwargs):
+        """Server-sent events for the repository's log lines and job stages as they happen,
+        while it has jobs queued or running"""
+        repo = self.get_object()
+        finished = lambda: not repo.jobs.filter(status__in=(JobStatus.PENDING, JobStatus.RUNNING)).exists()
+        return event_stream_response(repo.events.all(), request, finished)
+
+    @action(detail=True, methods=['get'])
+    def series(self, request, *args, **kwargs):
+        """Metrics and scores over time for charts, as parallel lists. Takes the metrics
+        and scores wanted (comma separated, default all), start and end dates, and the
+        most points to return (max_points)."""
+        repo = self.get_object()
+        params = request.query_params
+        try:
+            max_points = min(int(params.get('max_points', CBRI_SERIES_MAX_POINTS)), CBRI_SERIES_MAX_POINTS)
+        except ValueError:
+            raise ValidationError("max_points must be a number.")
+        if max_points < 1:
+            raise ValidationError("max_points must be at least 1.")
+
+        series = functools.partial(measurement_series, repo,
+                                   metrics=parse_names(params.get('metrics'), SERIES_METRICS, "metrics"),
+                                   scores=parse_names(params.get('scores'), SERIES_SCORES, "scores"),
+                                   start=parse_time(params.get('start')),
+                                   end=parse_time(params.get('end'), end=True),
+                                   max_points=max_points)
+        return self.conditional_response(request, (repo.data_version, repo.data_modified),
+                                         lambda: Response(series()))
+
+    @action(detail=True, methods=['get'])
+    def dashboard(self, request, *args, **kwargs):
+        """Everything the repository's page shows at once: the repository, its latest
+        measurements (as many as the measurements parameter, 10 by default) with their
+        scores, and its benchmarks"""
+        repo = self.get_object()
+        try:
+            count = min(int(request.query_params.get('measurements', 10)), CBRI_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError("measurements must be a number.")
+        if count < 1:
+            raise ValidationError("measurements must be at least 1.")
+
+        context = self.get_serializer_context()
+        context['measurement_count'] = count
+        return self.conditional_response(request, (repo.data_version, repo.data_modified),
+                                         lambda: Response(RepositoryDashboardSerializer(repo, context=context).data))
+
+
+class LogEntryViewSet(viewsets.ReadOnlyModelViewSet):
+    """A repository's log, the newest entries first"""
+    serializer_class = LogEntrySerializer
+    pagination_class = LogPagination
+
+    def get_queryset(self):
+        repo = get_object_or_404(Repository, id=self.kwargs['repo'])
+        if settings.ENABLE_AUTH and not repo.allow_access(get_user_email(self.request)):
+            raise PermissionDenied()
+        return repo.events.filter(kind=EventKind.LOG)
 
 
-class MeasurementViewSet(viewsets.ModelViewSet):
+class MeasurementViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = MeasurementSerializer
+    pagination_class = MeasurementPagination
 
     def perform_create(self, serializer):
         repo = Repository.objects.filter(id=self.kwargs['repo']).first()
@@ -109,20 +444,25 @@ class MeasurementViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         repo = self.kwargs['repo']
-        return Measurement.objects.filter(repository=repo).exclude(architecture_type='UNDEFINED').order_by('date')
+        # The nested links go through the repository
+        return Measurement.objects.filter(repository=repo).exclude(architecture_type='UNDEFINED') \
+            .select_related('repository').order_by('date', 'id')
 
 
 # Don't let API user create component measurements
-class ComponentMeasurementViewSet(viewsets.ReadOnlyModelViewSet):
+class ComponentMeasurementViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = ComponentMeasurementSerializer
+    pagination_class = ComponentPagination
 
     def get_queryset(self):
         measurement = self.kwargs['measurement']
-        return ComponentMeasurement.objects.filter(measurement=measurement)
+        return ComponentMeasurement.objects.filter(measurement=measurement).select_related('measurement__repository') \
+            .order_by('full_name', 'id')
 
 
-class MeasurementScoreViewSet(viewsets.ModelViewSet):
+class MeasurementScoreViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = MeasurementScoreSerializer
+    pagination_class = ScorePagination
 
     def perform_create(self, serializer):
         measurement = Measurement.objects.filter(id=self.kwargs['measurement']).first()
@@ -130,11 +470,13 @@ class MeasurementScoreViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         measurement = self.kwargs['measurement']
-        return MeasurementScore.objects.filter(measurement=measurement)
+        return MeasurementScore.objects.filter(measurement=measurement).select_related('measurement__repository') \
+            .order_by('name', 'id')
 
 
-class BenchmarkViewSet(viewsets.ModelViewSet):
+class BenchmarkViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = BenchmarkSerializer
+    cache_responses = True
 
     def perform_create(self, serializer):
         repo = Repository.objects.filter(id=self.kwargs['repo']).first()
@@ -142,11 +484,12 @@ class BenchmarkViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         repo = self.kwargs['repo']
-        return Benchmark.objects.filter(repository=repo)
+        return Benchmark.objects.filter(repository=repo).select_related('repository')
 
 
-class BenchmarkDescriptionViewSet(viewsets.ModelViewSet):
+class BenchmarkDescriptionViewSet(ConditionalGetMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = BenchmarkDescriptionSerializer
+    cache_responses = True
 
     def perform_create(self, serializer):
         repo = Repository.objects.filter(id=self.kwargs['repo']).first()
@@ -154,4 +497,64 @@ class BenchmarkDescriptionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         repo = self.kwargs['repo']
-        return BenchmarkDescription.objects.filter(repository=repo)
\ No newline at end of file
+        return BenchmarkDescription.objects.filter(repository=repo).select_related('repository')
+
+
+# Jobs are created through the API only as backfills, and are never edited, just paused and resumed.
+# Histories are made as jobs too when a repository is created.
+class AnalysisJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                         viewsets.GenericViewSet):
+    serializer_class = AnalysisJobSerializer
+
+    def perform_create(self, serializer):
+        serializer.save(repository=self.get_repository())
+
+    def get_repository(self) -> Repository:
+        """The repository in the URL, if the user may see it"""
+        repo = get_object_or_404(Repository, id=self.kwargs['repo'])
+        if settings.ENABLE_AUTH and not repo.allow_access(get_user_email(self.request)):
+            raise PermissionDenied()
+        return repo
+
+    def get_queryset(self):
+        repo = self.get_repository()
+        return AnalysisJob.objects.filter(repository=repo).select_related('repository').order_by('-created')
+
+    @action(detail=True, methods=['post'])
+    def pause(self, request, *args, **kwargs):
+        """Stop starting new revisions; the ones being analyzed still finish"""
+        # Through get_queryset, so only on repositories the user may see
+        job = self.get_object()
+        if job.status not in (JobStatus.PENDING, JobStatus.RUNNING):
+            raise ValidationError("Only pending or running jobs can be paused.")
+        job.set_status(JobStatus.PAUSED)
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, *args, **kwargs):
+        """Queue the job again, to pick up with the revisions it hasn't analyzed,
+        including any that failed"""
+        job = self.get_object()
+        if job.status not in (JobStatus.PAUSED, JobStatus.FAILED):
+            raise ValidationError("Only paused or failed jobs can be resumed.")
+        job.requeue()
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, *args, **kwargs):
+        """Server-sent events for the job's log lines and stages, until it is done"""
+        job = self.get_object()
+        finished = lambda: not AnalysisJob.objects.filter(id=job.id).exclude(
+            status__in=(JobStatus.DONE, JobStatus.FAILED)).exists()
+        return event_stream_response(job.events.all(), request, finished)
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def job_status(self, request, *args, **kwargs):
+        """A small summary of the job to poll. Send back the ETag as If-None-Match to
+        get 304 Not Modified until something changes."""
+        data = AnalysisJobStatusSerializer(self.get_object()).data
+        etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
@@ -0,0 +1,74 @@
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from store.requests import get_insight_user, get_user_email
+
+from store.models import Repository, InsightUser
+from vcs.repo_type import RepoType
+
+
+class AccessTest(django.test.TestCase):
+
+    def setUp(self):
+        self.open = Repository.objects.create(name="open", type=RepoType.GIT, description="", language="Java")
+        self.mine = Repository.objects.create(name="mine", type=RepoType.GIT, description="", language="Java")
+        self.mine.set_allowed_emails(["me@example.com", "you@example.com"])
+        self.theirs = Repository.objects.create(name="theirs", type=RepoType.GIT, description="", language="Java")
+        self.theirs.set_allowed_emails(["them@example.com"])
+
+    def make_user(self, email):
+        user = User.objects.create(username=email, email=email)
+        InsightUser.objects.create(user=user)
+        return user
+
+    def make_client(self, email):
+        user = self.make_user(email)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_visible_to(self):
+        with self.assertNumQueries(1):
+            names = list(Repository.visible_to("me@example.com").order_by('name').values_list('name', flat=True))
+        self.assertEqual(names, ["mine", "open"])
+        self.assertEqual(list(Repository.visible_to(None).values_list('name', flat=True)), ["open"])
+
+        self.assertTrue(self.mine.allow_access("you@example.com"))
+        self.assertFalse(self.theirs.allow_access("me@example.com"))
+        self.assertFalse(self.theirs.allow_access(None))
+        self.assertTrue(self.open.allow_access(None))
+
+        self.mine.set_allowed_emails([])
+        self.assertTrue(Repository.objects.get(id=self.mine.id).open_to_all)
+        self.assertEqual(self.mine.allowed_emails, [])
+
+    def test_list_repositories(self):
+        client = self.make_client("me@example.com")
+        response = client.get('/api/repositories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([repo['name'] for repo in response.data], ["mine", "open"])
+        self.assertEqual(client.get('/api/repositories/%s/' % self.theirs.id).status_code, 404)
+
+    def test_user_looked_up_once(self):
+        user = self.make_user("me@example.com")
+        http_request = APIRequestFactory().get('/api/repositories/')
+        force_authenticate(http_request, user)
+        request = Request(http_request)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_email(request), "me@example.com")
+            self.assertEqual(get_insight_user(request).user, user)
+            # Another wrapper of the same request, as a nested view would have
+            self.assertEqual(get_user_email(Request(http_request)), "me@example.com")
+
+    def test_user_looked_up_once_per_api_request(self):
+        client = self.make_client("me@example.com")
+        for method, data in (('get', None), ('patch', {'description': "Changed"})):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)('/api/repositories/%s/' % self.mine.id, data, format='json')
+            self.assertEqual(response.status_code, 200)
+            lookups = [query for query in queries.captured_queries if 'store_insightuser' in query['sql']]
+            self.assertEqual(len(lookups), 1)
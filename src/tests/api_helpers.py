@@ -0,0 +1,31 @@
+import django
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from analysis.manager.fake_analysis_manager import FakeAnalysisManager
+from store.models import Repository, InsightUser, MeasurementScore, ComponentMeasurement
+from vcs.repo_type import RepoType
+
+
+class ApiTestCase(django.test.TestCase):
+    """Calls the API as a signed in user, on repositories with made up measurements.
+    With measurement_count set, each test starts with self.repo and its latest self.measurement."""
+
+    measurement_count = 0
+
+    def setUp(self):
+        user = User.objects.create(username="queries", email="queries@example.com")
+        InsightUser.objects.create(user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        if self.measurement_count:
+            self.repo, self.measurement = self.make_measurements(self.measurement_count)
+
+    def make_measurements(self, count):
+        repo = Repository.objects.create(name="queries", type=RepoType.GIT, description="", language="Java")
+        measurement = FakeAnalysisManager(repo, count).make_history()[-1]
+        for i in range(5 * count):
+            MeasurementScore.objects.create(measurement=measurement, name="score%d" % i, grade="A", grade_value=90)
+            ComponentMeasurement.objects.create(measurement=measurement, node="extra%d" % i, parent="",
+                                                useful_lines=i, threshold_violations=0, full_name="extra%d" % i)
+        return repo, measurement
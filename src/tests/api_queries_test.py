@@ -0,0 +1,34 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tests.api_helpers import ApiTestCase
+
+
+class ApiQueriesTest(ApiTestCase):
+    """Listing more rows shouldn't take more queries"""
+
+    def count_queries(self, url) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data)
+        return len(queries)
+
+    def assertConstantQueries(self, make_url):
+        """The same number of queries for few rows as for many"""
+        counts = []
+        for count in (1, 4):
+            repo, measurement = self.make_measurements(count)
+            counts.append(self.count_queries(make_url(repo, measurement)))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_measurements(self):
+        self.assertConstantQueries(lambda repo, measurement: '/api/repositories/%s/measurements/' % repo.id)
+
+    def test_scores(self):
+        self.assertConstantQueries(lambda repo, measurement: '/api/repositories/%s/measurements/%s/scores/' %
+                                   (repo.id, measurement.id))
+
+    def test_components(self):
+        self.assertConstantQueries(lambda repo, measurement: '/api/repositories/%s/measurements/%s/components/' %
+                                   (repo.id, measurement.id))
@@ -0,0 +1,101 @@
+import datetime
+import tempfile
+
+import uuid
+
+import django
+from django.contrib.auth.models import User
+from git import Repo, Actor
+from rest_framework.test import APIClient
+
+from store.models import Repository, InsightUser, AnalysisJob, JobType, JobStatus, SamplingPolicy, RevisionResult
+from vcs.git_helper import GitHelper
+from vcs.repo_type import RepoType
+from tests.fake_managers import FakeUndManager
+
+START = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class BackfillTest(django.test.TestCase):
+
+    def make_repo(self, code_dir, days):
+        """Commit a change to Main.java on each of the given days after START"""
+        git_repo = Repo.init(code_dir)
+        author = Actor("CBRI Test", "test@example.com")
+        revs = []
+        for day in days:
+            with open(code_dir + "/Main.java", 'w') as f:
+                f.write("// Day %d\n" % day)
+            git_repo.index.add(["Main.java"])
+            date = "%d +0000" % (START + datetime.timedelta(days=day)).timestamp()
+            revs.append(git_repo.index.commit("Day %d" % day, author=author, committer=author,
+                                              author_date=date, commit_date=date).hexsha)
+        return revs
+
+    def make_manager(self, code_dir):
+        repo = Repository.objects.create(name="backfill", type=RepoType.GIT, description="", language="Java")
+        manager = FakeUndManager(repo, GitHelper())
+        manager.workspace.code_dir = code_dir
+        return repo, manager
+
+    def test_interval_sampling(self):
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, [0, 1, 8, 9, 20])
+            repo, manager = self.make_manager(code_dir)
+            job = AnalysisJob.objects.create(repository=repo, job_type=JobType.BACKFILL, start_date=START,
+                                             sampling=SamplingPolicy.INTERVAL, interval_days=7)
+
+            picked = [rev for rev, date in manager.get_backfill_revs(job)]
+            self.assertEqual(picked, [revs[1], revs[3], revs[4]])
+
+    def test_every_nth_backfill(self):
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, range(6))
+            repo, manager = self.make_manager(code_dir)
+            job = AnalysisJob.objects.create(repository=repo, job_type=JobType.BACKFILL,
+                                             sampling=SamplingPolicy.EVERY_NTH, every_nth=2)
+
+            manager.plan_backfill(job)
+            measurements = manager.run_backfill(job, repo.name, repo.language)
+
+            self.assertCountEqual([m.revision_id for m in measurements], [revs[1], revs[3], revs[5]])
+            self.assertEqual(job.completed_revisions, 3)
+            self.assertFalse(job.revisions.exclude(result=RevisionResult.DONE).exists())
+
+    def test_pause_and_resume(self):
+        with tempfile.TemporaryDirectory() as code_dir:
+            self.make_repo(code_dir, range(3))
+            repo, manager = self.make_manager(code_dir)
+            job = AnalysisJob.objects.create(repository=repo, job_type=JobType.BACKFILL,
+                                             sampling=SamplingPolicy.EVERY_NTH)
+            manager.plan_backfill(job)
+
+            job.set_status(JobStatus.PAUSED)
+            self.assertEqual(manager.run_backfill(job, repo.name, repo.language), [])
+
+            job.set_status(JobStatus.RUNNING)
+            self.assertEqual(len(manager.run_backfill(job, repo.name, repo.language)), 3)
+            # Nothing left to do, or to plan again
+            manager.plan_backfill(job)
+            self.assertEqual(manager.run_backfill(job, repo.name, repo.language), [])
+            self.assertEqual(repo.measurements.count(), 3)
+
+    def test_api_access(self):
+        """Backfills can only be queued, paused or resumed on repositories the user may see"""
+        repo = Repository.objects.create(name="backfill", type=RepoType.GIT, description="", language="Java")
+        repo.set_allowed_emails(["me@example.com"])
+        job = AnalysisJob.objects.create(repository=repo, job_type=JobType.BACKFILL)
+        user = User.objects.create(username="other", email="other@example.com")
+        InsightUser.objects.create(user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        url = '/api/repositories/%s/jobs/' % repo.id
+        self.assertEqual(client.post(url, {'sampling': 'interval'}, format='json').status_code, 403)
+        self.assertEqual(client.post(url + '%s/pause/' % job.id).status_code, 403)
+        job.set_status(JobStatus.PAUSED)
+        self.assertEqual(client.post(url + '%s/resume/' % job.id).status_code, 403)
+        self.assertEqual(AnalysisJob.objects.get().status, JobStatus.PAUSED)
+
+        response = client.post('/api/repositories/%s/jobs/' % uuid.uuid4(), {'sampling': 'interval'}, format='json')
+        self.assertEqual(response.status_code, 404)
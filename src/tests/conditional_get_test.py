@@ -0,0 +1,54 @@
+import time
+
+from django.utils.http import http_date
+
+from store.models import Repository, JobType
+from tests.api_helpers import ApiTestCase
+
+
+class ConditionalGetTest(ApiTestCase):
+    measurement_count = 3
+
+    def test_not_modified(self):
+        url = '/api/repositories/%s/measurements/' % self.repo.id
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        # Just the lookup of the repository's version
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Seconds are too coarse to go by
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        # Other pages aren't the same
+        self.assertEqual(self.client.get(url + '?limit=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        scores_url = '/api/repositories/%s/measurements/%s/scores/' % (self.repo.id, self.measurement.id)
+        response = self.client.post(scores_url, {'name': "new", 'grade': "A", 'grade_value': 90}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # A stale copy of the repository doesn't take the version back
+        stale = Repository.objects.get(id=self.repo.id)
+        loaded = stale.data_version
+        Repository.objects.get(id=self.repo.id).save()
+        stale.save()
+        self.assertEqual(Repository.objects.get(id=self.repo.id).data_version, loaded + 2)
+        self.assertEqual(stale.data_version, loaded + 2)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Saving a copy of a deleted repository puts it back
+        Repository.objects.filter(id=self.repo.id).delete()
+        stale.save()
+        self.assertTrue(Repository.objects.filter(id=self.repo.id).exists())
+
+    def test_repositories_not_modified(self):
+        for url in ('/api/repositories/', '/api/repositories/%s/' % self.repo.id):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.repo.jobs.create(job_type=JobType.HISTORY).publish_progress()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
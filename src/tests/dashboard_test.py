@@ -0,0 +1,28 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tests.api_helpers import ApiTestCase
+
+
+class DashboardTest(ApiTestCase):
+
+    def test_dashboard(self):
+        """A fixed number of queries, however many measurements there are"""
+        counts = []
+        for count in (2, 6):
+            repo, measurement = self.make_measurements(count)
+            url = '/api/repositories/%s/dashboard/?measurements=4' % repo.id
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            counts.append(len(queries))
+
+            measurements = response.data['latest_measurements']
+            self.assertEqual(len(measurements), min(count, 4))
+            self.assertEqual(measurements[-1]['id'], str(measurement.id))
+            self.assertEqual(len(measurements[-1]['scores']), measurement.scores.count())
+            self.assertEqual(len(response.data['benchmarks']), repo.benchmarks.count())
+            self.assertIsNotNone(response.data['benchmark_description'])
+        self.assertEqual(counts[0], counts[1])
+        # The user, the repository with its allowed emails, the measurements, their scores,
+        # the benchmarks and their description
+        self.assertLessEqual(counts[0], 7)
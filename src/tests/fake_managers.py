@@ -0,0 +1,38 @@
+from analysis.manager.und_vcs_analysis_manager import UndVcsAnalysisManager
+from analysis.tree_helper import make_tree_map, empty_tree
+
+
+def make_metrics(rev, rev_date, uloc=1000) -> dict:
+    """Made up metrics for a revision, in the form Understand's are parsed into"""
+    return {'date': rev_date,
+            'Architecture Type': 'Hierarchical',
+            'core': False,
+            'Propagation Cost': "10.0",
+            'Useful Lines of Code (ULOC)': uloc,
+            'Classes': 10,
+            'Files': 10,
+            'Core Size': "10.0",
+            'Overly Complex Files': "10.0",
+            'Useful Comment Density': "20.0",
+            'duplicate_uloc': uloc // 10,
+            'percent_duplicate_uloc': 10.0,
+            'revision_id': rev,
+            'Components': make_tree_map(empty_tree)}
+
+
+class FakeUndManager(UndVcsAnalysisManager):
+    """Stands in for Understand with made up metrics. Revisions in broken_revs fail to analyze."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.analyzed_revs = []
+        self.broken_revs = set()
+
+    def get_uloc(self, rev) -> int:
+        return 1000
+
+    def analyze_rev(self, project_name, lang, rev, rev_date, on_stage=None):
+        if rev in self.broken_revs:
+            raise RuntimeError("Static code analysis did not produce meaningful results.")
+        self.analyzed_revs.append(rev)
+        return make_metrics(rev, rev_date, self.get_uloc(rev)), None
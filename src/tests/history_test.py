@@ -0,0 +1,135 @@
+import tempfile
+import time
+from unittest import mock
+
+import django
+from git import Repo, Actor
+
+from analysis.manager.und_vcs_analysis_manager import BISECT_HISTORY, metrics_differ
+from store.models import Repository, AnalysisJob, JobType, JobStatus, RevisionResult
+from vcs.git_helper import GitHelper
+from vcs.repo_type import RepoType
+from tests.fake_managers import FakeUndManager
+
+
+class LineCountManager(FakeUndManager):
+    """Lines of code taken from Main.java"""
+
+    def get_uloc(self, rev) -> int:
+        text = Repo(self.workspace.code_dir).git.show(rev + ":Main.java")
+        return 100 * len(text.splitlines())
+
+
+class HistoryTest(django.test.TestCase):
+
+    def make_repo(self, code_dir, line_counts):
+        """Commit Main.java with each of the given numbers of lines, a day apart"""
+        git_repo = Repo.init(code_dir)
+        author = Actor("CBRI Test", "test@example.com")
+        start = int(time.time()) - len(line_counts) * 86400
+        revs = []
+        for i, lines in enumerate(line_counts):
+            with open(code_dir + "/Main.java", 'w') as f:
+                f.write("// Change %d\n" % i + "int x;\n" * (lines - 1))
+            git_repo.index.add(["Main.java"])
+            date = "%d +0000" % (start + i * 86400)
+            revs.append(git_repo.index.commit("Change %d" % i, author=author, committer=author,
+                                              author_date=date, commit_date=date).hexsha)
+        return revs
+
+    def make_job(self, manager, revs):
+        """A history job sampling the given revisions"""
+        job = AnalysisJob.objects.create(repository=manager.repo, job_type=JobType.HISTORY,
+                                         status=JobStatus.RUNNING)
+        for rev in revs:
+            job.revisions.create(revision_id=rev, date=manager.vcs.get_rev_date(manager.workspace.code_dir, rev))
+        job.add_revisions(len(revs))
+        return job
+
+    def make_manager(self, code_dir, **kwargs):
+        repo = Repository.objects.create(name="history", type=RepoType.GIT, description="", language="Java")
+        manager = LineCountManager(repo, GitHelper(), **kwargs)
+        manager.workspace.code_dir = code_dir
+        return manager
+
+    def test_metrics_differ(self):
+        self.assertFalse(metrics_differ({'useful_lines_of_code': 100}, {'useful_lines_of_code': 104}, 5.0))
+        self.assertTrue(metrics_differ({'useful_lines_of_code': 100}, {'useful_lines_of_code': 110}, 5.0))
+        self.assertFalse(metrics_differ({'useful_lines_of_code': 0}, {'useful_lines_of_code': 0}, 5.0))
+
+    def test_bisect_history(self):
+        """Bisection should pin down the commit where the metrics jumped"""
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, [1] * 5 + [10] * 4)
+            manager = self.make_manager(code_dir, history_mode=BISECT_HISTORY)
+            job = self.make_job(manager, [revs[0], revs[-1]])
+
+            manager.run_history(job, "history", "Java")
+
+            measured = set(job.revisions.filter(result=RevisionResult.DONE).values_list('revision_id', flat=True))
+            sampled = [rev for rev in revs if rev in measured]
+            self.assertEqual(sampled[0], revs[0])
+            self.assertEqual(sampled[-1], revs[-1])
+            # The change happened between commits 4 and 5, and both were sampled
+            self.assertEqual(sampled.index(revs[5]), sampled.index(revs[4]) + 1)
+            # Without analyzing every commit
+            self.assertLess(len(manager.analyzed_revs), len(revs))
+
+    def test_resume_after_failure(self):
+        """A failed revision is marked and skipped, and only it is analyzed again on a retry"""
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, [1, 2, 3])
+            manager = self.make_manager(code_dir)
+            job = self.make_job(manager, revs)
+
+            manager.broken_revs = {revs[1]}
+            self.assertEqual(len(manager.run_history(job, "history", "Java")), 2)
+            self.assertEqual(job.revisions.get(revision_id=revs[1]).result, RevisionResult.FAILED)
+            self.assertTrue(job.revisions.get(revision_id=revs[0]).measurement.is_baseline)
+            # Each measurement was published as it finished
+            self.assertEqual(Repository.objects.get(id=manager.repo.id).analysis_status,
+                             "history running: 3/3 revisions done")
+
+            manager.broken_revs = set()
+            manager.analyzed_revs = []
+            self.assertEqual(len(manager.run_history(job, "history", "Java")), 1)
+            self.assertEqual(manager.analyzed_revs, [revs[1]])
+            self.assertEqual(manager.repo.measurements.count(), 3)
+            self.assertEqual(manager.repo.measurements.filter(is_baseline=True).count(), 1)
+            self.assertEqual(job.completed_revisions, 3)
+
+    def test_baseline_is_oldest(self):
+        """The oldest revision is the baseline, even when it's only measured on a retry"""
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, [1, 2, 3])
+            manager = self.make_manager(code_dir)
+            job = self.make_job(manager, revs)
+
+            manager.broken_revs = {revs[0]}
+            manager.run_history(job, "history", "Java")
+            self.assertTrue(job.revisions.get(revision_id=revs[1]).measurement.is_baseline)
+
+            manager.broken_revs = set()
+            manager.run_history(job, "history", "Java")
+            baselines = manager.repo.measurements.filter(is_baseline=True)
+            self.assertEqual(list(baselines.values_list('revision_id', flat=True)), [revs[0]])
+
+    def test_bisect_budget_resumes(self):
+        """Running the job again only spends what's left of the bisection budget"""
+        with tempfile.TemporaryDirectory() as code_dir:
+            revs = self.make_repo(code_dir, [1] * 5 + [10] * 4)
+            manager = self.make_manager(code_dir, history_mode=BISECT_HISTORY)
+            job = self.make_job(manager, [revs[0], revs[-1]])
+
+            with mock.patch('analysis.manager.und_vcs_analysis_manager.CBRI_HISTORY_BISECT_BUDGET', 2):
+                manager.run_history(job, "history", "Java")
+                self.assertEqual(len(manager.analyzed_revs), 4)
+                self.assertEqual(AnalysisJob.objects.get(id=job.id).bisected_revisions, 2)
+
+                manager.analyzed_revs = []
+                manager.run_history(job, "history", "Java")
+                self.assertEqual(manager.analyzed_revs, [])
+
+            with mock.patch('analysis.manager.und_vcs_analysis_manager.CBRI_HISTORY_BISECT_BUDGET', 3):
+                manager.run_history(job, "history", "Java")
+                self.assertEqual(len(manager.analyzed_revs), 1)
@@ -0,0 +1,96 @@
+import django
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from cbri.reporting import log_to_repo
+from store.models import Repository, InsightUser, AnalysisJob, JobType, JobStatus, JobStage
+from vcs.repo_type import RepoType
+
+
+class JobStatusTest(django.test.TestCase):
+
+    def setUp(self):
+        self.repo = Repository.objects.create(name="status", type=RepoType.GIT, description="", language="Java")
+        self.job = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+
+    def test_stages(self):
+        self.job.enter_stage(JobStage.STAGING)
+        self.job.enter_stage(JobStage.ANALYZING)
+        analyzing_started = self.job.analyzing_started
+        self.job.enter_stage(JobStage.SCORING)
+        # The next revision
+        self.job.enter_stage(JobStage.ANALYZING)
+        self.job.set_status(JobStatus.DONE)
+
+        job = AnalysisJob.objects.get(id=self.job.id)
+        self.assertEqual(job.stage, JobStage.DONE)
+        self.assertEqual(job.analyzing_started, analyzing_started)
+        self.assertLessEqual(job.staging_started, job.analyzing_started)
+        self.assertIsNone(job.parsing_started)
+        self.assertIsNotNone(job.finished)
+
+        job.requeue()
+        job = AnalysisJob.objects.get(id=self.job.id)
+        self.assertEqual(job.stage, JobStage.QUEUED)
+        self.assertIsNone(job.staging_started)
+        self.assertIsNone(job.finished)
+
+    def test_not_modified(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="status"))
+        url = '/api/repositories/%s/jobs/%s/status/' % (self.repo.id, self.job.id)
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stage'], 'queued')
+        etag = response['ETag']
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.job.enter_stage(JobStage.STAGING)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stage'], 'staging')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_event_stream(self):
+        """A job's stream has its log lines and stages, resumes after Last-Event-ID, and
+        ends with the job"""
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="status"))
+        url = '/api/repositories/%s/jobs/%s/events/' % (self.repo.id, self.job.id)
+
+        log_to_repo(self.repo, "Not part of the job")
+        log_to_repo(self.repo, "Started", job=self.job)
+        self.job.enter_stage(JobStage.STAGING)
+        self.job.set_status(JobStatus.DONE)
+
+        response = client.get(url, HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = b"".join(response.streaming_content).decode()
+        self.assertNotIn("Not part of the job", stream)
+        self.assertIn("event: log", stream)
+        self.assertIn("event: stage\ndata: {\"text\": \"staging\"", stream)
+        # Finishing is the last thing that happens
+        self.assertIn('"text": "done"', stream.split("event: ")[-1])
+
+        last_id = self.job.events.order_by('id')[1].id
+        stream = b"".join(client.get(url, HTTP_LAST_EVENT_ID=str(last_id)).streaming_content).decode()
+        self.assertNotIn("event: log", stream)
+        self.assertNotIn("staging", stream)
+        self.assertIn("done", stream)
+
+        # The repository's stream has everything, and ends too once no job is left to run
+        stream = b"".join(client.get('/api/repositories/%s/events/' % self.repo.id).streaming_content).decode()
+        self.assertIn("Not part of the job", stream)
+        self.assertIn('"text": "done"', stream)
+
+    def test_job_access(self):
+        """Only those who can see the repository can follow its jobs"""
+        self.repo.set_allowed_emails(["me@example.com"])
+        client = APIClient()
+        user = User.objects.create(username="other", email="other@example.com")
+        InsightUser.objects.create(user=user)
+        client.force_authenticate(user)
+        for route in ('events', 'status'):
+            response = client.get('/api/repositories/%s/jobs/%s/%s/' % (self.repo.id, self.job.id, route))
+            self.assertEqual(response.status_code, 403)
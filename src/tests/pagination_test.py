@@ -0,0 +1,62 @@
+import base64
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.models import MeasurementScore
+from tests.api_helpers import ApiTestCase
+
+
+class PaginationTest(ApiTestCase):
+    measurement_count = 5
+
+    def test_pages(self):
+        """Walking the pages gets every measurement once, in order"""
+        url = '/api/repositories/%s/measurements/?limit=2' % self.repo.id
+        dates = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            dates += [row['date'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(dates), 5)
+        self.assertEqual(dates, sorted(dates))
+
+        # The whole list at once, if asked for
+        response = self.client.get('/api/repositories/%s/measurements/?all=true' % self.repo.id)
+        self.assertEqual([row['date'] for row in response.data], dates)
+
+        response = self.client.get('/api/repositories/%s/measurements/%s/components/?limit=10' %
+                                   (self.repo.id, self.measurement.id))
+        names = [row['full_name'] for row in response.data['results']]
+        self.assertEqual(len(names), 10)
+        self.assertEqual(names, sorted(names))
+
+    def test_pages_with_ties(self):
+        """Rows sharing a name are each listed once, forward and back"""
+        for i in range(5):
+            MeasurementScore.objects.create(measurement=self.measurement, name="tie", grade="A", grade_value=i)
+        expected = list(self.measurement.scores.order_by('name', 'id').values_list('name', 'grade_value'))
+
+        url = '/api/repositories/%s/measurements/%s/scores/?limit=2' % (self.repo.id, self.measurement.id)
+        rows = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            # Picked up right after the last row, not counted past the ones sharing its name
+            self.assertFalse([query for query in queries.captured_queries if 'OFFSET' in query['sql']])
+            rows += [(row['name'], row['grade_value']) for row in response.data['results']]
+            previous, url = response.data['previous'], response.data['next']
+        self.assertEqual(rows, expected)
+
+        # Back from the last page
+        url = previous
+        back = rows[-len(response.data['results']):]
+        while url:
+            response = self.client.get(url)
+            back = [(row['name'], row['grade_value']) for row in response.data['results']] + back
+            url = response.data['previous']
+        self.assertEqual(back, expected)
+        bad_cursor = base64.b64encode(b"p=bogus").decode()
+        self.assertEqual(self.client.get('/api/repositories/%s/measurements/%s/scores/?cursor=%s' %
+                                         (self.repo.id, self.measurement.id, bad_cursor)).status_code, 404)
@@ -1,6 +1,10 @@
 import django
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
 
-from cbri.reporting import UserNotification
+from cbri.reporting import UserNotification, log_to_repo
+from store.models import Repository, RepositoryEvent, buffered_events
+from vcs.repo_type import RepoType
 
 class ReportingTest(django.test.TestCase):
     """ Test sending an email """
@@ -11,4 +15,34 @@ class ReportingTest(django.test.TestCase):
         print('Sending email to: ' + address + ". This takes awhile.")
         un = UserNotification();
         un.send_email('CBRI', address, 'a subject', 'a message')
-        print('Email sent')
\ No newline at end of file
+        print('Email sent')
+
+
+class RepoLogTest(django.test.TestCase):
+
+    def setUp(self):
+        self.repo = Repository.objects.create(name="log", type=RepoType.GIT, description="", language="Java")
+
+    def test_batched(self):
+        with buffered_events(3):
+            log_to_repo(self.repo, "one")
+            log_to_repo(self.repo, "two")
+            self.assertEqual(RepositoryEvent.objects.count(), 0)
+            log_to_repo(self.repo, "three")
+            self.assertEqual(RepositoryEvent.objects.count(), 3)
+            log_to_repo(self.repo, "four")
+        self.assertEqual(list(self.repo.events.order_by('id').values_list('text', flat=True)),
+                         ["one", "two", "three", "four"])
+
+    def test_tail(self):
+        """The log comes newest first, a page at a time"""
+        for i in range(5):
+            log_to_repo(self.repo, "line %d" % i)
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="log"))
+
+        page = client.get('/api/repositories/%s/log/?limit=2' % self.repo.id).data
+        self.assertEqual([entry['text'] for entry in page['results']], ["line 4", "line 3"])
+        page = client.get(page['next']).data
+        self.assertEqual([entry['text'] for entry in page['results']], ["line 2", "line 1"])
+        self.assertNotIn('log', client.get('/api/repositories/%s/' % self.repo.id).data)
@@ -0,0 +1,35 @@
+from unittest import mock
+
+from django.core.cache import cache
+
+from store.cache import cache_stats
+from tests.api_helpers import ApiTestCase
+
+
+class ResponseCacheTest(ApiTestCase):
+    measurement_count = 2
+
+    def test_response_cache(self):
+        cache.clear()
+        url = '/api/repositories/%s/benchmark_descriptions/' % self.repo.id
+        before = cache_stats()
+        first = self.client.get(url)
+        # Just the lookups of the repository's version and the user's email
+        with self.assertNumQueries(2):
+            second = self.client.get(url)
+        self.assertEqual(second.data, first.data)
+        stats = cache_stats()
+        self.assertEqual((stats['hits'] - before['hits'], stats['misses'] - before['misses']), (1, 1))
+
+        # Nothing kept, or counted, with caching off
+        with mock.patch('store.cache.CBRI_RESPONSE_CACHE_SECONDS', 0):
+            self.assertEqual(self.client.get(url + '?fields=num_projects').status_code, 200)
+            self.assertEqual(cache_stats(), stats)
+
+        # A change to the description makes way for a fresh response
+        description = self.repo.benchmark_descriptions.first()
+        response = self.client.patch(url + '%s/' % description.id, {'num_projects': description.num_projects + 1},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).data[0]['num_projects'], description.num_projects + 1)
+        self.assertEqual(self.client.get('/api/response-cache').data['misses'], stats['misses'] + 1)
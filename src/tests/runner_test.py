@@ -0,0 +1,150 @@
+import datetime
+
+import django
+from django.utils import timezone
+
+from analysis.manager.und_vcs_analysis_manager import FIXED_HISTORY
+from store.models import Organization, Repository, AnalysisJob, JobType, JobStatus, JobPriority, JobRevision, \
+    RevisionResult
+from store.background import queue_update
+from store.runner import JobRunner
+from vcs.git_helper import GitHelper
+from vcs.repo_type import RepoType
+from tests.fake_managers import FakeUndManager
+
+
+class NoCodeHelper(GitHelper):
+    """Every revision's source is different, without any code to look at"""
+
+    def get_source_hash(self, code_dir: str, rev: str, source_filter) -> str:
+        return rev
+
+
+class StolenLeaseManager(FakeUndManager):
+    """Loses the job to another runner while analyzing the second revision"""
+
+    def analyze_rev(self, project_name, lang, rev, rev_date, on_stage=None):
+        if len(self.analyzed_revs) == 1:
+            AnalysisJob.objects.filter(id=self.job.id).update(claimed_by="b:1")
+        return super().analyze_rev(project_name, lang, rev, rev_date, on_stage)
+
+
+class RunnerTest(django.test.TestCase):
+
+    def setUp(self):
+        self.repo = Repository.objects.create(name="runner", type=RepoType.GIT, description="", language="Java")
+
+    def test_claim_once(self):
+        """Only one worker gets a job, and the most important job goes first"""
+        AnalysisJob.objects.create(repository=self.repo, job_type=JobType.BACKFILL, priority=JobPriority.BACKFILL)
+        history = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+
+        job = AnalysisJob.claim_next("a:1", 60)
+        self.assertEqual(job.id, history.id)
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertEqual(job.claimed_by, "a:1")
+        self.assertEqual(AnalysisJob.claim_next("b:1", 60).job_type, JobType.BACKFILL)
+        self.assertIsNone(AnalysisJob.claim_next("c:1", 60))
+
+    def test_expired_lease(self):
+        """A job whose runner stopped renewing the lease goes to another runner"""
+        AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+        job = AnalysisJob.claim_next("a:1", 60)
+        self.assertTrue(job.renew_lease("a:1", 60))
+        self.assertIsNone(AnalysisJob.claim_next("b:1", 60))
+
+        AnalysisJob.objects.filter(id=job.id).update(lease_expires=timezone.now() - datetime.timedelta(seconds=1))
+        reclaimed = AnalysisJob.claim_next("b:1", 60)
+        self.assertEqual(reclaimed.id, job.id)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertFalse(job.renew_lease("a:1", 60))
+
+    def test_give_up(self):
+        AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY, attempts=3)
+        self.assertIsNone(JobRunner(worker="a:1", max_attempts=3).claim())
+        job = AnalysisJob.objects.get()
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(job.claimed_by, "")
+
+    def test_fair_share(self):
+        """An organization with a job running waits behind one that has none"""
+        busy = Organization.objects.create(name="busy")
+        other = Organization.objects.create(name="other")
+        busy_repo = Repository.objects.create(name="busy", organization=busy, type=RepoType.GIT, description="",
+                                              language="Java")
+        other_repo = Repository.objects.create(name="other", organization=other, type=RepoType.GIT, description="",
+                                               language="Java")
+        for i in range(3):
+            AnalysisJob.objects.create(repository=busy_repo, job_type=JobType.HISTORY)
+        late = AnalysisJob.objects.create(repository=other_repo, job_type=JobType.HISTORY)
+        interactive = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.UPDATE,
+                                                 priority=JobPriority.INTERACTIVE)
+
+        self.assertEqual(AnalysisJob.claim_next("a:1", 60).id, interactive.id)
+        self.assertEqual(AnalysisJob.claim_next("a:1", 60).repository_id, busy_repo.id)
+        self.assertEqual(AnalysisJob.claim_next("a:1", 60).id, late.id)
+        self.assertEqual(AnalysisJob.claim_next("a:1", 60).repository_id, busy_repo.id)
+
+    def test_aging(self):
+        """A backfill that has waited long enough goes before a fresh history"""
+        old = timezone.now() - datetime.timedelta(hours=3)
+        backfill = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.BACKFILL,
+                                              priority=JobPriority.BACKFILL, enqueued=old)
+        AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+        self.assertEqual(AnalysisJob.queue_order()[0], backfill.id)
+
+        stats = {s['priority']: s for s in AnalysisJob.queue_stats()}
+        self.assertEqual(stats['BACKFILL']['queued'], 1)
+        self.assertGreaterEqual(stats['BACKFILL']['oldest_wait_seconds'], 3 * 3600)
+        AnalysisJob.claim_next("a:1", 60)
+        stats = {s['priority']: s for s in AnalysisJob.queue_stats()}
+        self.assertEqual(stats['BACKFILL']['running'], 1)
+        self.assertGreaterEqual(stats['BACKFILL']['mean_wait_seconds'], 3 * 3600)
+
+    def test_requeue_ages_afresh(self):
+        """A job put back in the queue waits its turn again, however long ago it was made"""
+        old = timezone.now() - datetime.timedelta(hours=3)
+        backfill = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.BACKFILL,
+                                              priority=JobPriority.BACKFILL, created=old, enqueued=old)
+        AnalysisJob.claim_next("a:1", 60)
+        backfill.refresh_from_db()
+        backfill.requeue()
+        backfill.release("a:1")
+        history = AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+        self.assertEqual(AnalysisJob.queue_order(), [history.id, backfill.id])
+
+    def test_coalesce_updates(self):
+        """Asking for an update again joins the one on the way"""
+        job = queue_update(self.repo, "", JobPriority.INGESTION)
+        AnalysisJob.claim_next("a:1", 60)
+        again = queue_update(self.repo, "")
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(again.placeholder.id, job.placeholder.id)
+        # Someone is waiting on it now
+        self.assertEqual(again.priority, JobPriority.INTERACTIVE)
+        self.assertGreater(again.enqueued, job.enqueued)
+        self.assertEqual(AnalysisJob.objects.count(), 1)
+
+        job.set_status(JobStatus.DONE)
+        self.assertNotEqual(queue_update(self.repo, "").id, job.id)
+
+    def test_stolen_lease(self):
+        """A runner that lost its job to another stops, and records nothing more"""
+        AnalysisJob.objects.create(repository=self.repo, job_type=JobType.HISTORY)
+        job = AnalysisJob.claim_next("a:1", 60)
+        job.hold_lease("a:1")
+        start = timezone.now() - datetime.timedelta(days=10)
+        for i in range(3):
+            JobRevision.objects.create(job=job, revision_id="rev%d" % i, date=start + datetime.timedelta(days=i))
+        manager = StolenLeaseManager(self.repo, NoCodeHelper(), history_mode=FIXED_HISTORY)
+        manager.job = job
+
+        with self.assertRaises(RuntimeError):
+            manager.run_history(job, "runner", "Java")
+        self.assertEqual(manager.analyzed_revs, ["rev0", "rev1"])
+        self.assertEqual(self.repo.measurements.count(), 1)
+        self.assertEqual(job.revisions.filter(result=RevisionResult.PENDING).count(), 2)
+        self.assertTrue(job.should_stop())
+        with self.assertRaises(RuntimeError):
+            job.set_status(JobStatus.DONE)
+        self.assertEqual(AnalysisJob.objects.get(id=job.id).status, JobStatus.RUNNING)
@@ -0,0 +1,33 @@
+from store.models import MeasurementScore
+from store.series import measurement_series, downsample
+from tests.api_helpers import ApiTestCase
+
+
+class SeriesTest(ApiTestCase):
+    measurement_count = 5
+
+    def test_series(self):
+        measurements = list(self.repo.measurements.order_by('date'))
+        MeasurementScore.objects.filter(measurement__repository=self.repo).delete()
+        for i, measured in enumerate(measurements):
+            MeasurementScore.objects.create(measurement=measured, name="overall", grade="B", grade_value=i)
+
+        with self.assertNumQueries(1):
+            series = measurement_series(self.repo, metrics=('core_size',), scores=('overall', 'clarity'), max_points=3)
+        self.assertEqual(series['total'], 5)
+        self.assertEqual(series['dates'], [measurements[0].date, measurements[2].date, measurements[4].date])
+        self.assertEqual(series['metrics']['core_size'], [m.core_size for m in measurements[::2]])
+        self.assertEqual(series['scores']['overall'], [0, 2, 4])
+        self.assertEqual(series['scores']['clarity'], [None] * 3)
+
+        response = self.client.get('/api/repositories/%s/series/?metrics=num_files&start=%s' %
+                                   (self.repo.id, measurements[3].date.date().isoformat()))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], 2)
+        self.assertEqual(list(response.data['metrics']), ['num_files'])
+        self.assertEqual(self.client.get('/api/repositories/%s/series/?metrics=bogus' % self.repo.id).status_code, 400)
+
+    def test_downsample(self):
+        self.assertEqual(downsample(3, 5), [0, 1, 2])
+        self.assertEqual(downsample(10, 4), [0, 3, 6, 9])
+        self.assertEqual(downsample(10, 1), [9])
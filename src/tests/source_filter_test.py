@@ -0,0 +1,29 @@
+import django
+
+from analysis.source_filter import SourceFilter
+
+
+class SourceFilterTest(django.test.TestCase):
+
+    def test_extensions(self):
+        java = SourceFilter("Java")
+        self.assertTrue(java.matches("src/Main.java"))
+        self.assertTrue(java.matches("src\\Main.JAVA"))
+        self.assertFalse(java.matches("README.md"))
+        # Unknown languages don't filter anything
+        self.assertTrue(SourceFilter("Klingon").matches("README.md"))
+
+    def test_exclude_globs(self):
+        java = SourceFilter("Java", exclude_globs=["vendor", "**/test/**", "gen/*.java"])
+        self.assertTrue(java.matches("src/Main.java"))
+        self.assertFalse(java.matches("vendor/lib/Lib.java"))
+        self.assertFalse(java.matches("module/vendor/Lib.java"))
+        self.assertFalse(java.matches("src/test/MainTest.java"))
+        self.assertFalse(java.matches("gen/Parser.java"))
+        self.assertTrue(java.matches("gen/sub/Parser.java"))
+
+    def test_include_globs(self):
+        java = SourceFilter("Java", include_globs=["src/**"], exclude_globs=["src/legacy"])
+        self.assertTrue(java.matches("src/a/b/Main.java"))
+        self.assertFalse(java.matches("tools/Build.java"))
+        self.assertFalse(java.matches("src/legacy/Old.java"))
@@ -0,0 +1,62 @@
+from store.models import Repository
+from tests.api_helpers import ApiTestCase
+from vcs.repo_type import RepoType
+
+
+class SparseFieldsTest(ApiTestCase):
+    measurement_count = 3
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/repositories/%s/?fields=name,analysis_status' % self.repo.id)
+        self.assertEqual(set(response.data), {'name', 'analysis_status'})
+        self.assertEqual(self.client.get('/api/repositories/%s/?fields=log' % self.repo.id).status_code, 400)
+
+        url = '/api/repositories/%s/measurements/?compact=1' % self.repo.id
+        # The repository's version and the values
+        with self.assertNumQueries(2):
+            rows = self.client.get(url).data['results']
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[-1]['id'], self.measurement.id)
+        self.assertEqual(rows[-1]['repository'], self.repo.id)
+        self.assertNotIn('url', rows[-1])
+        self.assertNotIn('components_str', rows[-1])
+
+        rows = self.client.get(url + '&fields=date,core_size&all=true').data
+        self.assertEqual(set(rows[0]), {'date', 'core_size'})
+        self.measurement.refresh_from_db()
+        self.assertEqual(rows[-1]['core_size'], self.measurement.core_size)
+
+        # Paged by what's left out, over more than one page
+        for path, field in (('measurements/', 'core_size'),
+                            ('measurements/%s/components/' % self.measurement.id, 'useful_lines'),
+                            ('measurements/%s/scores/' % self.measurement.id, 'grade_value')):
+            url = '/api/repositories/%s/%s?compact=1&fields=%s&limit=2' % (self.repo.id, path, field)
+            values = []
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(all(set(row) == {field} for row in response.data['results']))
+                values += [row[field] for row in response.data['results']]
+                url = response.data['next']
+            all_rows = self.client.get('/api/repositories/%s/%s?compact=1&all=true' % (self.repo.id, path)).data
+            self.assertGreater(len(all_rows), 2)
+            self.assertEqual(values, [row[field] for row in all_rows])
+
+    def test_compact_repositories(self):
+        for name in ("b", "a", "a"):
+            Repository.objects.create(name=name, type=RepoType.GIT, description="", language="Java")
+        rows = self.client.get('/api/repositories/?compact=1').data
+        self.assertEqual([row['name'] for row in rows], ["a", "a", "b", "queries"])
+        self.assertEqual(rows[-1]['id'], self.repo.id)
+        for name in ('url', 'token', 'measurements', 'allowed_emails'):
+            self.assertNotIn(name, rows[-1])
+
+        # Paged by (name, id) when asked, whatever fields are picked
+        url = '/api/repositories/?compact=1&fields=language&limit=1'
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.data['results'], [{'language': "Java"}])
+            url = response.data['next']
+            pages += 1
+        self.assertEqual(pages, 4)
@@ -1,5 +1,11 @@
+import base64
+import os
+import tempfile
+
 import django
+from git import Repo, Actor
 
+from analysis.source_filter import SourceFilter
 from vcs.git_helper import GitHelper
 from vcs.repo_type import is_git_repo, is_hg_repo, get_repo_type, RepoType
 
@@ -10,6 +16,95 @@ class TestGitHelper(django.test.TestCase):
         print(git.clone("https://github.com/StottlerHenkeAssociates/SimBionic.git", "./temp/code", None))
 
 
+class TestGitRevisions(django.test.TestCase):
+    """Working with revisions without checking them out"""
+
+    def commit_file(self, repo, name, text):
+        with open(os.path.join(repo.working_tree_dir, name), 'w') as f:
+            f.write(text)
+        repo.index.add([name])
+        author = Actor("CBRI Test", "test@example.com")
+        return repo.index.commit("Change " + name, author=author, committer=author).hexsha
+
+    def test_source_hash(self):
+        """Revisions that only touch non-source files should hash the same"""
+        with tempfile.TemporaryDirectory() as code_dir:
+            repo = Repo.init(code_dir)
+            git = GitHelper()
+            java = SourceFilter("Java")
+
+            first = self.commit_file(repo, "Main.java", "class Main {}")
+            docs = self.commit_file(repo, "README.md", "Docs only")
+            code = self.commit_file(repo, "Main.java", "class Main { int x; }")
+
+            self.assertEqual(git.get_source_hash(code_dir, first, java), git.get_source_hash(code_dir, docs, java))
+            self.assertNotEqual(git.get_source_hash(code_dir, docs, java), git.get_source_hash(code_dir, code, java))
+
+    def test_export_rev(self):
+        with tempfile.TemporaryDirectory() as code_dir, tempfile.TemporaryDirectory() as target_dir:
+            repo = Repo.init(code_dir)
+            first = self.commit_file(repo, "Main.java", "class Main {}")
+            self.commit_file(repo, "README.md", "Docs only")
+            self.commit_file(repo, "Main.java", "class Main { int x; }")
+
+            GitHelper().export_rev(code_dir, first, target_dir, SourceFilter("Java"))
+
+            self.assertEqual(os.listdir(target_dir), ["Main.java"])
+            with open(os.path.join(target_dir, "Main.java")) as f:
+                self.assertEqual(f.read(), "class Main {}")
+            # The working copy is untouched
+            self.assertEqual(repo.head.commit.message, "Change Main.java")
+            self.assertFalse(repo.is_dirty())
+
+    def test_export_ignores_attributes(self):
+        """The export is what's committed, the same files get_source_hash sees"""
+        with tempfile.TemporaryDirectory() as code_dir, tempfile.TemporaryDirectory() as target_dir:
+            repo = Repo.init(code_dir)
+            self.commit_file(repo, ".gitattributes", "Hidden.java export-ignore\nMain.java export-subst\n")
+            self.commit_file(repo, "Hidden.java", "class Hidden {}")
+            rev = self.commit_file(repo, "Main.java", "class Main { String v = \"$Format:%H$\"; }")
+
+            scan = GitHelper().export_rev(code_dir, rev, target_dir, SourceFilter("Java"))
+
+            self.assertEqual(sorted(scan.files), ["Hidden.java", "Main.java"])
+            self.assertEqual(sorted(os.listdir(target_dir)), ["Hidden.java", "Main.java"])
+            with open(os.path.join(target_dir, "Main.java")) as f:
+                self.assertEqual(f.read(), "class Main { String v = \"$Format:%H$\"; }")
+
+    def test_clone_sparse(self):
+        """Only the sub-paths get checked out and exported"""
+        with tempfile.TemporaryDirectory() as upstream_dir, tempfile.TemporaryDirectory() as scratch_dir:
+            upstream = Repo.init(upstream_dir)
+            # Let the local "server" hand out a partial clone
+            upstream.git.config('uploadpack.allowFilter', 'true')
+            os.makedirs(os.path.join(upstream_dir, "app"))
+            os.makedirs(os.path.join(upstream_dir, "lib"))
+            self.commit_file(upstream, "app/App.java", "class App {}")
+            rev = self.commit_file(upstream, "lib/Lib.java", "class Lib {}")
+
+            git = GitHelper()
+            address = "file://" + upstream_dir
+            code_dir = os.path.join(scratch_dir, "code")
+            mirror_dir = os.path.join(scratch_dir, "mirror")
+            self.assertEqual(git.clone_sparse(address, code_dir, "s3cret", ["app"], mirror_dir), rev)
+            # The token is given to each command, it's not kept in the mirror that outlives the job
+            with open(os.path.join(mirror_dir, "config")) as config:
+                self.assertNotIn("s3cret", config.read())
+            self.assertEqual(git.environment['GIT_CONFIG_PARAMETERS'],
+                             "'http.extraHeader=Authorization: Basic %s'" % base64.b64encode(b"s3cret:").decode())
+            self.assertTrue(os.path.isfile(os.path.join(code_dir, "app", "App.java")))
+            self.assertFalse(os.path.exists(os.path.join(code_dir, "lib")))
+
+            # A second job reuses the mirror
+            other_dir = os.path.join(scratch_dir, "other")
+            git.clone_sparse(address, other_dir, None, ["lib"], mirror_dir)
+            self.assertTrue(os.path.isfile(os.path.join(other_dir, "lib", "Lib.java")))
+
+            target_dir = os.path.join(scratch_dir, "export")
+            scan = git.export_rev(code_dir, rev, target_dir, SourceFilter("Java", sub_paths=["app"]))
+            self.assertEqual(scan.files, ["app/App.java"])
+
+
 class RepoTypeTest(django.test.TestCase):
     http_git = 'https://github.com/joeyespo/grip'
     ssh_git = None # Set to a valid ssh address to test
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+import django
+
+from analysis.source_filter import SourceFilter
+from analysis.staging import stage_matching_files
+from analysis.manager.und_vcs_analysis_manager import UndVcsAnalysisManager
+from analysis.workspace import Workspace, sweep_stale_workspaces, OWNER_FILE
+from store.background import run_job
+from store.models import Repository, AnalysisJob, JobType
+from vcs.repo_type import RepoType
+
+
+class WorkspaceTest(django.test.TestCase):
+
+    def test_directories_keyed_by_job(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            first = Workspace("repo", "job1", scratch)
+            second = Workspace("repo", "job2", scratch)
+            self.assertNotEqual(first.code_dir, second.code_dir)
+            self.assertNotEqual(first.data_dir, second.data_dir)
+
+    def test_job_workspace(self):
+        """A job works in the same directories every time it runs, so they can be found again"""
+        repo = Repository.objects.create(name="workspace", type=RepoType.GIT, description="", language="Java")
+        job = AnalysisJob.objects.create(repository=repo, job_type=JobType.BACKFILL)
+        roots = []
+        with mock.patch.object(UndVcsAnalysisManager, 'make_backfill', autospec=True,
+                               side_effect=lambda manager, job: roots.append(manager.workspace.root) or []):
+            run_job(job)
+            run_job(job)
+        self.assertEqual(roots[0], roots[1])
+        self.assertTrue(roots[0].endswith("/%s/%s" % (repo.id, job.id)))
+
+    def test_sweep_stale_workspaces(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            live = Workspace("repo", "live", scratch)
+            live.create()
+
+            # Pretend a worker that has since exited made this one
+            dead = Workspace("repo", "dead", scratch)
+            dead.create()
+            process = subprocess.Popen([sys.executable, "-c", "pass"])
+            process.wait()
+            owner_file = dead.root + "/" + OWNER_FILE
+            with open(owner_file) as f:
+                owner = json.load(f)
+            owner['pid'] = process.pid
+            with open(owner_file, 'w') as f:
+                json.dump(owner, f)
+
+            sweep_stale_workspaces(scratch)
+
+            self.assertTrue(os.path.isdir(live.root))
+            self.assertFalse(os.path.isdir(dead.root))
+
+    def test_stage_matching_files(self):
+        with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as target:
+            os.makedirs(source + "/src/pkg")
+            for name in ["src/pkg/Main.java", "README.md", "lib/dep.jar"]:
+                os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+                with open(os.path.join(source, name), 'w') as f:
+                    f.write("content")
+
+            scan = stage_matching_files(source, target, SourceFilter("Java"))
+
+            self.assertEqual(scan.files, ["src/pkg/Main.java"])
+            self.assertEqual(scan.excluded_files, 2)
+            self.assertEqual(os.listdir(target), ["src"])
+            with open(target + "/src/pkg/Main.java") as f:
+                self.assertEqual(f.read(), "content")
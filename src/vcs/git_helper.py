@@ -1,11 +1,39 @@
-from git import Repo
+import base64
+import datetime
+import hashlib
+import os
 
+from git import Git, Repo
+
+from analysis.source_filter import SourceFilter, SourceScan
+from analysis.workspace import locked
 from vcs.vcs_helper import VcsHelper
 from cbri.reporting import logger
 
 
+def get_auth_environment(token: str) -> dict:
+    """Environment that gives git commands the token as HTTP credentials, the same as
+    putting it in the address would, without it being written into any config"""
+    if not token:
+        return {}
+    credentials = token if ':' in token else token + ':'
+    header = "http.extraHeader=Authorization: Basic " + base64.b64encode(credentials.encode()).decode()
+    # What git -c sets, and passes on to the git commands it runs itself (e.g. to fetch
+    # the contents of a partial clone)
+    return {'GIT_CONFIG_PARAMETERS': "'%s'" % header}
+
+
 class GitHelper(VcsHelper):
 
+    def __init__(self):
+        # Set by clone_sparse. Commands in a worktree of a partial clone may need to fetch.
+        self.environment = {}
+
+    def open_repo(self, code_dir: str) -> Repo:
+        repo = Repo(code_dir)
+        repo.git.update_environment(**self.environment)
+        return repo
+
     def clone(self, repo_address: str, code_dir: str, token: str) -> str:
         logger.info("\tCloning Git: " + self.get_safe_address(repo_address, token) + " to: " + code_dir)
         revision_id = None
@@ -21,11 +49,139 @@ class GitHelper(VcsHelper):
 
         return revision_id
 
+    def clone_sparse(self, repo_address: str, code_dir: str, token: str, sub_paths: list, mirror_dir: str) -> str:
+        """The mirror is a partial clone (commits and trees, no file contents) shared by every
+        job on the same address. Each job gets a worktree of it with only sub_paths checked out,
+        so only the contents of those paths are ever downloaded. The mirror outlives the job,
+        so its origin is the address without the token, which is passed to each command instead."""
+        logger.info("\tSparse checkout of Git: " + self.get_safe_address(repo_address, token)
+                    + " paths: " + ", ".join(sub_paths) + " to: " + code_dir)
+        try:
+            # Only one job at a time may fetch into the mirror or add worktrees to it
+            with locked(mirror_dir):
+                # Plain git commands run in the mirror; sparse worktrees move core.bare out of its
+                # config, after which GitPython can no longer tell that it is a bare repo
+                self.environment = get_auth_environment(token)
+                mirror = Git(mirror_dir)
+                mirror.update_environment(**self.environment)
+                if os.path.isdir(mirror_dir):
+                    # Mirrors made before tokens were kept out of them have it in the origin
+                    mirror.remote('set-url', 'origin', repo_address)
+                    mirror.fetch('origin', prune=True)
+                    # Forget worktrees of workspaces that have since been deleted
+                    mirror.worktree('prune')
+                else:
+                    Repo.clone_from(repo_address, mirror_dir, env=self.environment, mirror=True, filter='blob:none')
+                mirror.worktree('add', '--no-checkout', '--detach', os.path.abspath(code_dir), 'HEAD')
+
+            repo = self.open_repo(code_dir)
+            repo.git.sparse_checkout('set', '--cone', *sub_paths)
+            repo.git.checkout()
+            revision_id = str(repo.head.object.hexsha)
+        except Exception as e:
+            logger.error("Repo could not be cloned")
+            logger.exception(e)
+            raise
+
+        return revision_id
+
     def get_latest_rev_at_date(self, code_dir: str, date: str) -> str:
         # HEAD is always set; better to use than master
-        repo = Repo(code_dir)
+        repo = self.open_repo(code_dir)
         return repo.git.rev_list('HEAD', n='1', before=date)
 
+    def get_revs_between(self, code_dir: str, old_rev: str, new_rev: str) -> list:
+        repo = self.open_repo(code_dir)
+        # Follow the mainline rather than wander into merged branches
+        listing = repo.git.rev_list('--first-parent', '--reverse', old_rev + '..' + new_rev)
+        return [rev for rev in listing.split() if rev != new_rev]
+
+    def get_rev_date(self, code_dir: str, rev: str) -> datetime.datetime:
+        return self.open_repo(code_dir).commit(rev).committed_datetime
+
+    def get_revs_in_range(self, code_dir: str, start_date: datetime.datetime, end_date: datetime.datetime) -> list:
+        repo = self.open_repo(code_dir)
+        args = ['--first-parent', '--reverse', '--format=%H %ct']
+        if start_date:
+            args.append('--since=' + start_date.isoformat())
+        if end_date:
+            args.append('--until=' + end_date.isoformat())
+        revs = []
+        for line in repo.git.log(*args, 'HEAD').splitlines():
+            rev, timestamp = line.split()
+            revs.append((rev, datetime.datetime.fromtimestamp(int(timestamp), datetime.timezone.utc)))
+        return revs
+
+    def get_tags(self, code_dir: str) -> list:
+        tags = []
+        for tag in self.open_repo(code_dir).tags:
+            try:
+                commit = tag.commit
+            except ValueError:
+                continue  # Tags something other than a commit
+            tags.append((tag.name, commit.hexsha, commit.committed_datetime))
+        return tags
+
     def set_code_to_rev(self, code_dir: str, rev: str):
-        repo = Repo(code_dir)
-        repo.git.checkout(rev)
\ No newline at end of file
+        repo = self.open_repo(code_dir)
+        repo.git.checkout(rev)
+
+    def export_rev(self, code_dir: str, rev: str, target_dir: str, source_filter: SourceFilter) -> SourceScan:
+        repo = self.open_repo(code_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        files = []
+        excluded_files = 0
+        excluded_bytes = 0
+        # Read the tree straight out of the object store rather than checking it out. This is
+        # the listing get_source_hash sees; git archive would apply .gitattributes
+        # export-ignore/export-subst. Narrowed to the sub-paths, so a partial clone only has to
+        # fetch the contents of those.
+        args = ['-r', '-z', '-l', '--full-tree', rev]
+        if source_filter.sub_paths:
+            args += ['--'] + source_filter.sub_paths
+        try:
+            for entry in repo.git.ls_tree(*args).split('\0'):
+                if not entry:
+                    continue
+                # "<mode> <type> <blob sha> <size>\t<path>"
+                info, path = entry.split('\t', 1)
+                mode, kind, sha, size = info.split()
+                # Only regular files, not links or submodules
+                if kind != 'blob' or mode not in ('100644', '100755'):
+                    continue
+                if source_filter.matches(path):
+                    self.write_blob(repo, sha, os.path.join(target_dir, path), mode == '100755')
+                    files.append(path)
+                else:
+                    excluded_files += 1
+                    excluded_bytes += int(size)
+        finally:
+            # Stops the cat-file process the blobs were read through
+            repo.git.clear_cache()
+        return SourceScan(files, excluded_files, excluded_bytes)
+
+    def write_blob(self, repo: Repo, sha: str, path: str, executable: bool):
+        """Write out a blob's contents as stored, read through git cat-file --batch"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stream = repo.git.stream_object_data(sha)[3]
+        with open(path, 'wb') as f:
+            while True:
+                chunk = stream.read(65536)
+                if not chunk:
+                    break
+                f.write(chunk)
+        if executable:
+            os.chmod(path, 0o755)
+
+    def get_source_hash(self, code_dir: str, rev: str, source_filter: SourceFilter) -> str:
+        repo = self.open_repo(code_dir)
+        # Each entry is "<mode> <type> <blob sha>\t<path>"; the blob sha already
+        # identifies the content, so there is no need to read any files.
+        listing = repo.git.ls_tree('-r', '-z', '--full-tree', rev or 'HEAD')
+        digest = hashlib.sha1()
+        for entry in listing.split('\0'):
+            if entry:
+                path = entry.split('\t', 1)[1]
+                if source_filter.matches(path):
+                    digest.update(entry.encode('utf-8') + b'\0')
+        return digest.hexdigest()
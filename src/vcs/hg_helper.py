@@ -1,5 +1,11 @@
+import datetime
+import hashlib
+import os
+import tempfile
+
 import hgapi
 
+from analysis.source_filter import SourceFilter, SourceScan
 from vcs.vcs_helper import VcsHelper
 from cbri.reporting import logger
 
@@ -21,6 +27,87 @@ class HgHelper(VcsHelper):
         extra_args = {"--date": '<'+date}
         return repo.hg_log(limit=1, template="{node}", **extra_args)
 
+    def get_revs_between(self, code_dir: str, old_rev: str, new_rev: str) -> list:
+        repo = hgapi.Repo(code_dir)
+        revset = "sort((%s::%s) - %s - %s, rev)" % (old_rev, new_rev, old_rev, new_rev)
+        return repo.hg_command("log", "-r", revset, "-T", "{node}\\n").split()
+
+    def get_rev_date(self, code_dir: str, rev: str) -> datetime.datetime:
+        repo = hgapi.Repo(code_dir)
+        # "<unix time> <offset>", where the offset doesn't change the instant
+        timestamp = repo.hg_command("log", "-r", rev, "-T", "{date|hgdate}").split()[0]
+        return datetime.datetime.fromtimestamp(float(timestamp), datetime.timezone.utc)
+
+    def get_revs_in_range(self, code_dir: str, start_date: datetime.datetime, end_date: datetime.datetime) -> list:
+        repo = hgapi.Repo(code_dir)
+        args = ["log", "--follow-first", "-T", "{node} {date|hgdate}\\n"]
+        # Hg date specs, e.g. "2018-01-01 00:00:00 +0000 to 2019-01-01 00:00:00 +0000"
+        hg_date_format = "%Y-%m-%d %H:%M:%S %z"
+        if start_date and end_date:
+            args += ["-d", start_date.strftime(hg_date_format) + " to " + end_date.strftime(hg_date_format)]
+        elif start_date:
+            args += ["-d", ">" + start_date.strftime(hg_date_format)]
+        elif end_date:
+            args += ["-d", "<" + end_date.strftime(hg_date_format)]
+        revs = []
+        # Newest first
+        for line in reversed(repo.hg_command(*args).splitlines()):
+            rev, timestamp = line.split()[:2]
+            revs.append((rev, datetime.datetime.fromtimestamp(float(timestamp), datetime.timezone.utc)))
+        return revs
+
+    def get_tags(self, code_dir: str) -> list:
+        repo = hgapi.Repo(code_dir)
+        tags = []
+        listing = repo.hg_command("log", "-r", "tag()", "-T", "{node} {date|hgdate}\\t{join(tags, '\\t')}\\n")
+        for line in listing.splitlines():
+            header, *names = line.split("\t")
+            rev, timestamp = header.split()[:2]
+            date = datetime.datetime.fromtimestamp(float(timestamp), datetime.timezone.utc)
+            tags += [(name, rev, date) for name in names if name != "tip"]
+        return tags
+
     def set_code_to_rev(self, code_dir: str, rev: str):
         repo = hgapi.Repo(code_dir)
         repo.hg_update(reference=rev)
+
+    def export_rev(self, code_dir: str, rev: str, target_dir: str, source_filter: SourceFilter) -> SourceScan:
+        repo = hgapi.Repo(code_dir)
+        files = []
+        excluded_files = 0
+        excluded_bytes = 0
+        for line in repo.hg_command("files", "-r", rev, "-T", "{size} {path}\\n").splitlines():
+            size, path = line.split(" ", 1)
+            if source_filter.matches(path):
+                files.append(path)
+            else:
+                excluded_files += 1
+                excluded_bytes += int(size)
+        if not files:
+            # An empty pattern file would leave it up to hg what gets archived
+            os.makedirs(target_dir, exist_ok=True)
+            return SourceScan(files, excluded_files, excluded_bytes)
+
+        # Archive exactly the matching files, listed in a pattern file to keep the command short
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as pattern_file:
+            for path in files:
+                pattern_file.write("path:" + path + "\n")
+        try:
+            repo.hg_command("archive", "-r", rev, "-t", "files", "--no-decode",
+                            "-I", "listfile:" + pattern_file.name, os.path.abspath(target_dir))
+        finally:
+            os.remove(pattern_file.name)
+
+        return SourceScan(files, excluded_files, excluded_bytes)
+
+    def get_source_hash(self, code_dir: str, rev: str, source_filter: SourceFilter) -> str:
+        repo = hgapi.Repo(code_dir)
+        # Without a rev, use the parent of the working directory.
+        # Each line is "<file node> <mode> <flag> <path>"; the file node identifies the content.
+        listing = repo.hg_command("manifest", "--debug", "-r", rev or ".")
+        digest = hashlib.sha1()
+        for line in listing.splitlines():
+            path = line[47:]
+            if path and source_filter.matches(path):
+                digest.update(line.encode('utf-8') + b'\0')
+        return digest.hexdigest()
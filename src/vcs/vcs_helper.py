@@ -1,5 +1,8 @@
+import datetime
 from abc import ABC, abstractmethod
 
+from analysis.source_filter import SourceFilter, SourceScan
+
 
 class VcsHelper(ABC):
     """Handles VCS work. Closely related to UndVcsAnalysisManager.
@@ -13,15 +16,51 @@ class VcsHelper(ABC):
     def clone(self, repo_address: str, code_dir: str, token: str) -> str:
         """Clone the repo at repo_address to code_dir, return the revision_id"""
 
+    def clone_sparse(self, repo_address: str, code_dir: str, token: str, sub_paths: list, mirror_dir: str) -> str:
+        """Clone the repo at repo_address to code_dir with only sub_paths checked out, sharing
+        what can be shared through a mirror kept at mirror_dir. Return the revision_id.
+        By default this is just a full clone, for VCSs that can't do any better."""
+        return self.clone(repo_address, code_dir, token)
+
     @abstractmethod
     def get_latest_rev_at_date(self, code_dir: str, date: str) -> str:
         """Returns the revision identifier for the latest rev before the given date
         (in the form 2018-01-01). May return None if none found"""
 
+    @abstractmethod
+    def get_revs_between(self, code_dir: str, old_rev: str, new_rev: str) -> list:
+        """Returns the revisions after old_rev and before new_rev along the line of history
+        leading to new_rev, oldest first"""
+
+    @abstractmethod
+    def get_revs_in_range(self, code_dir: str, start_date: datetime.datetime, end_date: datetime.datetime) -> list:
+        """Returns (rev, date) for the revisions along the mainline leading to the current one
+        that were made between the dates, oldest first. Either date may be None for no limit."""
+
+    @abstractmethod
+    def get_tags(self, code_dir: str) -> list:
+        """Returns (tag, rev, date) for every tagged revision"""
+
+    @abstractmethod
+    def get_rev_date(self, code_dir: str, rev: str) -> datetime.datetime:
+        """Returns the timezone aware date of the given rev"""
+
     @abstractmethod
     def set_code_to_rev(self, code_dir: str, rev: str):
         """Set the the code in the code dir to the version at the given rev"""
 
+    @abstractmethod
+    def export_rev(self, code_dir: str, rev: str, target_dir: str, source_filter: SourceFilter) -> SourceScan:
+        """Write the files at the given rev that pass source_filter into target_dir, straight
+        from the VCS metadata in code_dir. Unlike set_code_to_rev the working copy is left alone,
+        so several revs can be exported side by side. Returns what was exported and left out."""
+
+    @abstractmethod
+    def get_source_hash(self, code_dir: str, rev: str, source_filter: SourceFilter) -> str:
+        """Return a content hash of the files at the given rev that pass source_filter,
+        read from the VCS metadata without touching the working copy. Two revs with the
+        same hash have identical analyzable source."""
+
     def get_safe_address(self, repo_address: str, token: str):
         """ Remove the token from the repo address for safe logging """
         if token and token in repo_address: